@@ -64,6 +64,7 @@ import visidata.movement
 import visidata._urlcache
 import visidata.selection
 import visidata.loaders.tsv
+import visidata._sheetcache
 import visidata.pyobj
 import visidata.loaders.json
 import visidata._open
@@ -0,0 +1,210 @@
+import os
+import json
+import mmap
+import array
+import struct
+import hashlib
+import tempfile
+
+from visidata import vd, Path, Progress, SequenceSheet, ColumnItem, StoreColumn, LazyRows, OverlayStore
+from visidata.settings import _get_cache_dir
+
+vd.option('load_cache', False, 'save a snapshot of the parsed rows of local files in the cache directory, and load it instead of reparsing an unchanged file with the same options')
+vd.option('load_cache_max_mb', 4096, 'max total size in MB of saved snapshots; the least recently used are removed first')
+
+snapshot_magic = b'VDSNAP01'
+_footer = struct.Struct('<Q8s')
+
+
+def snapshotDir():
+    return _get_cache_dir()/'sheets'
+
+
+def _pad8(n):
+    return -n % 8
+
+
+class SnapshotStore(OverlayStore):
+    '''Row store for a sheet loaded from a memory-mapped snapshot file.  Rows are int handles, with handle *h* the *h*th row of the snapshot.
+       Values are decoded from the mapping only when needed.  Changed and added rows are kept in memory.
+
+       Snapshot layout: magic, then for each column an array of n+1 int64 byte offsets, n null flags, and the utf-8 encoded values;
+       then a json footer with the number of rows, column names and section offsets; then the footer length and magic again.'''
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        footerlen, magic = _footer.unpack_from(self.mm, len(self.mm)-_footer.size)
+        if self.mm[:8] != snapshot_magic or magic != snapshot_magic:
+            raise ValueError('not a snapshot')
+        footerstart = len(self.mm)-_footer.size-footerlen
+        footer = json.loads(self.mm[footerstart:footerstart+footerlen])
+
+        super().__init__(len(footer['columns']))
+        self.names = footer['columns']
+        self.nrows = footer['nrows']
+        buf = memoryview(self.mm)
+        self.sections = []  # [colidx] -> (offsets, nulls, blobstart)
+        for offstart, nullstart, blobstart in footer['sections']:
+            offsets = buf[offstart:offstart+8*(self.nrows+1)].cast('q')
+            nulls = buf[nullstart:nullstart+self.nrows]
+            self.sections.append((offsets, nulls, blobstart))
+
+    def baseget(self, row, colidx):
+        if not 0 < row <= self.nrows or colidx >= len(self.sections):
+            return None
+        offsets, nulls, blobstart = self.sections[colidx]
+        i = row-1
+        if nulls[i]:
+            return None
+        return str(self.mm[blobstart+offsets[i]:blobstart+offsets[i+1]], 'utf-8', 'surrogatepass')
+
+    def baserow(self, row):
+        return [self.baseget(row, i) for i in range(len(self.sections))]
+
+
+def writeSnapshot(path, names, ncols, rowvalues, bufsize=2**22):
+    '''Write snapshot of *rowvalues* (iterable of value sequences) to *path*, with *names* for the first *ncols* columns.
+       Encoded values are spilled to a temporary file whenever more than *bufsize* bytes are buffered, so only their offsets and null flags are kept in memory.
+       Return False without writing, if any value is not str or None.'''
+    cols = [(array.array('q', [0]), bytearray(), bytearray()) for i in range(ncols)]  # offsets, nulls, encoded values not yet spilled
+    spilled = [[] for i in range(ncols)]  # [colidx] -> list of (start, length) of encoded values in spillfp, in order
+    nbuffered = 0
+    nrows = 0
+    with tempfile.TemporaryFile(dir=os.path.dirname(str(path))) as spillfp:
+        for vals in rowvalues:
+            nrows += 1
+            for i, (offsets, nulls, buf) in enumerate(cols):
+                v = vals[i] if i < len(vals) else None
+                if v is None:
+                    nulls.append(1)
+                    b = b''
+                elif isinstance(v, str):
+                    nulls.append(0)
+                    b = v.encode('utf-8', 'surrogatepass')
+                else:
+                    return False
+                buf += b
+                offsets.append(offsets[-1]+len(b))
+                nbuffered += len(b)
+
+            if nbuffered > bufsize:
+                for (offsets, nulls, buf), blocks in zip(cols, spilled):
+                    if buf:
+                        blocks.append((spillfp.tell(), len(buf)))
+                        spillfp.write(buf)
+                        buf.clear()
+                nbuffered = 0
+
+        tmppath = str(path) + '.%s.tmp' % os.getpid()
+        try:
+            with open(tmppath, 'wb') as fp:
+                fp.write(snapshot_magic)
+                sections = []
+                for (offsets, nulls, buf), blocks in zip(cols, spilled):
+                    offstart = fp.tell()
+                    fp.write(offsets.tobytes())
+                    nullstart = fp.tell()
+                    fp.write(nulls)
+                    fp.write(b'\0'*_pad8(len(nulls)))
+                    blobstart = fp.tell()
+                    for start, length in blocks:
+                        spillfp.seek(start)
+                        fp.write(spillfp.read(length))
+                    fp.write(buf)
+                    fp.write(b'\0'*_pad8(offsets[-1]))
+                    sections.append([offstart, nullstart, blobstart])
+
+                footer = json.dumps(dict(nrows=nrows, columns=names+['']*(ncols-len(names)), sections=sections)).encode('utf-8')
+                fp.write(footer)
+                fp.write(_footer.pack(len(footer), snapshot_magic))
+            os.replace(tmppath, path)
+        except BaseException:
+            try:
+                os.unlink(tmppath)
+            except OSError:
+                pass
+            raise
+
+    return True
+
+
+def pruneSnapshots(maxbytes):
+    'Remove least recently used snapshots until their total size is at most *maxbytes*.'
+    entries = []
+    with os.scandir(snapshotDir()) as it:
+        for e in it:
+            if e.name.endswith('.snapshot'):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= maxbytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+@SequenceSheet.api
+def snapshotPath(sheet):
+    'Return Path of the snapshot for the source of *sheet* with its current options, or None if the source is not a local file.'
+    p = sheet.source
+    if not isinstance(p, Path) or p.is_url() or p.given == '-' or p.has_fp():
+        return None
+    try:
+        st = os.stat(p)
+    except OSError:
+        return None
+
+    opts = {k: str(sheet.options[k]) for k in sorted(sheet.options.keys())
+                if k != 'load_cache' and vd.options._get(k, 'default').replayable}
+    key = [snapshot_magic.decode(), os.path.abspath(p), st.st_size, st.st_mtime_ns, type(sheet).__name__, opts]
+    return snapshotDir()/(hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest() + '.snapshot')
+
+
+@SequenceSheet.api
+def loadSnapshot(sheet):
+    'Load rows and columns from the snapshot of the source, if there is one for its current size, mtime and options.  Return True if loaded.'
+    path = sheet.snapshotPath()
+    if not path or not path.exists():
+        return False
+
+    try:
+        store = SnapshotStore(path)
+    except Exception as e:
+        vd.warning('ignoring invalid snapshot %s: %s' % (path, e))
+        return False
+
+    os.utime(path)  # mark as recently used
+    sheet.columnStore = store
+    sheet.setCols([store.names])
+    sheet.rows = LazyRows()
+    sheet.rows.grow(store.nrows)
+    vd.status('loaded %s from snapshot' % sheet.name)
+    return True
+
+
+@SequenceSheet.api
+def saveSnapshot(sheet):
+    'Save a snapshot of the rows just loaded, if all values are text.'
+    path = sheet.snapshotPath()
+    if not path:
+        return
+    if not all(type(c) in (ColumnItem, StoreColumn) and c.expr == i for i, c in enumerate(sheet.columns)):
+        return
+
+    store = sheet.columnStore
+    ncols = store.ncols if store is not None else len(sheet.columns)
+    rowvalues = (store.rowvalues(r) for r in sheet.rows) if store is not None else iter(sheet.rows)
+
+    os.makedirs(snapshotDir(), exist_ok=True)
+    try:
+        if writeSnapshot(path, [c.name for c in sheet.columns], ncols, Progress(rowvalues, gerund='caching', total=len(sheet.rows))):
+            pruneSnapshots(sheet.options.load_cache_max_mb*2**20)
+    except OSError as e:
+        vd.warning('could not save snapshot: %s' % e)
+
+
+vd.addGlobals({
+    'SnapshotStore': SnapshotStore,
+})
@@ -1,6 +1,8 @@
 import math
 import functools
 import collections
+import threading
+import weakref
 from statistics import mode, stdev
 
 from visidata import Progress, Column
@@ -29,6 +31,125 @@ def getValues(self, rows):
 
 vd.aggregators = collections.OrderedDict()  # [aggname] -> annotated func, or list of same
 
+vd.option('aggr_cache_sets', 256, 'max number of (column, rows) value sets to keep for computing aggregators')
+
+
+def numericArray(values):
+    'Return numpy array of *values* if numpy is available and they are all int or all float, else None.'
+    if not values:
+        return None
+    types = set(map(type, values))
+    if types != {int} and types != {float}:
+        return None
+    try:
+        import numpy as np
+        return np.array(values, dtype=np.int64 if types == {int} else np.float64)
+    except (ImportError, OverflowError):
+        return None
+
+
+class AggregateValues:
+    'Typed non-null values of *col* over *rows*, extracted once for all aggregators, and the aggregates computed from them.'
+    def __init__(self, col, rows, version):
+        self.col = col
+        self.rows = rows
+        self.nrows = len(rows)
+        self.version = version
+        self.type = col.type
+        self.expr = col.expr
+        self.results = {}  # Aggregator -> result
+        self._values = None
+        self._array = None
+        self._sorted = None
+
+    def isCurrent(self, col, rows, version):
+        return rows is self.rows and len(rows) == self.nrows and version == self.version and col.type is self.type and col.expr == self.expr
+
+    @property
+    def values(self):
+        'List of values.'
+        if self._values is None:
+            self._values = list(self.col.getValues(self.rows))
+            self._array = numericArray(self._values)
+        return self._values
+
+    @property
+    def array(self):
+        'numpy array of values if they are all int or all float, else None.'
+        self.values
+        return self._array
+
+    @property
+    def sorted(self):
+        'List of values in ascending order.'
+        if self._sorted is None:
+            arr = self.array
+            self._sorted = sorted(self.values) if arr is None else arr[arr.argsort(kind='stable')].tolist()
+        return self._sorted
+
+
+class AggregatorEngine:
+    '''Compute aggregators over the values of a column for a set of rows, getting the values only once for all aggregators.
+       Values and results are kept for the most recent ``options.aggr_cache_sets`` sets of rows, until the rows or a cell on the sheet change, the column type or expression changes, or ``vd.clearCaches()`` after each command and draw.'''
+    def __init__(self):
+        self.valueSets = collections.OrderedDict()  # (id(col), id(rows)) -> AggregateValues, least recently used first
+        self.versions = weakref.WeakKeyDictionary()  # sheet -> number of changes to its rows and cells
+        self.lock = threading.Lock()
+
+    def valueSet(self, col, rows):
+        'Return AggregateValues for *col* over *rows*.'
+        sheet = col.sheet
+        with self.lock:
+            if sheet not in self.versions:
+                self.versions[sheet] = 0
+                sheet.rowListeners.add(self)
+            version = self.versions[sheet]
+            k = (id(col), id(rows))
+            vs = self.valueSets.pop(k, None)
+            if vs is None or not vs.isCurrent(col, rows, version):
+                vs = AggregateValues(col, rows, version)
+            self.valueSets[k] = vs
+            while len(self.valueSets) > options.aggr_cache_sets:
+                self.valueSets.popitem(last=False)
+        return vs
+
+    def aggregate(self, agg, col, rows):
+        'Return result of Aggregator *agg* over *rows* in *col*.'
+        if not hasattr(rows, '__len__'):
+            rows = list(rows)
+        vs = self.valueSet(col, rows)
+        try:
+            return vs.results[agg]
+        except KeyError:
+            r = vs.results[agg] = agg.func(col, rows)
+            return r
+
+    def clear(self):
+        'Drop all values and results.'
+        with self.lock:
+            self.valueSets.clear()
+
+    def changed(self, sheet):
+        with self.lock:
+            self.versions[sheet] = self.versions.get(sheet, 0) + 1
+
+    def sourceRowsAdded(self, sheet, rows):
+        self.changed(sheet)
+
+    def sourceRowsRemoved(self, sheet, rows):
+        self.changed(sheet)
+
+    def sourceCellChanged(self, sheet, col, row, oldval):
+        self.changed(sheet)
+
+
+@VisiData.lazy_property
+def aggregatorEngine(vd):
+    engine = AggregatorEngine()
+    Extensible._cache_clearers.append(engine.clear)
+    return engine
+
+
 Column.init('aggstr', str, copy=True)
 
 def aggregators_get(col):
@@ -60,8 +181,8 @@ class Aggregator:
         self.helpstr = helpstr
         self.name = name
 
-    def __call__(self, *args, **kwargs):
-        return self.func(*args, **kwargs)
+    def __call__(self, col, rows):
+        return vd.aggregatorEngine.aggregate(self, col, rows)
 
 _defaggr = Aggregator
 
@@ -69,8 +190,13 @@ _defaggr = Aggregator
 def aggregator(vd, name, func, helpstr='', *args, type=None):
     'Define simple aggregator *name* that calls ``func(values, *args)`` to aggregate *values*.  Use *type* to force the default type of the aggregated column.'
     def _func(col, rows):  # wrap builtins so they can have a .type
-        vals = list(col.getValues(rows))
+        vs = vd.aggregatorEngine.valueSet(col, rows)
+        vals = vs.values
         try:
+            if func in _numpyAggregators and vs.array is not None and len(vals) > 1 and not args:
+                return _numpyAggregators[func](vs.array)
+            if func in _sortedAggregators:
+                vals = vs.sorted
             return func(vals, *args)
         except Exception as e:
             if len(vals) == 0:
@@ -115,7 +241,24 @@ def _percentile(N, percent, key=lambda x:x):
 
 @functools.lru_cache(100)
 def percentile(pct, helpstr=''):
-    return _defaggr('p%s'%pct, None, lambda col,rows,pct=pct: _percentile(sorted(col.getValues(rows)), pct/100), helpstr)
+    return _defaggr('p%s'%pct, None, lambda col,rows,pct=pct: _percentile(vd.aggregatorEngine.valueSet(col, rows).sorted, pct/100), helpstr)
+
+def _npsum(a):
+    if a.dtype.kind == 'i' and max(-int(a.min()), int(a.max()))*len(a) >= 2**63:  # could overflow int64
+        return sum(a.tolist())
+    return a.sum().item()
+
+# vectorized versions of aggregator functions, given a numpy array of more than one value
+_numpyAggregators = {
+    min: lambda a: a.min().item(),
+    max: lambda a: a.max().item(),
+    sum: _npsum,
+    mean: lambda a: float(a.mean()),
+    stdev: lambda a: float(a.std(ddof=1)),
+}
+
+# aggregator functions that are cheaper given sorted values
+_sortedAggregators = {median}
 
 def quantiles(q, helpstr):
     return [percentile(round(100*i/q), helpstr) for i in range(1, q)]
@@ -95,7 +95,10 @@ class BaseSheet(DrawablePane):
     defer = False        # False for not deferring changes until save
 
     def _obj_options(self):
-        return vd.OptionsObject(vd._options, obj=self)
+        opts = self.__dict__.get('_optionsObject')
+        if opts is None or opts._obj is not self:  # not made for a sheet this was copied from
+            opts = self.__dict__['_optionsObject'] = vd.OptionsObject(vd._options, obj=self)
+        return opts
 
     def _class_options(cls):
         return vd.OptionsObject(vd._options, obj=cls)
@@ -179,7 +182,9 @@ class BaseSheet(DrawablePane):
             for hookfunc in vd.beforeExecHooks:
                 hookfunc(self, cmd, '', keystrokes)
             vd.debug(cmd.longname)
+            nlookups = vd._options.nlookups
             escaped = super().execCommand2(cmd, vdglobals=vdglobals)
+            vd.debug('%s: %d option lookups' % (cmd.longname, vd._options.nlookups-nlookups))
         except Exception as e:
             vd.debug(cmd.execstr)
             err = vd.exceptionCaught(e)
@@ -6,11 +6,13 @@ import threading
 import re
 import time
 import json
+import sys
+import weakref
 
-from visidata import options, anytype, stacktrace, vd
+from visidata import VisiData, options, anytype, stacktrace, vd
 from visidata import asyncthread, dispwidth, clipstr, iterchars
 from visidata import wrapply, TypedWrapper, TypedExceptionWrapper
-from visidata import Extensible, AttrDict, undoAttrFunc
+from visidata import Extensible, AttrDict, undoAttrFunc, drawcache
 
 class InProgress(Exception):
     @property
@@ -20,11 +22,16 @@ class InProgress(Exception):
 INPROGRESS = TypedExceptionWrapper(None, exception=InProgress())  # sentinel
 
 vd.option('col_cache_size', 0, 'max number of cache entries in each cached column')
+vd.option('col_cache_max_mb', 1024, 'max approximate memory in MB for cached values across all columns (0 for no limit)')
+vd.option('prefetch_workers', 0, 'max number of threads computing cells of slow columns ahead of drawing (0 to compute them while drawing)')
+vd.option('prefetch_pages', 1, 'number of pages above and below the screen to compute ahead for slow columns')
+vd.option('prefetch_min_ms', 2.0, 'compute cells ahead of drawing for columns taking longer than this many milliseconds per cell')
 vd.option('clean_names', False, 'clean column/sheet names to be valid Python identifiers', replay=True)
 
 __all__ = [
     'clean_to_id',
     'Column',
+    'ColumnCache',
     'setitem',
     'getattrdeep',
     'setattrdeep',
@@ -55,6 +62,294 @@ class DisplayWrapper:
         return self.value == other
 
 
+class ColumnCache(dict):
+    '''Cached values for one column, keyed by rowid.
+       Memory and recency of entries are tracked by ``vd.cacheManager``, which evicts across all column caches.'''
+    _ids = itertools.count()
+
+    def __init__(self, col=None):
+        super().__init__()
+        self.cacheid = next(self._ids)
+        self.col = weakref.ref(col) if col is not None else lambda: None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        vd.cacheManager.register(self)
+
+    @property
+    def nbytes(self):
+        return vd.cacheManager.cacheBytes.get(self.cacheid, 0)
+
+    def __getitem__(self, k):
+        v = dict.__getitem__(self, k)
+        vd.cacheManager.touch(self, k)
+        return v
+
+    def __setitem__(self, k, v):
+        vd.cacheManager.put(self, k, v)
+
+    def __delitem__(self, k):
+        dict.__delitem__(self, k)
+        vd.cacheManager.forget(self, k)
+
+    def pop(self, k, *default):
+        if k in self:
+            vd.cacheManager.forget(self, k)
+        return dict.pop(self, k, *default)
+
+    def popitem(self, last=True):
+        'Remove and return the newest (or oldest if *last* is False) entry.'
+        if not self:
+            raise KeyError('cache is empty')
+        k = next(reversed(self)) if last else next(iter(self))
+        return k, self.pop(k)
+
+    def clear(self):
+        vd.cacheManager.forgetAll(self)
+        dict.clear(self)
+
+
+class ColumnCacheManager:
+    '''Memory accounting for all ColumnCaches in the process.
+       Entries are evicted least-recently-used first, across all columns and sheets, when their total exceeds ``options.col_cache_max_mb``, which is read again after each command and draw.'''
+    entry_overhead = 100  # approximate bytes for the dict slots and bookkeeping of each entry
+
+    def __init__(self):
+        self.lru = collections.OrderedDict()  # (cacheid, rowid) -> nbytes
+        self.caches = weakref.WeakValueDictionary()  # cacheid -> ColumnCache
+        self.cacheBytes = {}  # cacheid -> total nbytes of entries in that cache
+        self.cacheEntries = {}  # cacheid -> number of entries in lru for that cache
+        self.nstale = 0  # number of lru entries of released caches
+        self.nbytes = 0
+        self.evictions = 0
+        self.warned = False
+        self.maxbytes = None  # options.col_cache_max_mb in bytes, or None to read it on the next put
+        self.lock = threading.RLock()  # released caches may be finalized during a put on the same thread
+        Extensible._cache_clearers.append(self.resetLimit)
+
+    def resetLimit(self):
+        self.maxbytes = None
+
+    def register(self, cache):
+        with self.lock:
+            self.caches[cache.cacheid] = cache
+            self.cacheBytes[cache.cacheid] = 0
+            self.cacheEntries[cache.cacheid] = 0
+        weakref.finalize(cache, self.release, cache.cacheid)
+
+    def release(self, cacheid):
+        'Drop accounting for a cache that no longer exists, and its lru entries once they are half of all entries.'
+        with self.lock:
+            self.nbytes -= self.cacheBytes.pop(cacheid, 0)
+            self.nstale += self.cacheEntries.pop(cacheid, 0)
+            if self.nstale > len(self.lru)//2:
+                self.lru = collections.OrderedDict((key, n) for key, n in self.lru.items() if key[0] in self.cacheBytes)
+                self.nstale = 0
+
+    def touch(self, cache, k):
+        with self.lock:
+            try:
+                self.lru.move_to_end((cache.cacheid, k))
+            except KeyError:
+                pass
+
+    def put(self, cache, k, v):
+        key = (cache.cacheid, k)
+        n = sys.getsizeof(k) + sys.getsizeof(v) + self.entry_overhead
+        with self.lock:
+            oldn = self.lru.pop(key, None)
+            if oldn is None:
+                self.cacheEntries[cache.cacheid] += 1
+                oldn = 0
+            self.lru[key] = n
+            self.cacheBytes[cache.cacheid] += n-oldn
+            self.nbytes += n-oldn
+            dict.__setitem__(cache, k, v)
+
+            if self.maxbytes is None:
+                self.maxbytes = options.col_cache_max_mb*2**20
+            if self.maxbytes and self.nbytes > self.maxbytes:
+                self.evict(self.maxbytes)
+
+    def forget(self, cache, k):
+        with self.lock:
+            n = self.lru.pop((cache.cacheid, k), None)
+            if n is not None and cache.cacheid in self.cacheBytes:
+                self.cacheBytes[cache.cacheid] -= n
+                self.cacheEntries[cache.cacheid] -= 1
+                self.nbytes -= n
+
+    def forgetAll(self, cache):
+        with self.lock:
+            for k in list(dict.keys(cache)):
+                self.lru.pop((cache.cacheid, k), None)
+            self.nbytes -= self.cacheBytes.get(cache.cacheid, 0)
+            if cache.cacheid in self.cacheBytes:
+                self.cacheBytes[cache.cacheid] = 0
+                self.cacheEntries[cache.cacheid] = 0
+
+    def evict(self, maxbytes):
+        'Remove least-recently-used entries from any cache until total is under *maxbytes*.'
+        if not self.warned:
+            vd.status('column caches reached %sMB; evicting least recently used values' % (maxbytes//2**20))
+            self.warned = True
+
+        with self.lock:
+            while self.nbytes > maxbytes and self.lru:
+                (cacheid, k), n = self.lru.popitem(last=False)
+                cache = self.caches.get(cacheid)
+                if cache is None or cacheid not in self.cacheBytes:
+                    self.nstale = max(self.nstale-1, 0)
+                    continue
+                dict.pop(cache, k, None)
+                self.cacheBytes[cacheid] -= n
+                self.cacheEntries[cacheid] -= 1
+                self.nbytes -= n
+                cache.evictions += 1
+                self.evictions += 1
+
+
+@VisiData.lazy_property
+def cacheManager(vd):
+    return ColumnCacheManager()
+
+
+class CellPrefetcher:
+    '''Compute cells of slow columns on worker threads ahead of drawing, into a cache of its own.
+       A column is slow once its cells take more than ``options.prefetch_min_ms`` on average to compute while drawing.
+       Its uncomputed cells are then drawn as pending, and the rows on screen are computed first, then the pages below and above.
+       Computed cells are dropped when their column is recalculated, when a cell in their row changes, and before every command other than movement.'''
+    def __init__(self):
+        self.queue = collections.deque()  # (col, row, key) to compute, first needed first
+        self.queued = set()  # keys (id(col), rowid) queued or being computed
+        self.cells = weakref.WeakKeyDictionary()  # col -> {rowid: DisplayWrapper}
+        self.generation = 0  # incremented by clear(), so cells computed before then are not kept
+        self.lock = threading.Lock()
+        self.nworkers = 0
+        self.sheets = weakref.WeakSet()  # sheets this is listening to
+
+    def isSlow(self, col):
+        return col.cache != 'async' and col._cellTime*1000 > col.sheet.options.prefetch_min_ms
+
+    def clear(self, col=None):
+        'Drop the computed cells of *col*, or of all columns.'
+        with self.lock:
+            if col is None:
+                self.cells.clear()
+            else:
+                self.cells.pop(col, None)
+            self.generation += 1
+
+    def getCell(self, col, row):
+        'Return DisplayWrapper for *row* in *col*, or a pending placeholder if *col* is slow and the cell has not been computed yet.  Only used while drawing with ``options.prefetch_workers``.'
+        if self.isSlow(col):
+            dw = self.cells.get(col, {}).get(col.sheet.rowid(row))
+            if dw is None:
+                return DisplayWrapper(None,
+                                display=options.disp_pending,
+                                note=options.note_pending,
+                                notecolor='color_note_pending')
+            return dw
+
+        t = time.perf_counter()
+        dw = col.getCell(row)
+        dt = time.perf_counter() - t
+        col._cellTime = dt if not col._cellTime else col._cellTime*0.8 + dt*0.2
+        return dw
+
+    def prefetch(self, sheet):
+        'Queue the uncomputed cells of slow columns on screen for the rows on screen, then for ``options.prefetch_pages`` pages below and above; replaces cells queued for *sheet* before, and drops computed cells outside those pages.'
+        nworkers = sheet.options.prefetch_workers
+        if not nworkers:
+            return
+        vcols = sheet.visibleCols
+        cols = [vcols[i] for i in sorted(sheet._visibleColLayout) if i < len(vcols)]
+        cols = [c for c in cols if self.isSlow(c)]
+        if not cols:
+            return
+
+        if sheet not in self.sheets:
+            sheet.rowListeners.add(self)
+            self.sheets.add(sheet)
+
+        top, n, nrows = sheet.topRowIndex, sheet.nScreenRows, sheet.nRows
+        npages = sheet.options.prefetch_pages
+        rowidxs = itertools.chain(range(top, min(top+n*(npages+1), nrows)),
+                                  range(top-1, max(top-n*npages, 0)-1, -1))
+        rows = [sheet.rows[i] for i in rowidxs]
+        rowids = [sheet.rowid(row) for row in rows]
+
+        wanted = []
+        with self.lock:
+            for col in cols:
+                cells = self.cells.get(col)
+                if cells:
+                    self.cells[col] = {k: cells[k] for k in rowids if k in cells}
+            for row, rowid in zip(rows, rowids):
+                for col in cols:
+                    if rowid not in self.cells.get(col, ()):
+                        wanted.append((col, row, (id(col), rowid)))
+
+            others = [t for t in self.queue if t[0].sheet is not sheet]
+            for col, row, key in self.queue:
+                self.queued.discard(key)
+            self.queue = collections.deque(t for t in wanted if t[2] not in self.queued)
+            self.queue.extend(others)
+            self.queued.update(t[2] for t in self.queue)
+            nstart = min(nworkers, len(self.queue)) - self.nworkers
+            self.nworkers += max(nstart, 0)
+
+        for i in range(nstart):
+            self.computeCells(sheet=sheet)
+
+    @asyncthread
+    def computeCells(self):
+        try:
+            while True:
+                with self.lock:
+                    if not self.queue:
+                        break
+                    col, row, key = self.queue.popleft()
+                    generation = self.generation
+                try:
+                    dw = col.getCell(row)
+                    with self.lock:
+                        if generation == self.generation:
+                            self.cells.setdefault(col, {})[key[1]] = dw
+                finally:
+                    with self.lock:
+                        self.queued.discard(key)
+        finally:
+            with self.lock:
+                self.nworkers -= 1
+
+    def sourceRowsAdded(self, sheet, rows):
+        pass
+
+    def sourceRowsRemoved(self, sheet, rows):
+        pass
+
+    def sourceCellChanged(self, sheet, col, row, oldval):
+        'Drop the computed cells of *row*, since they may depend on the changed cell.'
+        rowid = sheet.rowid(row)
+        with self.lock:
+            for c in sheet.columns:
+                self.cells.get(c, {}).pop(rowid, None)
+
+
+@VisiData.lazy_property
+def cellPrefetcher(vd):
+    return CellPrefetcher()
+
+
+def _clearPrefetched(sheet, cmd, args, keystrokes):
+    'Drop the cells computed ahead before any command that may change them; movement only shows other cells.'
+    if vd.isLoggableCommand(cmd.longname):
+        vd.cellPrefetcher.clear()
+
+vd.beforeExecHooks.append(_clearPrefetched)
+
+
 def clean_to_id(s):  # [Nas Banov] https://stackoverflow.com/a/3305731
     return re.sub(r'\W|^(?=\d)', '_', str(s)).strip('_')
 
@@ -103,6 +398,8 @@ class Column(Extensible):
         self.keycol = 0       # keycol index (or 0 if not key column)
         self.expr = None      # Column-type-dependent parameter
         self.formatter = ''
+        self._searchIndex = None  # SearchIndex of display values, built by regex search on large sheets
+        self._cellTime = 0  # average seconds to compute a cell while drawing, for vd.cellPrefetcher
 
         self.setCache(cache)
         for k, v in kwargs.items():
@@ -114,7 +411,7 @@ class Column(Extensible):
         ret.__dict__.update(self.__dict__)
         ret.keycol = 0   # column copies lose their key status
         if self._cachedValues is not None:
-            ret._cachedValues = collections.OrderedDict()  # an unrelated cache for copied columns
+            ret._cachedValues = ColumnCache(ret)  # an unrelated cache for copied columns
         return ret
 
     def __deepcopy__(self, memo):
@@ -133,6 +430,9 @@ class Column(Extensible):
         'Reset column cache, attach column to *sheet*, and reify column name.'
         if self._cachedValues:
             self._cachedValues.clear()
+        self._searchIndex = None
+        self._cellTime = 0
+        vd.cellPrefetcher.clear(self)
         if sheet:
             self.sheet = sheet
         self.name = self._name
@@ -277,9 +577,11 @@ class Column(Extensible):
 
            - ``False`` (default): getValue never caches; calcValue is always called.
            - ``True``: getValue maintains a cache of ``options.col_cache_size``.
-           - ``"async"``: ``getValue`` launches thread for every uncached result, maintains cache of infinite size.  Returns invalid value until cache entry available.'''
+           - ``"async"``: ``getValue`` launches thread for every uncached result, maintains cache of unlimited entries.  Returns invalid value until cache entry available.
+
+           All caches share the memory limit of ``options.col_cache_max_mb``.'''
         self.cache = cache
-        self._cachedValues = collections.OrderedDict() if self.cache else None
+        self._cachedValues = ColumnCache(self) if self.cache else None
 
     @asyncthread
     def _calcIntoCacheAsync(self, row):
@@ -307,9 +609,15 @@ class Column(Extensible):
             return self.calcValue(row)
 
         k = self.sheet.rowid(row)
-        if k in self._cachedValues:
-            return self._cachedValues[k]
+        try:
+            ret = self._cachedValues[k]  # not `k in` first, as another thread may evict it in between
+        except KeyError:
+            pass
+        else:
+            self._cachedValues.hits += 1
+            return ret
 
+        self._cachedValues.misses += 1
         if self.cache == 'async':
             ret = self._calcIntoCacheAsync(row)
         else:
@@ -321,6 +629,10 @@ class Column(Extensible):
 
         return ret
 
+    def getTypedValues(self, rows):
+        'Return list of properly-typed values for *rows*, as ``getTypedValue`` for each row.  Overrideable to compute a batch of rows at once.'
+        return [self.getTypedValue(r) for r in rows]
+
     def getCell(self, row):
         'Return DisplayWrapper for displayable cell value.'
         cellval = wrapply(self.getValue, row)
@@ -392,11 +704,19 @@ class Column(Extensible):
 
     def setValue(self, row, val):
         'Change value for *row* in this column to *val*.  Call ``putValue`` immediately if parent ``sheet.defer`` is False, otherwise cache until later ``putChanges``.  Caller must add undo function.'
+        listening = bool(self.sheet.rowListeners)
+        if listening:
+            oldval = wrapply(self.getValue, row)
         if self.sheet.defer:
             self.cellChanged(row, val)
         else:
             self.putValue(row, val)
         self.sheet.setModified()
+        if listening:
+            if self.sheet._cellChanges is not None:
+                self.sheet._cellChanges.append((self, row, oldval))
+            else:
+                self.sheet.notifyRowListeners('sourceCellChanged', self, row, oldval)
 
     def setValueSafe(self, row, value):
         'setValue and ignore exceptions.'
@@ -409,16 +729,18 @@ class Column(Extensible):
     def setValues(self, rows, *values):
         'Set values in this column for *rows* to *values*, recycling values as needed to fill *rows*.'
         vd.addUndoSetValues([self], rows)
-        for r, v in zip(rows, itertools.cycle(values)):
-            self.setValueSafe(r, v)
+        with self.sheet.batchCellChanges():
+            for r, v in zip(rows, itertools.cycle(values)):
+                self.setValueSafe(r, v)
         self.recalc()
         return vd.status('set %d cells to %d values' % (len(rows), len(values)))
 
     def setValuesTyped(self, rows, *values):
         'Set values on this column for *rows* to *values*, coerced to column type, recycling values as needed to fill *rows*.  Abort on type exception.'
         vd.addUndoSetValues([self], rows)
-        for r, v in zip(rows, itertools.cycle(self.type(val) for val in values)):
-            self.setValueSafe(r, v)
+        with self.sheet.batchCellChanges():
+            for r, v in zip(rows, itertools.cycle(self.type(val) for val in values)):
+                self.setValueSafe(r, v)
 
         self.recalc()
 
@@ -561,13 +883,41 @@ class ExprColumn(Column):
 
     def calcValue(self, row):
         t0 = time.perf_counter()
-        r = self.sheet.evalExpr(self.compiledExpr, row, col=self)
+        r = self._evaluator(self.expr, threading.get_ident())(row)
         t1 = time.perf_counter()
         self.ncalcs += 1
         self.maxtime = max(self.maxtime, t1-t0)
         self.totaltime += (t1-t0)
         return r
 
+    @drawcache
+    def _evaluator(self, expr, threadid):
+        'Return function(row) to evaluate *expr*, compiled once per command in each thread, and again if *expr* is changed.'
+        return self.sheet.compileExpr(expr, col=self)
+
+    def calcValues(self, rows):
+        'Return list of calculated values for *rows*, with expr compiled and its names resolved once for the batch.  Errors are returned as TypedExceptionWrapper.'
+        t0 = time.perf_counter()
+        evaluate = self.sheet.compileExpr(self.expr, col=self)
+        ret = []
+        for row in rows:
+            try:
+                ret.append(evaluate(row))
+            except Exception as e:
+                e.stacktrace = stacktrace()
+                ret.append(TypedExceptionWrapper(self.getValue, row, exception=e))
+        t1 = time.perf_counter()
+        if rows:
+            self.ncalcs += len(rows)
+            self.maxtime = max(self.maxtime, (t1-t0)/len(rows))
+            self.totaltime += (t1-t0)
+        return ret
+
+    def getTypedValues(self, rows):
+        if self._cachedValues is not None or self.sheet.defer:
+            return super().getTypedValues(rows)
+        return [wrapply(self.type, v) for v in self.calcValues(rows)]
+
     def putValue(self, row, val):
         a = self.getDisplayValue(row)
         b = self.format(self.type(val))
@@ -580,9 +930,15 @@ class ExprColumn(Column):
 
     @expr.setter
     def expr(self, expr):
-        self.compiledExpr = compile(expr, '<expr>', 'eval') if expr else None
+        if expr:
+            compile(expr, '<expr>', 'eval')  # raise SyntaxError before any row is computed
         self._expr = expr
 
+    @property
+    def compiledExpr(self):
+        'Code object for expr, as for ``sheet.evalExpr``.  Rows are computed with ``sheet.compileExpr`` instead.'
+        return compile(self.expr, '<expr>', 'eval') if self.expr else None
+
 
 class SettableColumn(Column):
     'Column using rowid to store and retrieve values internally.'
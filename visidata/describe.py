@@ -1,13 +1,157 @@
 from copy import copy
+import collections
+import math
+import random
 from statistics import mode, median, mean, stdev
 
-from visidata import vd, Column, ColumnAttr, vlen, RowColorizer, asyncthread, Progress, wrapply
+from visidata import vd, Column, ColumnAttr, vlen, RowColorizer, asyncthread, Progress, wrapply, TypedExceptionWrapper
 from visidata import BaseSheet, TableSheet, ColumnsSheet
 
 __all__ = ['DescribeSheet']
 
 
 vd.option('describe_aggrs', 'mean stdev', 'numeric aggregators to calculate on Describe sheet')
+vd.option('describe_exact_rows', 1000000, 'describe sheets with more rows than this using approximate distinct counts, modes, medians and aggregators (0 to always be exact)')
+
+
+class HyperLogLog:
+    'Approximate count of distinct values added, within about 1.04/sqrt(2**p).'
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, v):
+        x = hash(v) & 0xffffffffffffffff  # splitmix64 finalizer, to spread the bits of int hashes
+        x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+        x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & 0xffffffffffffffff
+        x ^= x >> 31
+        i = x >> (64-self.p)
+        rest = x & ((1 << (64-self.p)) - 1)
+        rank = 64-self.p - rest.bit_length() + 1
+        if rank > self.registers[i]:
+            self.registers[i] = rank
+
+    def __len__(self):
+        m = len(self.registers)
+        est = 0.7213/(1+1.079/m) * m*m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if est <= 2.5*m and zeros:
+            est = m*math.log(m/zeros)  # linear counting for small cardinalities
+        return int(round(est))
+
+
+class ValueCounts(dict):
+    '''Count of each value added, if *k* is None.  Otherwise only *k* counters are kept (Misra-Gries summary):
+       any value occurring more than n/k times out of n is kept, with a lower bound of its count.'''
+    def __init__(self, k=None):
+        super().__init__()
+        self.k = k
+
+    def add(self, v):
+        if v in self:
+            self[v] += 1
+        elif self.k is None or len(self) < self.k:
+            self[v] = 1
+        else:
+            for key in list(self.keys()):
+                self[key] -= 1
+                if not self[key]:
+                    del self[key]
+
+    def mode(self):
+        'Return the most common value, the first added of equally common values.'
+        if not self:
+            return mode([])  # raises the same error as for no values
+        return max(self, key=self.get)
+
+
+class ValueSample(list):
+    'All values added, or a uniform random sample of *k* of them (reservoir sampling).'
+    def __init__(self, k=None):
+        super().__init__()
+        self.k = k
+        self.n = 0
+
+    def add(self, v):
+        self.n += 1
+        if self.k is None or len(self) < self.k:
+            self.append(v)
+        else:
+            i = random.randrange(self.n)
+            if i < self.k:
+                self[i] = v
+
+
+class ColumnStats:
+    '''Statistics of source column *col*, added one row at a time.
+       If not *exact*, distinct values are counted with a HyperLogLog, mode is from a Misra-Gries summary,
+       and median and describe_aggrs other than mean are computed on a uniform sample of values; errors, nulls, min, max, sum and mean are always exact.'''
+    batchsize = 10000  # values to fold into min/max/sum at once, if not exact
+
+    def __init__(self, col, exact=True, nsample=10000, nmode=1000):
+        self.col = col
+        self.exact = exact
+        self.numeric = vd.isNumeric(col)
+        self.errors = []
+        self.nulls = []
+        self.distinct = set() if exact else HyperLogLog()
+        self.counts = ValueCounts(None if exact else nmode)
+        self.sample = None if exact else ValueSample(nsample)  # of all numeric values added, including those not folded yet
+        self.vals = []  # numeric values not folded yet; all of them if exact
+        self.folded = {}  # func.__name__ -> result over values folded so far
+
+    def add(self, row, isNull):
+        try:
+            v = self.col.getValue(row)
+            if isNull(v):
+                self.nulls.append(row)
+                self.distinct.add(v)
+                return
+            v = self.col.type(v)
+            self.distinct.add(v)
+        except Exception as e:
+            self.errors.append(row)
+            return
+
+        self.counts.add(v)
+        if self.numeric:
+            self.vals.append(v)
+            if not self.exact:
+                self.sample.add(v)
+                if len(self.vals) >= self.batchsize:
+                    self.fold()
+
+    def fold(self):
+        'Fold pending values into min, max and sum.'
+        for func in [min, max, sum]:
+            prev = self.folded.get(func.__name__)
+            if not isinstance(prev, TypedExceptionWrapper):
+                self.folded[func.__name__] = wrapply(func, self.vals if prev is None else [prev]+self.vals)
+        self.vals = []
+
+    def describe(self, d, aggrnames):
+        'Set statistics into dict *d*.'
+        d['errors'] = self.errors
+        d['nulls'] = self.nulls
+        d['distinct'] = self.distinct if self.exact else vlen(len(self.distinct))
+        d['mode'] = wrapply(self.counts.mode)
+        if self.numeric:
+            if self.exact:
+                values = self.vals
+                for func in [min, max, sum]:
+                    d[func.__name__] = wrapply(func, values)
+            else:
+                values = self.sample
+                if self.vals or not self.folded:
+                    self.fold()
+                d.update(self.folded)
+            d['median'] = wrapply(median, values)
+            for aggrname in aggrnames:
+                func = vd.getGlobals()[aggrname]
+                if func.__name__ == 'mean' and not self.exact:
+                    d['mean'] = wrapply(lambda total: total/values.n, d['sum'])
+                else:
+                    d[func.__name__] = wrapply(func, values)
 
 
 @Column.api
@@ -64,43 +208,48 @@ class DescribeSheet(ColumnsSheet):
         for aggrname in vd.options.describe_aggrs.split():
             self.addColumn(DescribeColumn(aggrname, type=float))
 
-        for srccol in Progress(self.rows, 'categorizing'):
-            if not srccol.hidden:
-                self.reloadColumn(srccol)
-
-    def reloadColumn(self, srccol):
-            d = self.describeData[srccol]
-            isNull = srccol.sheet.isNullFunc()
-
-            vals = list()
-            d['errors'] = list()
-            d['nulls'] = list()
-            d['distinct'] = set()
-
-            for sr in Progress(srccol.sheet.rows, 'calculating'):
-                try:
-                    v = srccol.getValue(sr)
-                    if isNull(v):
-                        d['nulls'].append(sr)
-                    else:
-                        v = srccol.type(v)
-                        vals.append(v)
-                    d['distinct'].add(v)
-                except Exception as e:
-                    d['errors'].append(sr)
-
-            d['mode'] = self.calcStatistic(d, mode, vals)
-            if vd.isNumeric(srccol):
-                for func in [min, max, sum, median]:  # use type
-                    d[func.__name__] = self.calcStatistic(d, func, vals)
-                for aggrname in vd.options.describe_aggrs.split():
-                    func = vd.getGlobals()[aggrname]
-                    d[func.__name__] = self.calcStatistic(d, func, vals)
-
-    def calcStatistic(self, d, func, *args, **kwargs):
-        r = wrapply(func, *args, **kwargs)
-        d[func.__name__] = r
-        return r
+        srccols = collections.defaultdict(list)  # source sheet -> [srccols]
+        for srccol in self.rows:
+            srccols[srccol.sheet].append(srccol)
+
+        for sheet, cols in Progress(srccols.items(), 'categorizing'):
+            for chunk in self.columnChunks(sheet, cols):
+                self.reloadColumns(sheet, chunk)
+
+    def columnChunks(self, sheet, cols, maxvals=10000000):
+        'Generate lists of *cols* to describe in each pass over the rows of *sheet*, keeping at most *maxvals* numeric values when describing exactly.'
+        if not self.isExact(sheet):
+            yield cols
+            return
+        n = max(1, maxvals // max(1, sheet.nRows))
+        chunk = []
+        nnumeric = 0
+        for col in cols:
+            if vd.isNumeric(col):
+                if nnumeric >= n:
+                    yield chunk
+                    chunk, nnumeric = [], 0
+                nnumeric += 1
+            chunk.append(col)
+        if chunk:
+            yield chunk
+
+    def isExact(self, sheet):
+        maxrows = self.options.describe_exact_rows
+        return not maxrows or sheet.nRows <= maxrows
+
+    def reloadColumns(self, sheet, srccols):
+        'Compute statistics for all *srccols* of *sheet* in one pass over its rows.'
+        isNull = sheet.isNullFunc()
+        exact = self.isExact(sheet)
+        stats = [ColumnStats(c, exact) for c in srccols]
+        for sr in Progress(sheet.rows, 'calculating'):
+            for st in stats:
+                st.add(sr, isNull)
+
+        aggrnames = vd.options.describe_aggrs.split()
+        for st in stats:
+            st.describe(self.describeData[st.col], aggrnames)
 
     def openCell(self, col, row):
         'open copy of source sheet with rows described in current cell'
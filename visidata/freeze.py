@@ -3,7 +3,7 @@ from visidata import *
 
 @Column.api
 def resetCache(col):
-    col._cachedValues = collections.OrderedDict()
+    col._cachedValues = ColumnCache(col)
     vd.status("reset cache for " + col.name)
 
 
@@ -57,7 +57,33 @@ class StaticSheet(Sheet):
                     row.append(val)
 
 
+class ColumnCachesSheet(Sheet):
+    'Memory use and effectiveness of the values cached for each column.'
+    rowtype = 'column caches'  # rowdef: ColumnCache
+    precious = False
+    columns = [
+        Column('sheet', getter=lambda col,row: row.col() and row.col().sheet),
+        Column('column', getter=lambda col,row: row.col() and row.col().name),
+        Column('entries', type=int, getter=lambda col,row: len(row)),
+        ColumnAttr('nbytes', type=int),
+        ColumnAttr('hits', type=int),
+        ColumnAttr('misses', type=int),
+        ColumnAttr('evictions', type=int),
+    ]
+    nKeys = 2
+
+    def reload(self):
+        self.rows = [cache for cache in vd.cacheManager.caches.values() if cache.col() is not None]
+        mgr = vd.cacheManager
+        vd.status('%s MB cached in %s columns; %s evictions' % (mgr.nbytes//2**20, len(self.rows), mgr.evictions))
+
+
 Sheet.addCommand("'", 'freeze-col', 'sheet.addColumnAtCursor(StaticColumn(cursorCol))', 'add a frozen copy of current column with all cells evaluated')
 Sheet.addCommand("g'", 'freeze-sheet', 'vd.push(StaticSheet(sheet)); status("pushed frozen copy of "+name)', 'open a frozen copy of current sheet with all visible columns evaluated')
 Sheet.addCommand("z'", 'cache-col', 'cursorCol.resetCache()', 'add/reset cache for current column')
 Sheet.addCommand("gz'", 'cache-cols', 'for c in visibleCols: c.resetCache()', 'add/reset cache for all visible columns')
+BaseSheet.addCommand('', 'open-col-caches', 'vd.push(ColumnCachesSheet("column_caches"))', 'open Column Caches Sheet: memory use and hit/miss/eviction counts of cached columns')
+
+vd.addGlobals({
+    'ColumnCachesSheet': ColumnCachesSheet,
+})
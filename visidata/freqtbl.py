@@ -40,6 +40,13 @@ class FreqTableSheet(PivotSheet):
     def updateLargest(self, grouprow):
         self.largest = max(self.largest, len(grouprow.sourcerows))
 
+    def updateGroupRows(self, groupRows):
+        super().updateGroupRows(groupRows)
+        self.largest = max([len(r.sourcerows) for r in self.rows] + [1])
+        for c in self.columns:
+            if c.name in ('percent', 'histogram') and c._cachedValues:  # relative to all source rows
+                c._cachedValues.clear()
+
     @asyncthread
     def reload(self):
         'Generate frequency table then reverse-sort by length.'
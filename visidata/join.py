@@ -46,29 +46,88 @@ def joinkey(sheet, row):
     return tuple(c.getDisplayValue(row) for c in sheet.keyCols)
 
 
-def groupRowsByKey(sheets, rowsBySheetKey, rowsByKey):
-    with Progress(gerund='grouping', total=sum(len(vs.rows) for vs in sheets)*2) as prog:
+def joinKeeps(jointype, present):
+    'Return True if *jointype* keeps the rows for a key, given whether the key is *present* in each sheet.'
+    if jointype == 'inner':  # only rows with matching key on all sheets
+        return all(present)
+    if jointype in ['outer', 'extend']:  # all rows from first sheet
+        return present[0]
+    if jointype == 'diff':  # only rows without matching key on all sheets
+        return not all(present)
+    return True  # full, merge: all rows from all sheets
+
+
+def buildJoinIndex(vs, prog):
+    'Return dict of joinkey -> list of rows of *vs* with that key, in order of first appearance.'
+    index = collections.defaultdict(list)
+    for r in vs.rows:
+        prog.addProgress(1)
+        index[joinkey(vs, r)].append(r)
+    return index
+
+
+def joinCombos(sheets, groups, nprefix):
+    'Generate (positions of the first *nprefix* rows in their groups, combined row) for each combination of rows in *groups*, with None for a sheet without the key.'
+    for combo in itertools.product(*[enumerate(g) if g else [(0, None)] for g in groups]):
+        yield tuple(i for i, r in combo[:nprefix]), {vs: r for vs, (i, r) in zip(sheets, combo)}
+
+
+def probeJoin(sheets, probe, indexes, jointype, rows, prog, probed=None):
+    '''Look up the key of each of *rows* of the *probe* sheet in the *indexes* of the other sheets, and return (list of (key, prefix, combined row), dict of keys kept).
+       Only combinations that *jointype* keeps are made.  Add every probed key to the set *probed*, if given.'''
+    p = sheets.index(probe)
+    out = []
+    kept = {}
+    for r in rows:
+        prog.addProgress(1)
+        key = joinkey(probe, r)
+        if probed is not None:
+            probed.add(key)
+        groups = [[r] if vs is probe else indexes[vs].get(key) for vs in sheets]
+        if not joinKeeps(jointype, [g is not None for g in groups]):
+            continue
+        kept[key] = None
+        for prefix, combinedRow in joinCombos(sheets, groups, p):
+            out.append((key, prefix, combinedRow))
+    return out, kept
+
+
+def hashJoin(sheets, jointype, probe=None):
+    '''Join rows of *sheets* by their key columns; return (list of joined rows as {sheet: row}, dict of sheet -> {key: list of rows} for all sheets but *probe*).
+       Index all sheets but *probe* (by default the one with the most rows), then stream the *probe* rows against the indexes.
+       Rows for keys that *jointype* drops are never combined.  Joined rows are grouped by key in order of first appearance in the sheets, and then in order within each sheet.'''
+    if probe is None:
+        probe = max(sheets, key=lambda vs: len(vs.rows))
+    p = sheets.index(probe)
+
+    # keys only on the other sheets need another pass, unless jointype would drop them anyway
+    leftovers = not (jointype == 'inner' or (jointype in ['outer', 'extend'] and p == 0))
+
+    with Progress(gerund='joining', total=sum(len(vs.rows) for vs in sheets)) as prog:
+        indexes = {vs: buildJoinIndex(vs, prog) for vs in sheets if vs is not probe}
+
+        probed = set() if leftovers else None
+        out, keptByProbe = probeJoin(sheets, probe, indexes, jointype, probe.rows, prog, probed)
+
+    if leftovers:
         for vs in sheets:
-            # tally rows by keys for each sheet
-            rowsBySheetKey[vs] = collections.defaultdict(list)
-            for r in vs.rows:
-                prog.addProgress(1)
-                key = joinkey(vs, r)
-                rowsBySheetKey[vs][key].append(r)
+            for key in indexes.get(vs, ()):
+                if key in probed:
+                    continue
+                probed.add(key)
+                groups = [None if s is probe else indexes[s].get(key) for s in sheets]
+                if joinKeeps(jointype, [g is not None for g in groups]):
+                    for prefix, combinedRow in joinCombos(sheets, groups, p):
+                        out.append((key, prefix, combinedRow))
 
-        for vs in sheets:
-            for r in vs.rows:
-                prog.addProgress(1)
-                key = joinkey(vs, r)
-                if key not in rowsByKey: # gather for this key has not been done yet
-                    # multiplicative for non-unique keys
-                    rowsByKey[key] = [
-                        dict(crow)
-                          for crow in itertools.product(*[
-                              [(vs2, j) for j in rowsBySheetKey[vs2].get(key, [None])]
-                                  for vs2 in sheets
-                          ])
-                    ]
+    # rank keys by first appearance, in sheet order
+    rank = {}
+    for vs in sheets:
+        for key in (keptByProbe if vs is probe else indexes[vs]):
+            rank.setdefault(key, len(rank))
+
+    out.sort(key=lambda t: (rank[t[0]], t[1]))
+    return [combinedRow for key, prefix, combinedRow in out], indexes
 
 
 class JoinKeyColumn(Column):
@@ -153,35 +212,10 @@ class JoinSheet(Sheet):
                 newname = c.name if ctr[c.name] == 1 else '%s_%s' % (vs.name, c.name)
                 self.addColumn(SubColumnItem(vs, c, name=newname))
 
-        rowsBySheetKey = {}   # [sheet] -> { key:list(rows), ... }
-        rowsByKey = {}  # [key] -> [{sheet1:row1, sheet2:row1, ... }, ...]
-
-        groupRowsByKey(sheets, rowsBySheetKey, rowsByKey)
-
         self.rows = []
-
-        with Progress(gerund='joining', total=len(rowsByKey)) as prog:
-            for k, combinedRows in rowsByKey.items():
-                prog.addProgress(1)
-
-                if self.jointype in ['full', 'merge']:  # keep all rows from all sheets
-                    for combinedRow in combinedRows:
-                        self.addRow(combinedRow)
-
-                elif self.jointype == 'inner':  # only rows with matching key on all sheets
-                    for combinedRow in combinedRows:
-                        if all(r is not None for r in combinedRow.values()):
-                            self.addRow(combinedRow)
-
-                elif self.jointype == 'outer':  # all rows from first sheet
-                    for combinedRow in combinedRows:
-                        if combinedRow[sheets[0]]:
-                            self.addRow(combinedRow)
-
-                elif self.jointype == 'diff':  # only rows without matching key on all sheets
-                    for combinedRow in combinedRows:
-                        if not all(r is not None for r in combinedRow.values()):
-                            self.addRow(combinedRow)
+        joinedRows, indexes = hashJoin(sheets, self.jointype)
+        for combinedRow in joinedRows:
+            self.addRow(combinedRow)
 
 
 ## for ExtendedSheet_reload below
@@ -217,8 +251,7 @@ def ExtendedSheet_reload(self, sheets):
     for i, c in enumerate(sheets[0].nonKeyVisibleCols):
         self.addColumn(copy(c))
 
-    self.rowsBySheetKey = {}  # [srcSheet][key] -> list(rowobjs from sheets[0])
-    rowsByKey = {}  # [key] -> [{sheet1:row1, sheet2:row1, ... }, ...]
+    self.rowsBySheetKey = {}  # [srcSheet][key] -> list(rowobjs from srcSheet)
 
     for sheetnum, vs in enumerate(sheets[1:]):
         # subsequent elements are the rows from each source, in order of the source sheets
@@ -228,16 +261,12 @@ def ExtendedSheet_reload(self, sheets):
             newcol = ExtendedColumn(newname, srcsheet=vs, rowsBySheetKey=self.rowsBySheetKey, firstJoinSource=sheets[0], sourceCol=c)
             self.addColumn(newcol)
 
-    groupRowsByKey(sheets, self.rowsBySheetKey, rowsByKey)
+    joinedRows, indexes = hashJoin(sheets, 'extend', probe=sheets[0])
+    self.rowsBySheetKey.update(indexes)
 
     self.rows = []
-
-    with Progress(gerund='joining', total=len(rowsByKey)) as prog:
-        for k, combinedRows in rowsByKey.items():
-            prog.addProgress(1)
-            for combinedRow in combinedRows:
-                if combinedRow[sheets[0]]:
-                    self.addRow(combinedRow[sheets[0]])
+    for combinedRow in joinedRows:
+        self.addRow(combinedRow[sheets[0]])
 
 
 ## for ConcatSheet
@@ -1,6 +1,8 @@
+import collections
 from collections import defaultdict
 
 from visidata import Sheet, VisiData, TypedWrapper, anytype, date, floatsi, currency, vlen, floatlocale, Column, vd
+from visidata import asyncthread, wrapply, forward, LazyRows, OverlayStore, StoreColumn
 
 
 
@@ -56,27 +58,197 @@ def arrow_to_vdtype(t):
     }
     return arrow_to_vd_typemap.get(t.id, anytype)
 
+class ArrowStore(OverlayStore):
+    '''Row store for a sheet backed by an Arrow table.  Rows are int handles, with handle *h* the *h*th row of the table.
+       Single cells are read a block of rows at a time into a cache of up to *maxblocks* blocks for each column, and batches of cells with one ``take`` per column.  Changed and added rows are kept in memory.'''
+    def __init__(self, table, blocksize=1024, maxblocks=4):
+        self.table = table
+        self.setSchema(table.schema, table.num_rows)
+        self.blocksize = blocksize
+        self.maxblocks = maxblocks
+        self.blocks = defaultdict(collections.OrderedDict)  # colidx -> {blocknum: list of values}, least recently used first
+
+    def setSchema(self, schema, nrows):
+        OverlayStore.__init__(self, len(schema.names))
+        self.names = list(schema.names)
+        self.types = list(schema.types)
+        self.nrows = nrows
+
+    def column(self, colidx):
+        'Return ChunkedArray of all base values in *colidx*, in row order.'
+        return self.table.column(colidx)
+
+    def takeValues(self, colidx, indexes):
+        'Return list of base values in *colidx* at 0-based row *indexes*.'
+        import pyarrow as pa
+        return self.table.column(colidx).take(pa.array(indexes, type=pa.int64())).to_pylist()
+
+    def readValues(self, colidx, start, n):
+        'Return list of *n* base values in *colidx* from 0-based row index *start*.'
+        return self.table.column(colidx).slice(start, n).to_pylist()
+
+    def baseget(self, row, colidx):
+        if not 0 < row <= self.nrows or colidx >= len(self.types):
+            return None
+        b, i = divmod(row-1, self.blocksize)
+        blocks = self.blocks[colidx]
+        vals = blocks.pop(b, None)
+        if vals is None:
+            vals = self.readValues(colidx, b*self.blocksize, min(self.blocksize, self.nrows-b*self.blocksize))
+        blocks[b] = vals
+        while len(blocks) > self.maxblocks:
+            blocks.popitem(last=False)
+        return vals[i]
+
+    def baserow(self, row):
+        return [self.baseget(row, i) for i in range(len(self.types))]
+
+    def isBase(self, row, colidx):
+        'Return True if the value for *row* in *colidx* is unchanged from the table.'
+        return 0 < row <= self.nrows and colidx < len(self.types) and row not in self.edits
+
+    def getvalues(self, rows, colidx):
+        'Return list of values for *rows* in *colidx*.'
+        indexes = [row-1 for row in rows if self.isBase(row, colidx)]
+        vals = iter(self.takeValues(colidx, indexes) if indexes else [])
+        return [next(vals) if self.isBase(row, colidx) else self.get(row, colidx) for row in rows]
+
+
+class ArrowColumn(StoreColumn):
+    'Column for an Arrow-backed sheet; *expr* is the column index into the table.'
+    def getTypedValues(self, rows):
+        if self._cachedValues is not None or self.sheet.defer:
+            return super().getTypedValues(rows)
+        return [wrapply(self.type, v) for v in self.sheet.columnStore.getvalues(rows, self.expr)]
+
+    def isNative(self):
+        'Return True if typed values of this column compare the same as the values in the Arrow table.'
+        import pyarrow as pa
+        t = self.sheet.columnStore.types[self.expr]
+        if self.type is not arrow_to_vdtype(t):
+            return False
+        return pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_date(t) or pa.types.is_timestamp(t) or pa.types.is_string(t)
+
+    def sortIndexes(self, rows, order, reverse=False):
+        'Return *order* (indexes into *rows*) stable-sorted by this column with an Arrow compute kernel, or None if the values need to be compared in Python.'
+        store = self.sheet.columnStore
+        if store.edits or self._cachedValues is not None or self.sheet.defer or not self.isNative():
+            return None
+
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        order = pa.array(order, type=pa.int64())
+        indexes = pc.subtract(pa.array(rows, type=pa.int64()).take(order), 1)
+        vals = store.column(self.expr).take(indexes)
+        perm = pc.array_sort_indices(vals,
+                                     order='descending' if reverse else 'ascending',
+                                     null_placement='at_end' if reverse else 'at_start')
+        return order.take(perm).to_pylist()
+
+
+# rowdef: int handle into columnStore
 class ArrowSheet(Sheet):
-    def iterload(self):
+    columnStore = None  # ArrowStore
+    selectionBitmap = True
+
+    def rowid(self, row):
+        return row
+
+    def newRow(self):
+        return self.columnStore.append([])
+
+    def readTable(self):
         import pyarrow as pa
 
         try:
             with pa.OSFile(str(self.source), 'rb') as fp:
-                self.coldata = pa.ipc.open_file(fp).read_all()
+                return pa.ipc.open_file(fp).read_all()
         except pa.lib.ArrowInvalid as e:
             with pa.OSFile(str(self.source), 'rb') as fp:
-                self.coldata = pa.ipc.open_stream(fp).read_all()
+                return pa.ipc.open_stream(fp).read_all()
+
+    @asyncthread
+    def reload(self):
+        self.loadTable(self.readTable())
+
+        if self._ordering:
+            vd.sync(self.sort())
 
+    def loadTable(self, table):
+        'Set columns and rows from Arrow *table*, without converting any values.'
+        self.setStore(ArrowStore(table))
+        self.rows.grow(table.num_rows)
+
+    def setStore(self, store):
+        'Set *store* as the row store, with a column for each column of its schema and no rows.'
+        self.columnStore = store
+        self._selectedRows = {}  # selected handles were into the previous store
         self.columns = []
-        for colnum, col in enumerate(self.coldata):
-            coltype = arrow_to_vdtype(self.coldata.schema.types[colnum])
-            colname = self.coldata.schema.names[colnum]
+        for colnum, (colname, coltype) in enumerate(zip(store.names, store.types)):
+            self.addColumn(ArrowColumn(colname, colnum, type=arrow_to_vdtype(coltype)))
+        self.rows = LazyRows()
+
+    def arrowTable(self):
+        '''Return Arrow table of visible columns in the current order of rows, taken directly from the source table.
+           Return None if any rows or columns differ from the source table.'''
+        import pyarrow as pa
 
-            self.addColumn(Column(colname, type=coltype, expr=colnum,
-                                  getter=lambda c,r: c.sheet.coldata[c.expr][r[0]].as_py()))
+        store = self.columnStore
+        if store is None or store.edits or self.defer:
+            return None
+        cols = self.visibleCols
+        if not all(isinstance(c, ArrowColumn) and c.isNative() and c._cachedValues is None for c in cols):
+            return None
 
-        for rownum in range(max(len(c) for c in self.coldata)):
-            yield [rownum]
+        table = pa.table([store.column(c.expr) for c in cols], names=[c.name for c in cols])
+        indexes = self.tableIndexes()
+        if indexes is not None:
+            table = table.take(indexes)
+        return table
+
+    def tableIndexes(self):
+        'Return Arrow array of the 0-based table row index of each row, or None if the rows are all the rows of the table in order.'
+        import pyarrow as pa
+        if isinstance(self.rows, LazyRows) and not self.rows.materialized and len(self.rows) == self.columnStore.nrows:
+            return None
+        return pa.array([r-1 for r in self.rows], type=pa.int64())
+
+    def queryGroups(self, cols):
+        '''Return groups of rows by their formatted values in *cols*, from an Arrow ``group_by``, as dict of formatted keys -> [first row index, typed keys, rows].
+           Return None if any of *cols* is not a table column with native values, or any rows have been added or changed.'''
+        store = self.columnStore
+        if store is None or store.edits or self.defer:
+            return None
+        if not all(isinstance(c, ArrowColumn) and c.sheet is self and c.isNative() and c._cachedValues is None for c in cols):
+            return None
+
+        import pyarrow as pa
+        indexes = self.tableIndexes()
+        keycols = [store.column(c.expr) for c in cols]
+        if indexes is not None:
+            keycols = [a.take(indexes) for a in keycols]
+        names = ['k%d' % i for i in range(len(cols))]
+        table = pa.table(keycols + [pa.array(range(len(self.rows)), type=pa.int64())], names=names+['i'])
+        try:
+            grouped = table.group_by(names).aggregate([('i', 'list')])
+        except (AttributeError, pa.ArrowException):  # no group_by or list aggregation in this pyarrow
+            return None
+
+        groups = {}  # formatted keys -> [first row index, typed keys, row indexes]
+        keyvals = zip(*[grouped.column(n).to_pylist() for n in names])
+        for vals, idxs in zip(keyvals, grouped.column('i_list').to_pylist()):
+            keys = [forward(wrapply(c.type, v)) for c, v in zip(cols, vals)]
+            # distinct values may format the same, like floats beyond the displayed precision
+            fmtkeys = tuple(wrapply(c.format, v) for v, c in zip(keys, cols))
+            g = groups.get(fmtkeys)
+            if g is None:
+                groups[fmtkeys] = [min(idxs), keys, idxs]
+            else:
+                g[0] = min(g[0], min(idxs))
+                g[2].extend(idxs)
+
+        rows = self.rows
+        return {fmtkeys: [first, keys, [rows[i] for i in sorted(idxs)]] for fmtkeys, (first, keys, idxs) in groups.items()}
 
 
 @VisiData.api
@@ -84,6 +256,15 @@ def save_arrow(vd, p, sheet, streaming=False):
     import pyarrow as pa
     import numpy as np
 
+    cols = sheet.visibleCols
+    table = sheet.arrowTable() if isinstance(sheet, ArrowSheet) else None
+    if table is not None:  # unchanged from source: write the table as is, with the schema an edited copy would have
+        schema = pa.schema([(c.name, t) for c, t in zip(cols, table.schema.types)])
+        with p.open_bytes(mode='w') as outf:
+            with (pa.ipc.new_stream if streaming else pa.ipc.new_file)(outf, schema) as writer:
+                writer.write_table(table.cast(schema))
+        return
+
     typemap = {
         anytype: pa.string(),
         int: pa.int64(),
@@ -96,21 +277,24 @@ def save_arrow(vd, p, sheet, streaming=False):
         date: pa.date64(),
     }
 
-    databycol = defaultdict(list)   # col -> [values]
+    databycol = [[] for col in cols]   # [values] for each col
 
-    for typedvals in sheet.iterdispvals(format=False):
-        for col, val in typedvals.items():
-            if isinstance(val, TypedWrapper):
-                val = None
+    for block in sheet.iterdispblocks(*cols, format=False):
+        for vals, colvals in zip(databycol, block):
+            vals.extend(None if isinstance(val, TypedWrapper) else val for val in colvals)
 
-            databycol[col].append(val)
+    def toArray(col, vals):
+        'Return Arrow array of *vals*, with the type of *col* in the source table if its values are the same as there and still fit it.'
+        if isinstance(col, ArrowColumn) and col.isNative():
+            try:
+                return pa.array(vals, type=sheet.columnStore.types[col.expr])
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                pass
+        return pa.array(vals, type=typemap.get(col.type, pa.string()))
 
-    data = [pa.array(vals, type=typemap.get(col.type, pa.string())) for col, vals in databycol.items()]
+    data = [toArray(col, vals) for col, vals in zip(cols, databycol)]
 
-    schema = pa.schema([
-        (c.name, typemap.get(c.type, pa.string()))
-            for c in sheet.visibleCols
-    ])
+    schema = pa.schema([(c.name, a.type) for c, a in zip(cols, data)])
     with p.open_bytes(mode='w') as outf:
         if streaming:
             with pa.ipc.new_stream(outf, schema) as writer:
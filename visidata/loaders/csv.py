@@ -1,7 +1,11 @@
+import io
+import os
 import csv
+import itertools
+import collections
 
 from visidata import vd, VisiData, SequenceSheet, options, stacktrace
-from visidata import TypedExceptionWrapper, Progress
+from visidata import TypedExceptionWrapper, Progress, filesize
 
 vd.option('csv_dialect', 'excel', 'dialect passed to csv.reader', replay=True)
 vd.option('csv_delimiter', ',', 'delimiter passed to csv.reader', replay=True)
@@ -10,10 +14,12 @@ vd.option('csv_skipinitialspace', True, 'skipinitialspace passed to csv.reader',
 vd.option('csv_escapechar', None, 'escapechar passed to csv.reader', replay=True)
 vd.option('csv_lineterminator', '\r\n', 'lineterminator passed to csv.writer', replay=True)
 vd.option('safety_first', False, 'sanitize input/output to handle edge cases, with a performance cost', replay=True)
+vd.option('load_workers', 0, 'number of processes for parsing local CSV files in parallel (0 or 1 to parse in the loader thread)')
 
 csv.field_size_limit(2**31-1) # Windows has max 32-bit
 
 options_num_first_rows = 10
+parallel_chunk_size = 2**24  # bytes per chunk handed to each worker process
 
 @VisiData.api
 def open_csv(vd, p):
@@ -23,11 +29,125 @@ def removeNulls(fp):
     for line in fp:
         yield line.replace('\0', '')
 
+def splitQuoted(fp, size, nchunks, quote=b'"'):
+    '''Return list of byte offsets into binary *fp* of *size* bytes, dividing it into about *nchunks* ranges.
+       Each range ends at a newline outside of *quote*d fields, as determined by the parity of quotechars before it.'''
+    offsets = [0]
+    inquote = False
+    pos = 0
+    for i in range(1, nchunks):
+        target = size*i//nchunks
+        while pos < target:
+            buf = fp.read(min(target-pos, 2**20))
+            if not buf:
+                break
+            inquote ^= bool(buf.count(quote) & 1)
+            pos += len(buf)
+
+        # advance to the next newline that is not inside a quoted field
+        found = False
+        while not found:
+            buf = fp.read(2**16)
+            if not buf:
+                break
+            j = 0
+            while True:
+                nl = buf.find(b'\n', j)
+                if nl < 0:
+                    inquote ^= bool(buf.count(quote, j) & 1)
+                    pos += len(buf)
+                    break
+                inquote ^= bool(buf.count(quote, j, nl) & 1)
+                j = nl+1
+                if not inquote:
+                    pos += j
+                    found = True
+                    break
+
+        if not found or pos >= size:
+            break
+        fp.seek(pos)
+        offsets.append(pos)
+
+    offsets.append(size)
+    return offsets
+
+
+def parseRange(path, start, end, encoding, encoding_errors, csvopts, safety_first=False):
+    'Return list of rows parsed from bytes *start* to *end* of *path*, with csv.Error instances in place of unparseable rows.  Run in a worker process.'
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        text = fp.read(end-start).decode(encoding, encoding_errors)
+
+    fp = io.StringIO(text, newline=None)
+    rdr = csv.reader(removeNulls(fp) if safety_first else fp, **csvopts)
+    rows = []
+    while True:
+        try:
+            rows.append(next(rdr))
+        except csv.Error as e:
+            rows.append(e)
+        except StopIteration:
+            return rows
+
+
 class CsvSheet(SequenceSheet):
     _rowtype = list  # rowdef: list of values
 
+    def canLoadParallel(self):
+        'Return True if source is a local uncompressed file which can be split into byte ranges on quote and newline bytes.'
+        p = self.source
+        if p.has_fp() or p.is_url() or p.given == '-' or getattr(p, 'compression', None):
+            return False
+        if options.csv_escapechar or not options.csv_quotechar:
+            return False
+        try:
+            return '\n'.encode(self.options.encoding) == b'\n' and len(options.csv_quotechar.encode(self.options.encoding)) == 1
+        except LookupError:
+            return False
+
+    def iterloadParallel(self, nworkers):
+        'Parse byte ranges of the source in *nworkers* processes, yielding rows in file order.'
+        import concurrent.futures
+
+        path = os.fspath(self.source)
+        size = filesize(self.source)
+        with open(path, 'rb') as fp:
+            offsets = splitQuoted(fp, size, max(nworkers, size//parallel_chunk_size), options.csv_quotechar.encode(self.options.encoding))
+
+        args = (self.options.encoding, self.options.encoding_errors, options.getall('csv_'), options.safety_first)
+        chunks = zip(offsets, offsets[1:])
+
+        with Progress(gerund='parsing', total=size) as prog, \
+                concurrent.futures.ProcessPoolExecutor(nworkers) as executor:
+            def submit(start, end):
+                fut = executor.submit(parseRange, path, start, end, *args)
+                fut.add_done_callback(lambda f, n=end-start: prog.addProgress(n))
+                return fut
+
+            # keep a bounded number of chunks in flight, so parsed rows do not pile up ahead of the merge
+            pending = collections.deque(submit(*r) for r in itertools.islice(chunks, nworkers*2))
+            try:
+                while pending:
+                    rows = pending.popleft().result()
+                    pending.extend(submit(*r) for r in itertools.islice(chunks, 1))
+                    for row in rows:
+                        if isinstance(row, csv.Error):
+                            row.stacktrace = stacktrace()
+                            yield [TypedExceptionWrapper(None, exception=row)]
+                        else:
+                            yield row
+            finally:
+                for fut in pending:
+                    fut.cancel()
+
     def iterload(self):
         'Convert from CSV, first handling header row specially.'
+        nworkers = self.options.load_workers
+        if nworkers > 1 and self.canLoadParallel():
+            yield from self.iterloadParallel(nworkers)
+            return
+
         with self.source.open_text(encoding=self.options.encoding) as fp:
             if options.safety_first:
                 rdr = csv.reader(removeNulls(fp), **options.getall('csv_'))
@@ -47,15 +167,24 @@ class CsvSheet(SequenceSheet):
 @VisiData.api
 def save_csv(vd, p, sheet):
     'Save as single CSV file, handling column names as first line.'
-    with p.open_text(mode='w', encoding=sheet.options.encoding, newline='') as fp:
-        cw = csv.writer(fp, **options.getall('csv_'))
-        colnames = [col.name for col in sheet.visibleCols]
-        if ''.join(colnames):
-            cw.writerow(colnames)
-
-        with Progress(gerund='saving'):
-            for dispvals in sheet.iterdispvals(format=True):
-                cw.writerow(dispvals.values())
+    csvopts = options.getall('csv_')
+
+    def _csvLines(sheet, rows):
+        buf = io.StringIO()
+        cw = csv.writer(buf, **csvopts)
+        for block in sheet.iterdispblocks(format=True, rows=rows):
+            cw.writerows(zip(*block))
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    buf = io.StringIO()
+    colnames = [col.name for col in sheet.visibleCols]
+    if ''.join(colnames):
+        csv.writer(buf, **csvopts).writerow(colnames)
+
+    with Progress(gerund='saving'):
+        vd.saveRows(p, sheet, _csvLines, header=buf.getvalue(), encoding=sheet.options.encoding, newline='')
 
 vd.addGlobals({
     'CsvSheet': CsvSheet
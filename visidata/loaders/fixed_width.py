@@ -74,6 +74,9 @@ class FixedWidthColumnsSheet(SequenceSheet):
         self.headerlines = headerlines
 
 
+FixedWidthColumnsSheet.options.load_columnar = False  # rows are [line], sliced by FixedWidthColumn
+
+
 @VisiData.api
 def save_fixed(vd, p, *vsheets):
     with p.open_text(mode='w', encoding=vsheets[0].options.encoding) as fp:
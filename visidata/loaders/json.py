@@ -120,16 +120,24 @@ def save_json(vd, p, *vsheets):
 
 @Sheet.api
 def write_jsonl(vs, fp):
-        vcols = vs.visibleCols
-        jsonenc = _vjsonEncoder()
         with Progress(gerund='saving'):
-            for row in vs.iterrows():
-                rowdict = _rowdict(vcols, row)
-                fp.write(jsonenc.encode(rowdict) + '\n')
+            vs.writeRows(fp, _jsonlLines)
+
+
+def _jsonlLines(vs, rows):
+    vcols = vs.visibleCols
+    jsonenc = _vjsonEncoder()
+    for row in (vs.iterrows() if rows is None else rows):
+        yield jsonenc.encode(_rowdict(vcols, row)) + '\n'
 
 
 @VisiData.api
 def save_jsonl(vd, p, *vsheets):
+    if len(vsheets) == 1:
+        with Progress(gerund='saving'):
+            vd.saveRows(p, vsheets[0], _jsonlLines, encoding=vsheets[0].options.encoding)
+        return
+
     with p.open_text(mode='w', encoding=vsheets[0].options.encoding) as fp:
         for vs in vsheets:
             vs.write_jsonl(fp)
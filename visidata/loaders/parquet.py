@@ -1,28 +1,164 @@
-from visidata import VisiData, Sheet, Column
+import ast
+import collections
+import threading
+from array import array
+from bisect import bisect_right
+
+from visidata import VisiData, vd, Progress, asyncthread
+from visidata.loaders.arrow import ArrowSheet, ArrowStore
+
+
+vd.option('parquet_filter', '', "only load rows of parquet files matching pyarrow filters, like [('col', '>', 5)]; row groups ruled out by their statistics are not read", replay=True)
+vd.option('parquet_max_chunks', 64, 'max number of parquet column chunks (one column of one row group) to keep in memory')
 
 
 @VisiData.api
 def open_parquet(vd, p):
     return ParquetSheet(p.name, source=p)
 
-class ParquetColumn(Column):
-    def calcValue(self, row):
-        return self.source[row['__rownum__']].as_py()
 
+_cmpops = {
+    '=': lambda lo, hi, v: lo <= v <= hi,
+    '==': lambda lo, hi, v: lo <= v <= hi,
+    '<': lambda lo, hi, v: lo < v,
+    '<=': lambda lo, hi, v: lo <= v,
+    '>': lambda lo, hi, v: hi > v,
+    '>=': lambda lo, hi, v: hi >= v,
+    'in': lambda lo, hi, v: any(lo <= x <= hi for x in v),
+    '!=': lambda lo, hi, v: not (lo == hi == v),
+    'not in': lambda lo, hi, v: not (lo == hi and lo in v),
+}
+
+
+def parseFilters(s):
+    'Return pyarrow filters in disjunctive normal form (list of lists of (colname, op, value)) from option string *s*, or None if empty.'
+    if not s:
+        return None
+    filters = ast.literal_eval(s) if isinstance(s, str) else s
+    if filters and isinstance(filters[0], tuple):
+        filters = [filters]
+    return [list(conj) for conj in filters]
+
+
+def rowGroupMayMatch(rgmeta, filters):
+    'Return False if the min/max statistics of row group *rgmeta* show that no row can match *filters*.'
+    stats = {}
+    for i in range(rgmeta.num_columns):
+        col = rgmeta.column(i)
+        if col.is_stats_set and col.statistics.has_min_max:
+            stats[col.path_in_schema] = col.statistics
+
+    def mayMatch(colname, op, v):
+        st = stats.get(colname)
+        if st is None or op not in _cmpops:
+            return True
+        try:
+            return _cmpops[op](st.min, st.max, v)
+        except TypeError:
+            return True
+
+    return any(all(mayMatch(*pred) for pred in conj) for conj in filters)
+
+
+class ParquetStore(ArrowStore):
+    '''Row store reading a parquet file one column chunk (one column of one row group) at a time, as values are needed.
+       Only the columns that are displayed or computed on are ever read.  Handle *h* is the *h*th row in *positions* if given, else in the file.'''
+    def __init__(self, pf, positions=None, maxchunks=64, blocksize=1024, maxblocks=4):
+        self.pf = pf
+        self.positions = positions
+        nrows = pf.metadata.num_rows if positions is None else len(positions)
+        self.setSchema(pf.schema_arrow, nrows)
+        self.rgstarts = [0]
+        for i in range(pf.num_row_groups):
+            self.rgstarts.append(self.rgstarts[-1] + pf.metadata.row_group(i).num_rows)
+        self.maxchunks = maxchunks
+        self.chunks = collections.OrderedDict()  # (rgnum, colidx) -> pyarrow.Array, least recently used first
+        self.lock = threading.Lock()  # one reader of the file at a time
+        self.blocksize = blocksize
+        self.maxblocks = maxblocks
+        self.blocks = collections.defaultdict(collections.OrderedDict)
+
+    def addPositions(self, positions):
+        'Add rows at *positions* in the file as the next handles.'
+        self.positions.extend(positions)
+        self.nrows = len(self.positions)
 
-class ParquetSheet(Sheet):
-    # rowdef: {'__rownum__':int, parquet_col:overridden_value, ...}
-    def iterload(self):
+    def chunk(self, rgnum, colidx):
+        'Return Array of values in *colidx* for row group *rgnum*, reading it from the file if not cached.'
+        with self.lock:
+            arr = self.chunks.pop((rgnum, colidx), None)
+            if arr is None:
+                arr = self.pf.read_row_group(rgnum, columns=[self.names[colidx]]).column(0).combine_chunks()
+            self.chunks[(rgnum, colidx)] = arr
+            while len(self.chunks) > self.maxchunks:
+                self.chunks.popitem(last=False)
+            return arr
+
+    def column(self, colidx):
+        import pyarrow as pa
+        with self.lock:
+            col = self.pf.read(columns=[self.names[colidx]]).column(0)
+        if self.positions is not None:
+            col = col.take(pa.array(self.positions, type=pa.int64()))
+        return col
+
+    def takeValues(self, colidx, indexes):
+        import pyarrow as pa
+        ret = [None]*len(indexes)
+        groups = collections.defaultdict(lambda: ([], []))  # rgnum -> (indexes into ret, row indexes in group)
+        for k, i in enumerate(indexes):
+            pos = i if self.positions is None else self.positions[i]
+            rgnum = bisect_right(self.rgstarts, pos)-1
+            outidx, rgidx = groups[rgnum]
+            outidx.append(k)
+            rgidx.append(pos-self.rgstarts[rgnum])
+
+        for rgnum, (outidx, rgidx) in groups.items():
+            vals = self.chunk(rgnum, colidx).take(pa.array(rgidx, type=pa.int64())).to_pylist()
+            for k, v in zip(outidx, vals):
+                ret[k] = v
+        return ret
+
+    def readValues(self, colidx, start, n):
+        return self.takeValues(colidx, range(start, start+n))
+
+
+# rowdef: int handle into columnStore
+class ParquetSheet(ArrowSheet):
+    @asyncthread
+    def reload(self):
         import pyarrow.parquet as pq
-        from visidata.loaders.arrow import arrow_to_vdtype
-
-        self.tbl = pq.read_table(self.source)
-        self.columns = []
-        for colname, col in zip(self.tbl.column_names, self.tbl.columns):
-            c = ParquetColumn(colname,
-                              type=arrow_to_vdtype(col.type),
-                              source=col)
-            self.addColumn(c)
-
-        for i in range(self.tbl.num_rows):
-            yield dict(__rownum__=i)
+
+        pf = pq.ParquetFile(str(self.source))
+        filters = parseFilters(self.options.parquet_filter)
+        if not filters:
+            self.setStore(ParquetStore(pf, maxchunks=self.options.parquet_max_chunks))
+            self.rows.grow(pf.metadata.num_rows)
+        else:
+            self.setStore(ParquetStore(pf, positions=array('q'), maxchunks=self.options.parquet_max_chunks))
+            self.loadFiltered(pf, filters)
+
+        if self._ordering:
+            vd.sync(self.sort())
+
+    def loadFiltered(self, pf, filters):
+        'Add rows matching *filters* one row group at a time, without reading row groups whose statistics rule out a match.'
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        expr = pq.filters_to_expression(filters)
+        filtercols = sorted(set(pred[0] for conj in filters for pred in conj))
+        store = self.columnStore
+        nskipped = 0
+        for rgnum in Progress(range(pf.num_row_groups), gerund='filtering'):
+            if not rowGroupMayMatch(pf.metadata.row_group(rgnum), filters):
+                nskipped += 1
+                continue
+            with store.lock:
+                t = pf.read_row_group(rgnum, columns=filtercols)
+            t = t.append_column('__pos', pa.array(range(store.rgstarts[rgnum], store.rgstarts[rgnum+1]), type=pa.int64()))
+            store.addPositions(t.filter(expr).column('__pos').to_pylist())
+            self.rows.grow(store.nrows-len(self.rows))
+
+        if nskipped:
+            vd.status(f'skipped {nskipped}/{pf.num_row_groups} row groups by their statistics')
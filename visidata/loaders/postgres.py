@@ -1,10 +1,12 @@
+import itertools
 import random
 
-from visidata import VisiData, vd, Sheet, options, anytype, urlparse, asyncthread, ColumnItem
+from visidata import VisiData, vd, Sheet, options, anytype, urlparse, asyncthread, ColumnItem, Progress
 
 __all__ = ['openurl_postgres', 'openurl_postgresql', 'openurl_rds', 'PgTable', 'PgTablesSheet']
 
 vd.option('postgres_schema', 'public', 'The desired schema for the Postgres database')
+vd.option('postgres_fetch_rows', 10000, 'number of rows to fetch from a server-side cursor at a time')
 
 def codeToType(type_code, colname):
     import psycopg2
@@ -64,12 +66,25 @@ class SQL:
         self.conn = conn
 
     def cur(self, qstr):
+        'Return named (server-side) cursor executing *qstr*, which keeps the results on the server until they are fetched.'
         import string
         randomname = ''.join(random.choice(string.ascii_uppercase) for _ in range(6))
         cur = self.conn.cursor(randomname)
         cur.execute(qstr)
         return cur
 
+    def iterbatches(self, cur, n):
+        'Generate lists of up to *n* rows from *cur*.  Close *cur* if interrupted, so the server can release it; the transaction is shared by other sheets on the connection, so it is left as is.'
+        try:
+            while True:
+                batch = cur.fetchmany(n)
+                if not batch:
+                    break
+                yield batch
+        except BaseException:
+            cur.close()
+            raise
+
     @asyncthread
     def query_async(self, qstr, callback=None):
         with self.cur(qstr) as cur:
@@ -114,24 +129,30 @@ class PgTablesSheet(Sheet):
                 self.addRow(r)
 
     def openRow(self, row):
-        return PgTable(self.name+"."+row[0], source=row[0], sql=self.sql)
+        return PgTable(self.name+"."+row[0], source=row[0], sql=self.sql, est_nrows=row[2])
 
 
-# rowdef: tuple of values as returned by fetchone()
+# rowdef: tuple of values as returned by fetchmany()
 class PgTable(Sheet):
+    est_nrows = 0  # from the table statistics, for progress only
+
     @asyncthread
     def reload(self):
+        'Stream rows from a server-side cursor, in batches of options.postgres_fetch_rows, so only the rows loaded so far are held in memory.'
         if self.options.postgres_schema:
             source = f"{self.options.postgres_schema}.{self.source}"
         else:
             source = self.source
         with self.sql.cur(f"SELECT * FROM {source}") as cur:
             self.rows = []
-            r = cur.fetchone()
-            if r:
-                self.addRow(r)
+            batches = self.sql.iterbatches(cur, self.options.postgres_fetch_rows)
+            first = next(batches, [])  # cur.description is only available after the first fetch
             self.columns = []
             for c in vd.postgresGetColumns(cur):
                 self.addColumn(c)
-            for r in cur:
-                self.addRow(r)
+
+            with Progress(gerund='loading', total=max(self.est_nrows or 0, 0)) as prog:
+                for batch in itertools.chain([first], batches):
+                    for r in batch:
+                        self.addRow(r)
+                    prog.addProgress(len(batch))
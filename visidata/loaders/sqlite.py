@@ -1,6 +1,7 @@
 import re
 
-from visidata import VisiData, vd, Sheet, options, Column, Progress, anytype, date, ColumnItem, asyncthread, TypedExceptionWrapper, TypedWrapper, IndexSheet, copy, currency, clean_to_id
+from visidata import VisiData, vd, Sheet, options, Column, Progress, anytype, date, ColumnItem, asyncthread, TypedExceptionWrapper, TypedWrapper, IndexSheet, copy, currency, clean_to_id, wrapply, forward
+from visidata.search import isascii
 
 
 @VisiData.api
@@ -14,6 +15,16 @@ def openurl_sqlite(vd, p, filetype=None):
 VisiData.open_sqlite3 = VisiData.open_sqlite
 VisiData.open_db = VisiData.open_sqlite
 
+
+def sqliteAffinity(decltype):
+    'Return the type affinity sqlite gives a column declared with *decltype*: INTEGER, TEXT, BLOB, REAL or NUMERIC.'
+    t = (decltype or '').upper()
+    if 'INT' in t: return 'INTEGER'
+    if 'CHAR' in t or 'CLOB' in t or 'TEXT' in t: return 'TEXT'
+    if 'BLOB' in t or not t: return 'BLOB'
+    if 'REAL' in t or 'FLOA' in t or 'DOUB' in t: return 'REAL'
+    return 'NUMERIC'
+
 # rowdef: list of values
 class SqliteSheet(Sheet):
     'Provide functionality for importing SQLite databases.'
@@ -28,6 +39,7 @@ class SqliteSheet(Sheet):
         import sqlite3
         con = sqlite3.connect(str(self.resolve()))
         con.text_factory = lambda s, enc=self.options.encoding, encerrs=self.options.encoding_errors: s.decode(enc, encerrs)
+        con.create_function('regexp', 2, lambda regex, s, flags=self.regex_flags(): re.search(regex, '' if s is None else str(s), flags) is not None)
         return con
 
     def execute(self, conn, sql, parms=None):
@@ -50,6 +62,7 @@ class SqliteSheet(Sheet):
             return anytype
 
         self.rowidColumn = None
+        self.sqlColumns = {}  # [ColumnItem.expr] -> (quoted column name in table, vd type for declared type, sqlite type affinity)
         with self.conn() as conn:
             tblname = self.tableName
             if not isinstance(self, SqliteIndexSheet):
@@ -58,6 +71,7 @@ class SqliteSheet(Sheet):
                     colnum, colname, coltype, nullable, defvalue, colkey, *_ = r
                     c = ColumnItem(colname, colnum+1, type=parse_sqlite_type(coltype))
                     self.addColumn(c)
+                    self.sqlColumns[c.expr] = ('"%s"' % colname.replace('"', '""'), c.type, sqliteAffinity(coltype))
 
                     if colkey:
                         self.setKeys([c])
@@ -66,6 +80,7 @@ class SqliteSheet(Sheet):
                 if 'WITHOUT ROWID' not in sql and 'CREATE VIEW' not in sql:
                     self.rowidColumn = ColumnItem('rowid', 0, type=int, width=0)
                     self.addColumn(self.rowidColumn, index=0)
+                    self.sqlColumns[0] = ('rowid', int, 'INTEGER')
 
             if self.rowidColumn:
                 r = self.execute(conn, 'SELECT rowid, * FROM "%s"' % tblname)
@@ -73,6 +88,108 @@ class SqliteSheet(Sheet):
                 r = self.execute(conn, 'SELECT NULL, * FROM "%s"' % tblname)
             yield from Progress(r, total=r.rowcount-1)
 
+    def sqlColumn(self, col):
+        'Return quoted name of the table column for *col*, or None if its typed values may not be the ones in the table.'
+        if not isinstance(col, ColumnItem) or col.sheet is not self:
+            return None
+        name, sqltype, affinity = getattr(self, 'sqlColumns', {}).get(col.expr, (None, None, None))
+        if col.type is not sqltype or getattr(col, '_cachedValues', None) is not None:
+            return None
+        return name
+
+    def hasTextOrIntValues(self, col):
+        'Return True if the values of the table column for *col* compare and group in sqlite as they do in Python: declared TEXT or INTEGER, so that 1 and 1.0 are never both stored.'
+        return getattr(self, 'sqlColumns', {}).get(col.expr, (None, None, None))[2] in ('TEXT', 'INTEGER')
+
+    def canQuery(self):
+        'Return True if rows can be matched to the table by rowid, and no rows have been added or changed since loading.'
+        return bool(getattr(self, 'rowidColumn', None)) and not self._deferredAdds and not self._deferredMods
+
+    def queryRowIndexes(self, sql, parms=None):
+        'Return indexes of rows whose rowid is in the first column of the result of *sql*.'
+        with self.conn() as conn:
+            rowids = set(r[0] for r in self.execute(conn, sql, parms))
+        return [i for i, r in enumerate(self.rows) if r[0] in rowids]
+
+    def sortOrder(self, rows, prog=None):
+        'Return indexes into *rows* in the order given by an ORDER BY query, if the ordering columns are all table columns.'
+        cols = [self.column(c) if isinstance(c, str) else c for c, _ in self._ordering]
+        ordering = [(self.sqlColumn(c), reverse) for c, (_, reverse) in zip(cols, self._ordering)]
+        if not self.canQuery() or not ordering or not all(name for name, _ in ordering) or any(c.type is anytype for c in cols):
+            # sqlite orders values of mixed storage classes in an untyped column differently than Python would
+            return super().sortOrder(rows, prog=prog)
+
+        import sqlite3
+        orderby = ', '.join(name + ' COLLATE BINARY' + (' DESC' if reverse else '') for name, reverse in ordering)
+        try:
+            with self.conn() as conn:
+                # rows equal in all ordering columns get the same rank, so they keep their current order
+                rank = dict(self.execute(conn, 'SELECT rowid, DENSE_RANK() OVER (ORDER BY %s) FROM "%s"' % (orderby, self.tableName)))
+            return sorted(range(len(rows)), key=lambda i: rank[rows[i][0]])
+        except (sqlite3.OperationalError, KeyError):  # no window functions, or rows not in the table
+            return super().sortOrder(rows, prog=prog)
+
+    def gatherEqual(self, col, value, dispval):
+        'Generate rows with display value *dispval* in *col*, from a WHERE query if *col* displays its table values as is.'
+        name = self.sqlColumn(col)
+        if not self.canQuery() or not name or col.type is not int or col.fmtstr or not isinstance(value, int):  # an untyped column may have 1 and '1', which display the same
+            yield from self.gatherBy(lambda r, c=col, v=dispval: c.getDisplayValue(r) == v)
+            return
+
+        if dispval == '':
+            where, parms = '%s IS NULL OR %s = \'\'' % (name, name), []
+        else:
+            where, parms = '%s = ? COLLATE BINARY' % name, [value]
+        for i in self.queryRowIndexes('SELECT rowid FROM "%s" WHERE %s' % (self.tableName, where), parms):
+            yield self.rows[i]
+
+    def regexRowIndexes(self, regexstr, columns='cursorCol'):
+        'Return indexes of rows with a value in *columns* matching *regexstr*, from a WHERE query if all of *columns* display their table values as is.'
+        cols = [self.cursorCol] if columns == 'cursorCol' else self.visibleCols
+        names = [self.sqlColumn(c) for c in cols]
+        if not regexstr or not self.canQuery() or not all(names) or any(not self.hasTextOrIntValues(c) or c.fmtstr for c in cols):
+            return list(vd.searchRegex(self, regex=regexstr, columns=columns))
+
+        flags = self.regex_flags()
+        vd.searchContext.update(regex=re.compile(regexstr, flags), columns=columns)
+        if not (set(regexstr) & set('.^$*+?{}[]\\|()')) and not flags & re.VERBOSE and (isascii(regexstr) or not flags & re.IGNORECASE):
+            # plain substring: match with instr() in sqlite, instead of calling back into Python for each value
+            fmt = 'instr(lower(%s), lower(?))' if flags & re.IGNORECASE else 'instr(%s, ?)'
+        else:
+            fmt = '%s REGEXP ?'
+        where = ' OR '.join(fmt % name for name in names)
+        ret = self.queryRowIndexes('SELECT rowid FROM "%s" WHERE %s' % (self.tableName, where), [regexstr]*len(names))
+        vd.status('%s matches for /%s/' % (len(ret), regexstr))
+        return ret
+
+    def queryGroups(self, cols):
+        '''Return groups of rows by their formatted values in *cols*, from a GROUP BY query, as dict of formatted keys -> [first row index, typed keys, rows].
+           Return None if any of *cols* is not a table column declared TEXT or INTEGER, since sqlite groups 1 and 1.0 together.'''
+        names = [self.sqlColumn(c) for c in cols]
+        if not self.canQuery() or not all(names) or not all(self.hasTextOrIntValues(c) for c in cols):
+            return None
+
+        rowidx = {r[0]: i for i, r in enumerate(self.rows)}
+        groups = {}  # formatted keys -> [first row index, typed keys, row indexes]
+        groupby = ', '.join(name + ' COLLATE BINARY' for name in names)
+        with self.conn() as conn:
+            sql = 'SELECT %s, group_concat(rowid) FROM "%s" GROUP BY %s' % (', '.join(names), self.tableName, groupby)
+            for *vals, rowids in self.execute(conn, sql):
+                idxs = [rowidx[int(x)] for x in rowids.split(',') if int(x) in rowidx]
+                if not idxs:
+                    continue
+                keys = [forward(wrapply(c.type, v)) for c, v in zip(cols, vals)]
+                # values distinct in sqlite may format the same, like 1 and '1'
+                fmtkeys = tuple(wrapply(c.format, v) for v, c in zip(keys, cols))
+                g = groups.get(fmtkeys)
+                if g is None:
+                    groups[fmtkeys] = [min(idxs), keys, idxs]
+                else:
+                    g[0] = min(g[0], min(idxs))
+                    g[2].extend(idxs)
+
+        return {fmtkeys: [first, keys, [self.rows[i] for i in sorted(idxs)]] for fmtkeys, (first, keys, idxs) in groups.items()}
+
     @asyncthread
     def putChanges(self):
         adds, mods, dels = self.getDeferredChanges()
@@ -236,6 +353,11 @@ def save_sqlite(vd, p, *vsheets):
 
 SqliteIndexSheet.addCommand('a', 'add-table', 'fail("create a new table by saving a sheet to this database file")', 'stub; add table by saving a sheet to the db file instead')
 SqliteIndexSheet.bindkey('ga', 'add-table')
+SqliteSheet.addCommand('|', 'select-col-regex', 'selectByIdx(sheet.regexRowIndexes(input("select regex: ", type="regex", defaultLast=True), columns="cursorCol"))', 'select rows matching regex in current column')
+SqliteSheet.addCommand('\\', 'unselect-col-regex', 'unselectByIdx(sheet.regexRowIndexes(input("unselect regex: ", type="regex", defaultLast=True), columns="cursorCol"))', 'unselect rows matching regex in current column')
+SqliteSheet.addCommand('g|', 'select-cols-regex', 'selectByIdx(sheet.regexRowIndexes(input("select regex: ", type="regex", defaultLast=True), columns="visibleCols"))', 'select rows matching regex in any visible column')
+SqliteSheet.addCommand('g\\', 'unselect-cols-regex', 'unselectByIdx(sheet.regexRowIndexes(input("unselect regex: ", type="regex", defaultLast=True), columns="visibleCols"))', 'unselect rows matching regex in any visible column')
+SqliteSheet.addCommand(',', 'select-equal-cell', 'select(gatherEqual(cursorCol, cursorTypedValue, cursorDisplay), progress=False)', 'select rows matching current cell in current column')
 SqliteSheet.options.header = 0
 VisiData.save_db = VisiData.save_sqlite
 
@@ -1,15 +1,21 @@
 import os
+import re
+import array
+import bisect
 import contextlib
 import itertools
 import collections
 
-from visidata import vd, asyncthread, options, Progress, ColumnItem, SequenceSheet, Sheet, FileExistsError, getType, VisiData
+from visidata import vd, asyncthread, options, Progress, ColumnItem, SequenceSheet, Sheet, FileExistsError, LazyRows, OverlayStore, getType, VisiData
 from visidata import namedlist, filesize
 
 vd.option('delimiter', '\t', 'field delimiter to use for tsv/usv filetype', replay=True)
 vd.option('row_delimiter', '\n', 'row delimiter to use for tsv/usv filetype', replay=True)
 vd.option('tsv_safe_newline', '\u001e', 'replacement for newline character when saving to tsv', replay=True)
 vd.option('tsv_safe_tab', '\u001f', 'replacement for tab character when saving to tsv', replay=True)
+vd.option('tsv_lazy', False, 'index line offsets of local tsv files, and parse rows only when needed', replay=True)
+vd.option('lazy_readahead_kb', 256, 'approximate size in KB of each block of a lazily loaded file, parsed together when any of its rows is needed')
+vd.option('lazy_cache_blocks', 64, 'max number of parsed readahead blocks to keep in memory for each lazily loaded sheet')
 
 
 @VisiData.api
@@ -17,6 +23,25 @@ def open_tsv(vd, p):
     return TsvSheet(p.name, source=p)
 
 
+_eol = re.compile(rb'\r\n|\r|\n')  # line endings recognized by universal newlines, as by open_text
+_streol = re.compile(r'\r\n|\r|\n')
+
+
+def readLine(fp):
+    'Return the next line of binary *fp*, including its line ending of \\n, \\r or \\r\\n; or b"" at the end of the file.'
+    start = fp.tell()
+    buf = b''
+    while True:
+        chunk = fp.read(4096)
+        buf += chunk
+        m = _eol.search(buf)
+        if m and (m.end() < len(buf) or not chunk):  # a \r at the end of buf may be followed by \n
+            fp.seek(start+m.end())
+            return buf[:m.end()]
+        if not chunk:
+            return buf
+
+
 def splitter(fp, delim='\n'):
     'Generates one line/row/record at a time from fp, separated by delim'
 
@@ -33,11 +58,155 @@ def splitter(fp, delim='\n'):
     yield from buf.rstrip(delim).split(delim)
 
 
+class LineStore(OverlayStore):
+    '''Row store for a TsvSheet loaded lazily from a file.  Rows are int handles, with handle *h* the *h*th data line of the file.
+       The file is indexed into blocks of about *blocksize* bytes, ending at line boundaries; only the offset and first line number of each block is kept.
+       Rows are parsed a block at a time into a bounded cache.  Changed and added rows are kept in memory.'''
+    def __init__(self, path, ncols, delimiter, encoding, encoding_errors, blocksize=2**18, maxblocks=64):
+        super().__init__(ncols)
+        self.path = path
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.encoding_errors = encoding_errors
+        self.blocksize = blocksize
+        self.maxblocks = maxblocks
+        self.offsets = array.array('Q')     # byte offset of each block
+        self.firstlines = array.array('Q')  # number of data lines before each block
+        self.nlines = 0
+        self.end = 0        # byte offset just past the last indexed block
+        self.blocks = collections.OrderedDict()  # blocknum -> list of parsed rows, least recently used first
+
+    @staticmethod
+    def countLines(data):
+        'Return number of non-empty lines in *data*, which ends at a line boundary.'
+        if b'\r' in data:
+            return sum(1 for line in _eol.split(data) if line)
+        if b'\n\n' in data or b'\n\r\n' in data or data.startswith(b'\n') or data.startswith(b'\r\n'):
+            return sum(1 for line in data.split(b'\n') if line and line != b'\r')
+        return data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+
+    def index(self, fp, start, rows, prog=None):
+        'Index data lines of binary *fp* from byte offset *start*, growing *rows* as each block is indexed.'
+        pos = start
+        fp.seek(pos)
+        while True:
+            data = fp.read(self.blocksize)
+            if not data:
+                break
+            # extend block to the end of its last line
+            if data.endswith(b'\r'):
+                c = fp.read(1)
+                if c == b'\n':
+                    data += c
+                elif c:
+                    fp.seek(-1, 1)
+            elif not data.endswith(b'\n'):
+                data += readLine(fp)
+
+            n = self.countLines(data)
+            if n:
+                self.offsets.append(pos)
+                self.firstlines.append(self.nlines)
+                self.nlines += n
+            pos += len(data)
+            self.end = pos
+            if prog:
+                prog.addProgress(len(data))
+            rows.grow(n)
+
+    def loadBlock(self, b):
+        'Return list of parsed rows in block *b*.'
+        rows = self.blocks.get(b)
+        if rows is not None:
+            self.blocks.move_to_end(b)
+            return rows
+
+        start = self.offsets[b]
+        end = self.offsets[b+1] if b+1 < len(self.offsets) else self.end
+        with open(self.path, 'rb') as fp:
+            fp.seek(start)
+            data = fp.read(end-start)
+
+        rows = []
+        for line in _streol.split(data.decode(self.encoding, self.encoding_errors)):
+            if line:
+                rows.append(line.split(self.delimiter))
+
+        self.blocks[b] = rows
+        while len(self.blocks) > self.maxblocks:
+            self.blocks.popitem(last=False)
+        return rows
+
+    def baserow(self, row):
+        'Return list of parsed values for the data line with handle *row*.'
+        i = row-1
+        b = bisect.bisect_right(self.firstlines, i)-1
+        return self.loadBlock(b)[i-self.firstlines[b]]
+
+
 # rowdef: list
 class TsvSheet(SequenceSheet):
     delimiter = ''
     row_delimiter = ''
 
+    def canLoadLazy(self):
+        'Return True if source is a local uncompressed file with newline-separated rows in an ASCII-compatible encoding.'
+        p = self.source
+        if not hasattr(p, 'has_fp') or p.has_fp() or p.is_url() or p.given == '-' or getattr(p, 'compression', None):
+            return False
+        if (self.row_delimiter or self.options.row_delimiter) != '\n':
+            return False
+        try:
+            return '\n'.encode(self.options.encoding) == b'\n'
+        except LookupError:
+            return False
+
+    @asyncthread
+    def reload(self):
+        if self.options.tsv_lazy and self.canLoadLazy():
+            self.reloadLazy()
+        else:
+            SequenceSheet.reload.__wrapped__(self)
+
+    def reloadLazy(self):
+        'Read header rows, then index the rest of the source without parsing it.  Rows are parsed as they are needed, for display or otherwise.'
+        if self.selectionBitmap:
+            self._selectedRows = {}  # selected handles would select other rows once reloaded
+        delim = self.delimiter or self.options.delimiter
+        path = os.fspath(self.source)
+        with open(path, 'rb') as fp:
+            headerrows = []
+            nskip = self.options.getobj('skip', self)
+            nheader = self.options.getobj('header', self)
+            while len(headerrows) < nskip+nheader:
+                line = readLine(fp)
+                if not line:
+                    break
+                line = _streol.sub('', line.decode(self.options.encoding, self.options.encoding_errors))
+                if line:
+                    headerrows.append(line.split(delim))
+            start = fp.tell()
+
+            self.columnStore = LineStore(path, 0, delim,
+                                         self.options.encoding, self.options.encoding_errors,
+                                         blocksize=self.options.lazy_readahead_kb*1024,
+                                         maxblocks=self.options.lazy_cache_blocks)
+            self.setCols(headerrows[nskip:])
+            self.rows = LazyRows()
+            with Progress(gerund='indexing', total=filesize(self.source)-start) as prog:
+                self.columnStore.index(fp, start, self.rows, prog)
+
+        # use the first row to add columns beyond the header
+        self.columnStore.ncols = len(self.columns)
+        if self.rows:
+            self.columnStore.ncols = max(len(self.columns), len(self.columnStore.rowvalues(1)))
+            for i in range(len(self.columns), self.columnStore.ncols):
+                self.addColumn(self.itemColumn('', i))
+
+        if self._ordering:
+            vd.sync(self.sort())
+
+
     def iterload(self):
         delim = self.delimiter or self.options.delimiter
         rowdelim = self.row_delimiter or self.options.row_delimiter
@@ -63,13 +232,12 @@ def save_tsv(vd, p, vs, delimiter='', row_delimiter=''):
     rowsep = row_delimiter or vs.options.row_delimiter
     trdict = vs.safe_trdict()
 
-    with p.open_text(mode='w', encoding=vs.options.encoding) as fp:
-        colhdr = unitsep.join(col.name.translate(trdict) for col in vs.visibleCols) + rowsep
-        fp.write(colhdr)
+    def _tsvLines(vs, rows):
+        for block in vs.iterdispblocks(format=True, rows=rows):
+            yield from (unitsep.join(vals)+rowsep for vals in zip(*block))
 
-        for dispvals in vs.iterdispvals(format=True):
-            fp.write(unitsep.join(dispvals.values()))
-            fp.write(rowsep)
+    colhdr = unitsep.join(col.name.translate(trdict) for col in vs.visibleCols) + rowsep
+    vd.saveRows(p, vs, _tsvLines, header=colhdr, encoding=vs.options.encoding)
 
     vd.status('%s save finished' % p)
 
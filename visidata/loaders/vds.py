@@ -32,9 +32,13 @@ def save_vds(vd, p, *sheets):
                 fp.write('#'+json.dumps(d)+NL)
 
             with Progress(gerund='saving'):
-                for row in vs.iterdispvals(*vs.visibleCols, format=False):
-                    d = {col.name:val for col, val in row.items()}
-                    fp.write(json.dumps(d, default=str)+NL)
+                vs.writeRows(fp, _vdsLines)
+
+
+def _vdsLines(vs, rows):
+    names = [col.name for col in vs.visibleCols]
+    for block in vs.iterdispblocks(*vs.visibleCols, format=False, rows=rows):
+        yield from (json.dumps(dict(zip(names, vals)), default=str)+NL for vals in zip(*block))
 
 
 class VdsIndexSheet(IndexSheet):
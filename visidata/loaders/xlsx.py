@@ -84,6 +84,9 @@ class XlsxSheet(SequenceSheet):
         self.addRows(to_paste, index=rowidx)
 
 
+XlsxSheet.options.load_columnar = False  # rows are AttrDict of cells
+
+
 class XlsIndexSheet(IndexSheet):
     'Load XLS file (in Excel format).'
     rowtype = 'sheets'  # rowdef: xlsSheet
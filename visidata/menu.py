@@ -455,6 +455,8 @@ vd.menus = [
     Menu('System',
         Menu('Macros sheet', 'macro-sheet'),
         Menu('Threads sheet', 'threads-all'),
+        Menu('Memory sheet', 'open-memory'),
+        Menu('Column caches sheet', 'open-col-caches'),
         Menu('Execute longname', 'exec-longname'),
         Menu('Python',
             Menu('import library', 'import-python'),
@@ -79,6 +79,9 @@ VisiDataMetaSheet.options.header = 1
 VisiDataMetaSheet.options.skip = 0
 VisiDataMetaSheet.options.row_delimiter = '\n'
 VisiDataMetaSheet.options.encoding = 'utf-8'
+VisiDataMetaSheet.options.load_columnar = False  # rows are accessed by attribute name
+VisiDataMetaSheet.options.tsv_lazy = False
+VisiDataMetaSheet.options.load_cache = False
 
 
 class OptionsSheet(Sheet):
@@ -1,3 +1,8 @@
+import contextlib
+import itertools
+import weakref
+from array import array
+
 from visidata import *
 
 vd.option('color_add_pending', 'green', 'color for rows pending add')
@@ -23,6 +28,47 @@ Sheet.colorizers += [
         RowColorizer(9, 'color_delete_pending', lambda s,c,r,v: s.isDeleted(r)),
         ]
 
+@Sheet.lazy_property
+def rowListeners(sheet):
+    'Sheets derived from this sheet, to be notified of changes to its rows; see ``notifyRowListeners``.'
+    return weakref.WeakSet()
+
+@Sheet.api
+def notifyRowListeners(sheet, event, *args):
+    '''Call ``listener.<event>(sheet, *args)`` for each sheet in ``sheet.rowListeners``.  Events are:
+
+        - ``sourceRowsAdded(sheet, rows)``
+        - ``sourceRowsRemoved(sheet, rows)``
+        - ``sourceCellChanged(sheet, col, row, oldval)``
+        - ``sourceCellsChanged(sheet, changes)``, with list of (col, row, oldval), after ``batchCellChanges``; listeners without it get ``sourceCellChanged`` for each change.
+    '''
+    for vs in list(sheet.rowListeners):
+        try:
+            if event == 'sourceCellsChanged' and not hasattr(vs, event):
+                for change in args[0]:
+                    vs.sourceCellChanged(sheet, *change)
+            else:
+                getattr(vs, event)(sheet, *args)
+        except Exception as e:
+            vd.exceptionCaught(e)
+
+Sheet.init('_cellChanges', lambda: None)  # list of (col, row, oldval) collected by batchCellChanges
+
+@Sheet.api
+@contextlib.contextmanager
+def batchCellChanges(sheet):
+    'Within this context, collect the ``sourceCellChanged`` notifications for *sheet*, and notify listeners of them all at once at the end.'
+    if sheet._cellChanges is not None:  # already collecting
+        yield
+        return
+    sheet._cellChanges = []
+    try:
+        yield
+    finally:
+        changes, sheet._cellChanges = sheet._cellChanges, None
+        if changes:
+            sheet.notifyRowListeners('sourceCellsChanged', changes)
+
 @Sheet.api
 def preloadHook(sheet):
     BaseSheet.preloadHook(sheet)
@@ -95,6 +141,7 @@ def addRows(sheet, rows, index=None, undo=True):
         if sheet.defer:
             sheet.rowAdded(row)
     sheet.setModified()
+    sheet.notifyRowListeners('sourceRowsAdded', list(addedRows.values()))
 
     @asyncthread
     def _removeRows():
@@ -129,18 +176,36 @@ def deleteBy(sheet, func, commit=False, undo=True):
             break
         oldidx += 1
 
+    deletedRows = []
+    deletedIdxs = array('I' if len(oldrows) < 2**32 else 'L')  # index in oldrows of each of deletedRows
     sheet.rows.clear() # must delete from the existing rows object
-    for r in Progress(oldrows, 'deleting'):
+    for i, r in enumerate(Progress(oldrows, 'deleting')):
         if not func(r):
             sheet.rows.append(r)
             if r is newCursorRow:
                 sheet.cursorRowIndex = len(sheet.rows)-1
         else:
             sheet.deleteSourceRow(r)
+            deletedRows.append(r)
+            deletedIdxs.append(i)
             ndeleted += 1
 
+    if deletedRows:
+        sheet.notifyRowListeners('sourceRowsRemoved', deletedRows)
+
     if undo:
-        vd.addUndo(setattr, sheet, 'rows', oldrows)
+        def _undoDeleteBy(sheet, deletedIdxs, deletedRows):
+            # put each deleted row back at its former index
+            rows = iter(list(sheet.rows))
+            merged = []
+            for i, r in zip(deletedIdxs.get(), deletedRows):
+                merged.extend(itertools.islice(rows, i-len(merged)))
+                merged.append(r)
+            merged.extend(rows)
+            sheet.rows[:] = merged
+            if deletedRows:
+                sheet.notifyRowListeners('sourceRowsAdded', deletedRows)
+        vd.addUndo(_undoDeleteBy, sheet, vd.undoStore.add(deletedIdxs), deletedRows)
         sheet.setModified()
 
     if ndeleted:
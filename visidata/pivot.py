@@ -1,4 +1,5 @@
 import collections
+import itertools
 from visidata import *
 
 
@@ -56,8 +57,10 @@ def AggrColumn(aggcol, aggregator):
 
 
 class PivotSheet(Sheet):
-    'Summarize key columns in pivot table and display as new sheet.'
+    '''Summarize key columns in pivot table and display as new sheet.
+    Unless grouped into numeric bins, group rows are kept up to date as source rows are added, removed or changed.'''
     rowtype = 'grouped rows'  # rowdef: PivotGroupRow
+    groupIndex = None  # [formattedDiscreteKeys] -> PivotGroupRow, while kept up to date with source
     def __init__(self, name, groupByCols, pivotCols, **kwargs):
         super().__init__(name, **kwargs)
 
@@ -174,9 +177,55 @@ class PivotSheet(Sheet):
 #                                    getter=lambda col,row,aggcol=aggcol,agg=aggregator: agg(aggcol, row.sourcerows))
 #                        self.addColumn(c)
 
+    def groupSourceRows(self, rows, discreteCols, binOf, prog, batchsize=10000):
+        '''Group source *rows* by their formatted discrete keys and numeric bin.
+           Return dict of formattedDiscreteKeys -> {binKey: [firstidx, discreteKeys, sourcerows, pivotrows]}, with binKey None for the main/error bin.
+           Runs in the calling thread: the key columns' getters are arbitrary Python, so partitions would neither scale across threads nor pickle to other processes.'''
+        groups = {}
+        formatted = {}  # (type, value) of raw typed keys -> formatted keys, so each distinct key is formatted only once
+        for i in range(0, len(rows), batchsize):
+            batch = rows[i:i+batchsize]
+            keycols = [[forward(v) for v in c.getTypedValues(batch)] for c in discreteCols]
+            keys = zip(*keycols) if keycols else itertools.repeat(())
+            for j, (sourcerow, rawkeys) in enumerate(zip(batch, keys)):
+                typedkeys = tuple((type(v), v) for v in rawkeys)  # 1, 1.0 and True are equal but formatted differently
+                try:
+                    formattedDiscreteKeys = formatted.get(typedkeys)
+                except TypeError:  # unhashable values
+                    formattedDiscreteKeys = tuple(wrapply(c.format, v) for v, c in zip(rawkeys, discreteCols))
+                else:
+                    if formattedDiscreteKeys is None:
+                        # wrapply will pass-through a key-able TypedWrapper
+                        formattedDiscreteKeys = formatted[typedkeys] = tuple(wrapply(c.format, v) for v, c in zip(rawkeys, discreteCols))
+
+                bins = groups.get(formattedDiscreteKeys)
+                if bins is None:
+                    bins = groups[formattedDiscreteKeys] = {}
+
+                binKey = binOf(sourcerow) if binOf else None
+                g = bins.get(binKey)
+                if g is None:
+                    g = bins[binKey] = [i+j, list(rawkeys), [], {}]
+
+                # add the sourcerow to its bin
+                g[2].append(sourcerow)
+
+                # separate by pivot value
+                for col in self.pivotCols:
+                    varval = col.getTypedValue(sourcerow)
+                    matchingRows = g[3].get(varval)
+                    if matchingRows is None:
+                        matchingRows = g[3][varval] = []
+                    matchingRows.append(sourcerow)
+
+            prog.addProgress(len(batch))
+
+        return groups
+
     @asyncthread
     def groupRows(self, rowfunc=None):
         self.rows = []
+        self.groupIndex = None
 
         discreteCols = [c for c in self.groupByCols if not self.isNumericRange(c)]
 
@@ -186,85 +235,198 @@ class PivotSheet(Sheet):
             vd.fail('only one numeric column can be binned')
 
         numericBins = []
-        degenerateBinning = False
+        binOf = None
         if numericCols:
+            numcol = numericCols[0]
             nbins = self.source.options.histogram_bins or int(len(self.source.rows) ** (1./2))
-            vals = tuple(numericCols[0].getValues(self.source.rows))
+            vals = tuple(numcol.getValues(self.source.rows))
             minval = min(vals)
             maxval = max(vals)
             width = (maxval - minval)/nbins
+            binIndex = None
 
             if width == 0:
                 # only one value (and maybe errors)
                 numericBins = [(minval, maxval)]
-            elif (numericCols[0].type in (int, vlen) and nbins > (maxval - minval)) or (width == 1):
+            elif (numcol.type in (int, vlen) and nbins > (maxval - minval)) or (width == 1):
                 # (more bins than int vals) or (if bins are of width 1), just use the vals as bins
-                degenerateBinning = True
                 numericBins = [(val, val) for val in sorted(set(vals))]
                 nbins = len(numericBins)
+                # in degenerate binning, each val has its own bin
+                binIndex = {val:i for i, (val, _) in enumerate(numericBins)}
             else:
                 numericBins = [(minval+width*i, minval+width*(i+1)) for i in range(nbins)]
 
-        # group rows by their keys (groupByCols), and separate by their pivot values (pivotCols)
-        groups = {}  # [formattedDiscreteKeys] -> (numericGroupRows:dict(formattedNumericKeyRange -> PivotGroupRow), groupRow:PivotGroupRow)  # groupRow is main/error row
-
-        for sourcerow in Progress(self.source.iterrows(), 'grouping', total=self.source.nRows):
-            discreteKeys = list(forward(origcol.getTypedValue(sourcerow)) for origcol in discreteCols)
+            binKeys = [formatRange(numcol, numRange) for numRange in numericBins]
 
-            # wrapply will pass-through a key-able TypedWrapper
-            formattedDiscreteKeys = tuple(wrapply(c.format, v) for v, c in zip(discreteKeys, discreteCols))
-
-            numericGroupRows, groupRow = groups.get(formattedDiscreteKeys, (None, None))
-            if numericGroupRows is None:
-                # add new group rows
-                numericGroupRows = {formatRange(numericCols[0], numRange): PivotGroupRow(discreteKeys, numRange, [], {}) for numRange in numericBins}
-                groups[formattedDiscreteKeys] = (numericGroupRows, None)
-                for r in numericGroupRows.values():
-                    self.addRow(r)
-
-            # find the grouprow this sourcerow belongs in, by numericbin
-            if numericCols:
+            def binOf(sourcerow):
+                'Return formatted range of the numeric bin for *sourcerow*, or None to leave it in the main/error bin.'
                 try:
-                    val = numericCols[0].getValue(sourcerow)
+                    val = numcol.getValue(sourcerow)
                     if val is not None:
-                        val = numericCols[0].type(val)
+                        val = numcol.type(val)
                     if not width:
                         binidx = 0
-                    elif degenerateBinning:
-                        # in degenerate binning, each val has its own bin
-                        binidx = numericBins.index((val, val))
+                    elif binIndex is not None:
+                        binidx = binIndex[val]
                     else:
                         binidx = int((val-minval)//width)
-                    groupRow = numericGroupRows[formatRange(numericCols[0], numericBins[min(binidx, nbins-1)])]
+                    return binKeys[min(binidx, nbins-1)]
                 except Exception as e:
-                    # leave in main/error bin
-                    pass
+                    return None
+
+        # a source sheet may group its own rows by discrete keys, with ``queryGroups(cols)`` returning {formattedDiscreteKeys: [firstidx, discreteKeys, sourcerows]}, or None if it cannot
+        queryGroups = getattr(self.source, 'queryGroups', None)
+        queried = queryGroups(discreteCols) if queryGroups and discreteCols and not numericCols and not self.pivotCols else None
+        if queried is not None:
+            groups = {fmtkeys: {None: g+[{}]} for fmtkeys, g in queried.items()}
+        else:
+            # group rows by their keys (groupByCols), and separate by their pivot values (pivotCols)
+            rows = list(self.source.iterrows())
+            with Progress(gerund='grouping', total=len(rows)) as prog:
+                groups = self.groupSourceRows(rows, discreteCols, binOf, prog)  # [formattedDiscreteKeys] -> {binKey: [firstidx, discreteKeys, sourcerows, pivotrows]}
+
+        # add group rows in the order their first source row was encountered:
+        # all numeric bins when the discrete keys first appear, and the main/error bin when first needed
+        adds = []
+        for formattedDiscreteKeys, bins in groups.items():
+            first = min(bins.values(), key=lambda g: g[0])
+            adds.append((first[0], 0, formattedDiscreteKeys, bins, first[1]))
+            if None in bins:
+                adds.append((bins[None][0], 1, formattedDiscreteKeys, bins, bins[None][1]))
+        adds.sort(key=lambda x: x[:2])
+
+        groupIndex = {}  # [formattedDiscreteKeys] -> PivotGroupRow, if not binning
+        nankey = makeErrorKey(numericCols[0]) if numericCols else 0
+        for _, isMain, formattedDiscreteKeys, bins, discreteKeys in adds:
+            if isMain:
+                g = bins[None]
+                newRows = [PivotGroupRow(discreteKeys, (nankey, nankey), g[2], g[3])]
+                if not numericCols:
+                    groupIndex[formattedDiscreteKeys] = newRows[0]
+            else:
+                numericGroupRows = {binKey: numRange for numRange, binKey in zip(numericBins, binKeys)} if numericBins else {}
+                newRows = []
+                for binKey, numRange in numericGroupRows.items():
+                    g = bins.get(binKey) or [0, None, [], {}]
+                    newRows.append(PivotGroupRow(discreteKeys, numRange, g[2], g[3]))
 
-            # add the main bin if no numeric bin (error, or no numeric cols)
-            if groupRow is None:
-                nankey = makeErrorKey(numericCols[0]) if numericCols else 0
-                groupRow = PivotGroupRow(discreteKeys, (nankey, nankey), [], {})
-                groups[formattedDiscreteKeys] = (numericGroupRows, groupRow)
+            for groupRow in newRows:
                 self.addRow(groupRow)
-
-            # add the sourcerow to its all bin
-            groupRow.sourcerows.append(sourcerow)
-
-            # separate by pivot value
-            for col in self.pivotCols:
-                varval = col.getTypedValue(sourcerow)
-                matchingRows = groupRow.pivotrows.get(varval)
-                if matchingRows is None:
-                    matchingRows = groupRow.pivotrows[varval] = []
-                matchingRows.append(sourcerow)
-
-            if rowfunc:
-                rowfunc(groupRow)
+                if rowfunc:
+                    rowfunc(groupRow)
 
         # automatically add cache to all columns now that everything is binned
         for c in self.nonKeyVisibleCols:
             c.setCache(True)
 
+        # numeric bins depend on the range of all values, so only discrete groups are kept up to date
+        if not numericCols:
+            self.groupIndex = groupIndex
+            self.source.rowListeners.add(self)
+
+    def rowGroupKeys(self, row, typedvals={}):
+        'Return (typed keys, formatted keys) of the group for source *row*, using typed values in *typedvals* by column instead of the current values.'
+        keys = [forward(typedvals[c] if c in typedvals else c.getTypedValue(row)) for c in self.groupByCols]
+        return keys, tuple(wrapply(c.format, v) for v, c in zip(keys, self.groupByCols))
+
+    def addToGroups(self, rows, changed, typedvals={}):
+        'Add source *rows* to their group rows, making new group rows as needed.  Add affected group rows to dict *changed*.'
+        for row in rows:
+            keys, fmtkeys = self.rowGroupKeys(row, typedvals)
+            groupRow = self.groupIndex.get(fmtkeys)
+            if groupRow is None:
+                groupRow = self.groupIndex[fmtkeys] = PivotGroupRow(keys, (0, 0), [], {})
+                self.addRow(groupRow)
+            groupRow.sourcerows.append(row)
+            for col in self.pivotCols:
+                groupRow.pivotrows.setdefault(col.getTypedValue(row), []).append(row)
+            changed[id(groupRow)] = groupRow
+
+    def removeFromGroups(self, rows, changed, typedvals={}, rowtypedvals=None):
+        'Remove source *rows* from their group rows.  Add affected group rows to dict *changed*.  *rowtypedvals* is an optional list of *typedvals* for each of *rows*.'
+        rowidsByGroup = collections.defaultdict(set)
+        for i, row in enumerate(rows):
+            keys, fmtkeys = self.rowGroupKeys(row, rowtypedvals[i] if rowtypedvals else typedvals)
+            rowidsByGroup[fmtkeys].add(self.source.rowid(row))
+
+        for fmtkeys, rowids in rowidsByGroup.items():
+            groupRow = self.groupIndex.get(fmtkeys)
+            if groupRow is None:
+                continue
+            self.removeRowids(groupRow.sourcerows, rowids)
+            for varval, matchingRows in list(groupRow.pivotrows.items()):
+                self.removeRowids(matchingRows, rowids)
+                if not matchingRows:
+                    del groupRow.pivotrows[varval]
+            changed[id(groupRow)] = groupRow
+
+    def removeRowids(self, rows, rowids):
+        'Remove source rows with *rowids* from list *rows* in place: by index if only one, else in one pass.'
+        rowid = self.source.rowid
+        if len(rowids) == 1:
+            [k] = rowids
+            for i, r in enumerate(rows):
+                if rowid(r) == k:
+                    del rows[i]
+                    return
+        else:
+            rows[:] = [r for r in rows if rowid(r) not in rowids]
+
+    def removeEmptyGroups(self, groupRows):
+        'Remove any of *groupRows* left without source rows.'
+        empty = set(id(g) for g in groupRows if not g.sourcerows)
+        if empty:
+            for fmtkeys, groupRow in list(self.groupIndex.items()):
+                if id(groupRow) in empty:
+                    del self.groupIndex[fmtkeys]
+            self.rows[:] = [r for r in self.rows if id(r) not in empty]
+
+    def sourceRowsAdded(self, sheet, rows):
+        if sheet is self.source and self.groupIndex is not None:
+            changed = {}
+            self.addToGroups(rows, changed)
+            self.updateGroupRows(changed.values())
+
+    def sourceRowsRemoved(self, sheet, rows):
+        if sheet is self.source and self.groupIndex is not None:
+            changed = {}
+            self.removeFromGroups(rows, changed)
+            self.updateGroupRows(changed.values())
+
+    def sourceCellChanged(self, sheet, col, row, oldval):
+        self.sourceCellsChanged(sheet, [(col, row, oldval)])
+
+    def sourceCellsChanged(self, sheet, changes):
+        if sheet is not self.source or self.groupIndex is None:
+            return
+        changed = {}
+        moved = collections.OrderedDict()  # rowid -> (row, {col: old typed value})
+        for col, row, oldval in changes:
+            if col in self.groupByCols or col in self.pivotCols:
+                _, oldvals = moved.setdefault(self.source.rowid(row), (row, {}))
+                oldvals.setdefault(col, wrapply(col.type, oldval))  # keep the value before the first change
+            else:
+                groupRow = self.groupIndex.get(self.rowGroupKeys(row)[1])
+                if groupRow is not None:
+                    changed[id(groupRow)] = groupRow
+
+        if moved:
+            # move the rows from the groups for their old values to the groups for their new values
+            rows = [row for row, oldvals in moved.values()]
+            self.removeFromGroups(rows, changed, rowtypedvals=[oldvals for row, oldvals in moved.values()])
+            self.addToGroups(rows, changed)
+        self.updateGroupRows(changed.values())
+
+    def updateGroupRows(self, groupRows):
+        'Remove *groupRows* left empty, and clear cached aggregates for the rest, so they are recomputed from their source rows.'
+        groupRows = list(groupRows)
+        self.removeEmptyGroups(groupRows)
+        for c in self.columns:
+            if c._cachedValues:
+                for groupRow in groupRows:
+                    c._cachedValues.pop(self.rowid(groupRow), None)
+
 
 @PivotSheet.api
 def addcol_aggr(sheet, col):
@@ -1,9 +1,21 @@
+import collections
+import itertools
+import multiprocessing
+import os
+import threading
+
 from visidata import *
 
 
 vd.option('confirm_overwrite', True, 'whether to prompt for overwrite confirmation on save')
 vd.option('safe_error', '#ERR', 'error string to use while saving', replay=True)
 vd.option('disp_formatter', 'generic', 'formatter to use for display and saving', replay=True)
+vd.option('save_workers', 0, 'number of forked processes for formatting rows of large sheets saved as csv, tsv, jsonl or vds, used only while no other threads are running (0 or 1 to format in the saving thread)')
+vd.option('save_shards', False, 'with save_workers, save csv, tsv and jsonl as one numbered file per worker, each with its own header')
+
+parallel_save_rows = 50000  # rows per part handed to each worker process
+parallel_save_timeout = 600  # seconds to wait for a worker to format a part
+_saving = None  # (sheet, formatRows) being saved, set only in each forked worker process by _initWorker
 
 @Sheet.api
 def safe_trdict(vs):
@@ -19,57 +31,211 @@ def safe_trdict(vs):
     return {}
 
 
+def _genericFormatter(col):
+    'Return function like ``col.formatValue``, with the type formatter and fmtstr looked up once.'
+    typeFormatter = vd.getType(col.type).formatter
+    fmtstr = col.fmtstr
+    encoding, errors = col.sheet.options.encoding, col.sheet.options.encoding_errors
+
+    def _format(typedval):
+        if isinstance(typedval, bytes):
+            typedval = typedval.decode(encoding, errors)
+        return typeFormatter(fmtstr, typedval)
+    return _format
+
+
+@Sheet.api
+def dispvalFunc(sheet, col, format=False):
+    'Return function of row to get the value of *col* to save: typed, and a formatted display string if *format*.'
+    safe_error = sheet.options.safe_error
+    getValue = col.getValue
+    coltype = col.type
+    fmt = None
+    if format:
+        formatter = col.formatter or sheet.options.disp_formatter
+        if formatter == 'generic' and coltype is not anytype:
+            fmt = _genericFormatter(col)
+        else:
+            fmt = getattr(col, 'formatter_'+formatter)(col._formatdict)
+    trdict = sheet.safe_trdict()
+    empty = '' if format else None
+
+    def _dispval(row):
+        try:
+            v = getValue(row)
+        except Exception as e:
+            vd.exceptionCaught(e)
+            v = safe_error or str(e)
+
+        if v is None:
+            return empty
+        if isinstance(v, TypedExceptionWrapper):
+            return safe_error or str(v)
+
+        try:
+            v = coltype(v)
+            if fmt and v is not None:
+                v = fmt(v)
+            if trdict and v is not None:
+                v = v.translate(trdict)
+        except Exception as e:
+            v = str(v)
+
+        return empty if v is None else v
+
+    return _dispval
+
+
+@Sheet.api
+def iterdispblocks(sheet, *cols, format=False, blocksize=10000, rows=None):
+    '''For each block of *blocksize* rows in sheet (or in *rows*), yield list of values for each of given *cols* (column-major).
+       Values are typed if format=False, or a formatted display string if format=True.'''
+    if not cols:
+        cols = sheet.visibleCols
+
+    funcs = [sheet.dispvalFunc(col, format=format) for col in cols]
+    if rows is None:
+        rows = sheet.rows
+    with Progress(total=len(rows)) as prog:
+        for i in range(0, len(rows), blocksize):
+            block = rows[i:i+blocksize]
+            yield [list(map(f, block)) for f in funcs]
+            prog.addProgress(len(block))
+
+
 @Sheet.api
 def iterdispvals(sheet, *cols, format=False):
     'For each row in sheet, yield OrderedDict of values for given cols.  Values are typed if format=False, or a formatted display string if format=True.'
     if not cols:
         cols = sheet.visibleCols
 
-    transformers = collections.OrderedDict()  # list of transformers for each column in order
-    for col in cols:
-        transformers[col] = [ col.type ]
-        if format:
-            formatMaker = getattr(col, 'formatter_'+(col.formatter or sheet.options.disp_formatter))
-            transformers[col].append(formatMaker(col._formatdict))
-        trdict = sheet.safe_trdict()
-        if trdict:
-            transformers[col].append(lambda v,trdict=trdict: v.translate(trdict))
-
-    options_safe_error = options.safe_error
-    for r in Progress(sheet.rows):
-        dispvals = collections.OrderedDict()  # [col] -> value
-        for col, transforms in transformers.items():
-            try:
-                dispval = col.getValue(r)
-
-            except Exception as e:
-                vd.exceptionCaught(e)
-                dispval = options_safe_error or str(e)
-
-            try:
-                for t in transforms:
-                    if dispval is None:
-                        break
-                    elif isinstance(dispval, TypedExceptionWrapper):
-                        dispval = options_safe_error or str(dispval)
-                        break
-                    else:
-                        dispval = t(dispval)
-
-                if dispval is None and format:
-                    dispval = ''
-            except Exception as e:
-                dispval = str(dispval)
-
-            dispvals[col] = dispval
-
-        yield dispvals
+    for block in sheet.iterdispblocks(*cols, format=format):
+        for vals in zip(*block):
+            yield collections.OrderedDict(zip(cols, vals))
 
 
 @Sheet.api
 def itervals(sheet, *cols, format=False):
-    for row in sheet.iterdispvals(*cols, format=format):
-        yield [row[c] for c in cols]
+    for block in sheet.iterdispblocks(*cols, format=format):
+        yield from map(list, zip(*block))
+
+@Sheet.api
+def saveWorkers(sheet):
+    'Return number of processes to format the rows of this sheet in for saving, or 0 to format them in the saving thread.'
+    nworkers = sheet.options.save_workers
+    if nworkers < 2 or len(sheet.rows) < 2*parallel_save_rows or 'fork' not in multiprocessing.get_all_start_methods():
+        return 0
+    # forking copies only the saving thread, so locks held by any other thread would stay locked in the workers
+    if any(t not in (threading.main_thread(), threading.current_thread()) for t in threading.enumerate()):
+        return 0
+    return nworkers
+
+
+class SaveWorkerError(Exception):
+    'Error while formatting rows in a save worker process.'
+
+
+def _initWorker(sheet, formatRows):
+    'Set the sheet being saved in a forked worker process.'
+    global _saving
+    _saving = (sheet, formatRows)
+
+
+def _formatPart(start, end):
+    'Return text of rows *start* to *end* of the sheet being saved, and stacktraces of errors caught while formatting them.  Run in a forked worker process.'
+    sheet, formatRows = _saving
+    nerrors = len(vd.lastErrors)
+    text = ''.join(formatRows(sheet, sheet.rows[start:end]))
+    return text, vd.lastErrors[nerrors:]
+
+
+def _reportWorkerErrors(traces):
+    'Add each of the worker stacktraces in *traces* to the errors of this process.'
+    for trace in traces:
+        try:
+            raise SaveWorkerError(trace[-1]) from SaveWorkerError('\n'.join(trace))
+        except SaveWorkerError as e:
+            vd.exceptionCaught(e)
+
+
+@Sheet.api
+def iterformatparts(sheet, formatRows, nworkers, nshards=1):
+    '''Generate (shardnum, text) for consecutive parts of rows, with text from generator *formatRows(sheet, rows)* joined in *nworkers* processes, and *shardnum* dividing rows into *nshards* about equal ranges.
+       The worker processes are forked, so that they have the sheet and its columns without pickling.
+       If a part takes longer than ``parallel_save_timeout`` seconds, the workers are stopped and the remaining parts are formatted in the saving thread.'''
+    nrows = len(sheet.rows)
+    starts = iter(range(0, nrows, parallel_save_rows))
+    nextrow = 0  # first row not yet yielded
+    with Progress(gerund='saving', total=nrows) as prog:
+        # each pool gets its own sheet through the forked initializer args, so that concurrent saves do not mix
+        with multiprocessing.get_context('fork').Pool(nworkers, initializer=_initWorker, initargs=(sheet, formatRows)) as pool:
+            def submit(start):
+                return pool.apply_async(_formatPart, (start, min(start+parallel_save_rows, nrows)))
+
+            # keep a bounded number of parts in flight, so formatted text does not pile up ahead of the writer
+            pending = collections.deque(submit(i) for i in itertools.islice(starts, nworkers*2))
+            while pending:
+                try:
+                    text, errors = pending.popleft().get(parallel_save_timeout)
+                except multiprocessing.TimeoutError:
+                    vd.warning(f'save worker took over {parallel_save_timeout}s; formatting the rest in this thread')
+                    break
+                _reportWorkerErrors(errors)
+                pending.extend(submit(i) for i in itertools.islice(starts, 1))
+                end = min(nextrow+parallel_save_rows, nrows)
+                yield nextrow*nshards//nrows, text
+                prog.addProgress(end-nextrow)
+                nextrow = end
+
+        for start in range(nextrow, nrows, parallel_save_rows):
+            end = min(start+parallel_save_rows, nrows)
+            yield start*nshards//nrows, ''.join(formatRows(sheet, sheet.rows[start:end]))
+            prog.addProgress(end-start)
+
+
+@Sheet.api
+def writeRows(sheet, fp, formatRows):
+    'Write text from generator *formatRows(sheet, rows)* for all rows to *fp*, formatting parts of rows in parallel if ``saveWorkers()``.  *rows* is None for all rows.'
+    nworkers = sheet.saveWorkers()
+    if nworkers:
+        for shardnum, text in sheet.iterformatparts(formatRows, nworkers):
+            fp.write(text)
+    else:
+        fp.writelines(formatRows(sheet, None))
+
+
+@VisiData.api
+def shardPath(vd, p, shardnum):
+    'Return Path for shard *shardnum* of *p*: numbered after its name, before its extensions.'
+    filename = os.path.basename(p.given)
+    return p.with_name(f'{p.name}-{shardnum:03d}{filename[len(p.name):]}')
+
+
+@VisiData.api
+def saveRows(vd, p, sheet, formatRows, header='', **kwargs):
+    '''Save *header* and then text from generator *formatRows(sheet, rows)* for all rows of *sheet* to *p*, opened with *kwargs*.
+       If ``options.save_shards`` and the rows are formatted in parallel, save to one numbered file per worker instead, each starting with *header*.'''
+    nworkers = sheet.saveWorkers() if sheet.options.save_shards else 0
+    if not nworkers:
+        with p.open_text(mode='w', **kwargs) as fp:
+            fp.write(header)
+            sheet.writeRows(fp, formatRows)
+        return
+
+    fp = None
+    try:
+        for shardnum, text in sheet.iterformatparts(formatRows, nworkers, nshards=nworkers):
+            if fp is None or shardnum != cur:
+                if fp:
+                    fp.close()
+                cur = shardnum
+                fp = vd.shardPath(p, shardnum).open_text(mode='w', **kwargs)
+                fp.write(header)
+            fp.write(text)
+    finally:
+        if fp:
+            fp.close()
+
 
 @BaseSheet.api
 def getDefaultSaveName(sheet):
@@ -168,9 +334,8 @@ def save_txt(vd, p, *vsheets):
         for vs in vsheets:
             unitsep = vs.options.delimiter
             rowsep = vs.options.row_delimiter
-            for dispvals in vs.iterdispvals(*vs.visibleCols, format=True):
-                fp.write(unitsep.join(dispvals.values()))
-                fp.write(rowsep)
+            for block in vs.iterdispblocks(*vs.visibleCols, format=True):
+                fp.writelines(unitsep.join(vals)+rowsep for vals in zip(*block))
     vd.status('%s save finished' % p)
 
 
@@ -1,8 +1,206 @@
 import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
 from visidata import vd, VisiData, BaseSheet, Sheet, Column, Progress, asyncthread, rotateRange
 
+vd.option('search_index_rows', 0, 'index display values in the background for columns searched on sheets with at least this many rows, so later regex searches only check rows that may match; 0 to never index')
+
 VisiData.init('searchContext', dict) # [(regex, columns, backward)] -> kwargs from previous search
 
+
+_quantifier = re.compile(r'\{(\d*,\d*|\d+)\}')  # otherwise { is a literal char
+
+
+def requiredLiterals(pattern):
+    'Return list of substrings (of 3 or more chars) which must be in any string matching regex *pattern*, or None if that cannot be told without parsing it fully.'
+    if '|' in pattern:
+        return None
+
+    runs = []
+    run = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == '\\':
+            c = pattern[i:i+1]
+            i += 1
+            if not c or c.isalnum():  # class like \d, anchor like \b, or backreference
+                runs.append(run)
+                run = ''
+                continue
+        elif c in '[(':  # stop at the first set or group; what came before is still required
+            break
+        elif c in '.^$':
+            runs.append(run)
+            run = ''
+            continue
+        elif c == '{':
+            m = _quantifier.match(pattern, i-1)
+            if m:  # previous char may not be there, or repeated
+                i = m.end()
+                runs.append(run[:-1])
+                run = ''
+                continue
+        elif c in '*?':  # previous char may not be there
+            runs.append(run[:-1])
+            run = ''
+            continue
+        elif c == '+':  # previous char is there, but maybe repeated
+            runs.append(run)
+            run = ''
+            continue
+        run += c
+
+    runs.append(run)
+    return [r for r in runs if len(r) >= 3] or None
+
+
+def isascii(s):
+    try:
+        s.encode('ascii')
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def trigrams(s):
+    return set(s[i:i+3] for i in range(len(s)-2))
+
+
+class SearchIndex:
+    '''Trigram index of the display values of *col*, to find the rows which may match a regex without formatting every row.
+       Values are lowercased, so the index also narrows case-insensitive searches.  Non-ASCII values are not indexed, and are always searched.
+       The index is dropped by ``Column.recalc``, and stops being used once any row of the sheet is added, removed, or changed.'''
+    def __init__(self, col):
+        self.col = col
+        self.sheet = col.sheet
+        self.rows = col.sheet.rows  # list being indexed; reloading replaces it
+        self.nrows = len(self.rows)
+        self.signature = (col.type, col.fmtstr, col.expr)
+        self.rowids = []  # position -> rowid
+        self.postings = defaultdict(lambda: array('L'))  # trigram -> ascending positions of values containing it
+        self.unindexed = array('L')  # positions of non-ASCII values
+        self.indexOf = {}  # rowid -> index into sheet.rows, as of the last search
+        self.ready = False
+        self.valid = True
+        self.sheet.rowListeners.add(self)
+
+    def sourceRowsAdded(self, sheet, rows):
+        self.valid = False
+
+    def sourceRowsRemoved(self, sheet, rows):
+        self.valid = False
+
+    def sourceCellChanged(self, sheet, col, row, oldval):
+        self.valid = False
+
+    def isCurrent(self):
+        'Return True if the index is complete and still matches the rows and display values of its column.'
+        col = self.col
+        return (self.ready and self.valid and getattr(col, '_searchIndex', None) is self and col.sheet is self.sheet
+                and self.sheet.rows is self.rows and len(self.rows) == self.nrows
+                and self.signature == (col.type, col.fmtstr, col.expr))
+
+    def build(self):
+        rows = list(self.rows)
+        rowid = self.sheet.rowid
+        with Progress(gerund='indexing', total=len(rows)) as prog:
+            for pos, row in enumerate(rows):
+                self.rowids.append(rowid(row))
+                s = self.col.getDisplayValue(row) or ''
+                if isascii(s):
+                    for t in trigrams(s.lower()):
+                        self.postings[t].append(pos)
+                else:
+                    self.unindexed.append(pos)
+                prog.addProgress(1)
+        self.nrows = len(rows)
+        self.ready = True
+
+    def candidates(self, literals):
+        'Return set of positions of values which may contain all of *literals* (case-insensitively).'
+        grams = set()
+        for lit in literals:
+            grams |= trigrams(lit.lower())
+        if not grams:
+            return None
+        postings = sorted((self.postings.get(t, ()) for t in grams), key=len)
+        ret = set(postings[0])
+        for p in postings[1:]:
+            if not ret:
+                break
+            ret.intersection_update(p)
+        ret.update(self.unindexed)
+        return ret
+
+    def rowIndexes(self, positions):
+        'Return sorted list of current indexes into sheet.rows of the rows at *positions*, or None if the rows are no longer the same.'
+        rows = self.sheet.rows
+        rowid = self.sheet.rowid
+        ret = []
+        for pos in positions:
+            rid = self.rowids[pos]
+            i = self.indexOf.get(rid)
+            if i is None or rowid(rows[i]) != rid:  # rows have been reordered
+                self.indexOf = {rowid(r): i for i, r in enumerate(rows)}
+                i = self.indexOf.get(rid)
+                if i is None:
+                    self.valid = False
+                    return None
+            ret.append(i)
+        ret.sort()
+        return ret
+
+
+@asyncthread
+def buildSearchIndex(index):
+    index.build()
+
+
+@Sheet.api
+def searchCandidates(sheet, regex, columns):
+    '''Return sorted list of indexes of rows which may match *regex* in any of *columns*, or None if every row must be searched.
+       Start indexing any of *columns* without a current index, if options.search_index_rows allows.'''
+    minrows = sheet.options.search_index_rows
+    if not minrows or len(sheet.rows) < minrows:
+        return None
+
+    indexes = []
+    for col in columns:
+        index = getattr(col, '_searchIndex', None)
+        if index is None or not index.valid or (index.ready and not index.isCurrent()):
+            index = col._searchIndex = SearchIndex(col)
+            buildSearchIndex(index)
+        indexes.append(index)
+
+    literals = None if regex.flags & re.VERBOSE else requiredLiterals(regex.pattern)
+    if not literals or not all(index.isCurrent() for index in indexes):
+        return None
+
+    idxs = set()
+    for index in indexes:
+        positions = index.candidates(literals)
+        rowidxs = None if positions is None else index.rowIndexes(positions)
+        if rowidxs is None:
+            return None
+        idxs.update(rowidxs)
+    return sorted(idxs)
+
+
+def rotateIndexes(idxs, idx, reverse=False):
+    'Like rotateRange, but only yield the sorted indexes in *idxs*.'
+    if reverse:
+        k = bisect_left(idxs, idx)
+        yield from reversed(idxs[:k])
+        yield from reversed(idxs[k:])
+    else:
+        k = bisect_right(idxs, idx)
+        yield from idxs[k:]
+        yield from idxs[:k]
+
 @VisiData.api
 @asyncthread
 def moveRegex(vd, sheet, *args, **kwargs):
@@ -42,8 +240,14 @@ def searchRegex(vd, sheet, moveCursor=False, reverse=False, **kwargs):
         if reverse:
             searchBackward = not searchBackward
 
+        candidates = sheet.searchCandidates(regex, columns)
+        if candidates is None:
+            rowidxs = rotateRange(len(sheet.rows), sheet.cursorRowIndex, reverse=searchBackward)
+        else:
+            rowidxs = rotateIndexes(candidates, sheet.cursorRowIndex, reverse=searchBackward)
+
         matchingRowIndexes = 0
-        for rowidx in rotateRange(len(sheet.rows), sheet.cursorRowIndex, reverse=searchBackward):
+        for rowidx in rowidxs:
             c = findMatchingColumn(sheet, sheet.rows[rowidx], columns, regex.search)
             if c:
                 if moveCursor:
@@ -1,9 +1,179 @@
-from visidata import vd, Sheet, Progress, asyncthread, options, rotateRange, Fanout, undoAttrCopyFunc, copy
+import itertools
+
+from visidata import vd, Sheet, Progress, asyncthread, options, rotateRange, Fanout, LazyRows
 
 vd.option('bulk_select_clear', False, 'clear selected rows before new bulk selections', replay=True)
 vd.option('some_selected_rows', False, 'if no rows selected, if True, someSelectedRows returns all rows; if False, fails')
 
-Sheet.init('_selectedRows', dict)  # rowid(row) -> row
+Sheet.init('_selectedRows', dict)  # rowid(row) -> row; or RowBitmap if sheet.selectionBitmap
+Sheet.init('_selectionUndo', lambda: None)  # SelectionUndo journaling changes to _selectedRows for the latest command
+
+_toggled = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+
+
+class RowBitmap:
+    '''Set of selected rows for sheets whose rows are their own rowids, as int handles into a store (see ``Sheet.selectionBitmap``).
+       One byte per handle, so that selecting, toggling and counting many rows runs in C (with numpy, if available, for arbitrary handles).
+       Negative handles, for rows added to an ``OverlayStore``, are kept in a set.
+       Supports the part of the dict interface (rowid -> row) used on ``_selectedRows``.'''
+    def __init__(self, bits=b'', extra=()):
+        self.bits = bytearray(bits)  # [handle] -> 1 if selected, else 0
+        self.extra = set(extra)      # selected negative handles
+        self._count = None
+
+    def copy(self):
+        return RowBitmap(self.bits, self.extra)
+
+    def __contains__(self, rowid):
+        if rowid < 0:
+            return rowid in self.extra
+        try:
+            return self.bits[rowid] == 1
+        except IndexError:
+            return False
+
+    def get(self, rowid, default=None):
+        return rowid if rowid in self else default
+
+    def __setitem__(self, rowid, row):
+        self._count = None
+        if rowid < 0:
+            self.extra.add(rowid)
+            return
+        self._grow(rowid+1)
+        self.bits[rowid] = 1
+
+    def __delitem__(self, rowid):
+        self.pop(rowid)
+
+    def pop(self, rowid, default=None):
+        if rowid not in self:
+            return default
+        self._count = None
+        if rowid < 0:
+            self.extra.discard(rowid)
+        else:
+            self.bits[rowid] = 0
+        return rowid
+
+    def __len__(self):
+        if self._count is None:
+            self._count = self.bits.count(1) + len(self.extra)
+        return self._count
+
+    def values(self):
+        'Generate selected handles, in order of addition.'
+        i = self.bits.find(1)
+        while i >= 0:
+            yield i
+            i = self.bits.find(1, i+1)
+        yield from sorted(self.extra, reverse=True)
+
+    def _grow(self, n):
+        if n > len(self.bits):
+            self.bits.extend(bytes(max(n, 2*len(self.bits))-len(self.bits)))
+
+    def update(self, rowids, val=1, journal=None):
+        '''Select the rows with *rowids* if *val* is 1, unselect them if 0, or toggle each of them if None.
+           Append (handles, former bits) of the changed handles to *journal*, if given, for ``restore``.'''
+        self._count = None
+        if isinstance(rowids, LazyRows) and not rowids.materialized:
+            rowids = range(1, len(rowids)+1)
+        if isinstance(rowids, range) and rowids.step == 1 and rowids.start >= 0:
+            a, b = rowids.start, rowids.stop
+            self._grow(b)
+            if journal is not None:
+                journal.append((range(a, b), bytes(self.bits[a:b])))
+            self.bits[a:b] = self.bits[a:b].translate(_toggled) if val is None else bytes([val])*(b-a)
+            return
+
+        try:
+            import numpy as np
+        except ImportError:
+            rowids = list(rowids)
+            if journal is not None:
+                journal.append((rowids, [int(rowid in self) for rowid in rowids]))
+            for rowid in rowids:
+                if val == 1 or (val is None and rowid not in self):
+                    self[rowid] = rowid
+                else:
+                    self.pop(rowid)
+            return
+
+        handles = np.fromiter(rowids, dtype=np.int64)
+        negatives = handles[handles < 0].tolist()
+        if journal is not None and negatives:
+            journal.append((negatives, [int(rowid in self.extra) for rowid in negatives]))
+        for rowid in negatives:
+            if val == 1 or (val is None and rowid not in self.extra):
+                self.extra.add(rowid)
+            else:
+                self.extra.discard(rowid)
+        handles = handles[handles >= 0]
+        if len(handles):
+            self._grow(int(handles.max())+1)
+            bits = np.frombuffer(self.bits, dtype=np.uint8)
+            if journal is not None:
+                journal.append((handles, bits[handles]))
+            if val is None:
+                bits[handles] ^= 1
+            else:
+                bits[handles] = val
+            del bits  # release the buffer, so the bytearray can grow again
+
+    def restore(self, journal):
+        'Undo the changes recorded in *journal* by ``update``, latest first.'
+        self._count = None
+        for handles, oldbits in reversed(journal):
+            if isinstance(handles, range):
+                self.bits[handles.start:handles.stop] = oldbits
+            elif isinstance(handles, list):
+                for rowid, bit in zip(handles, oldbits):
+                    if bit:
+                        self[rowid] = rowid
+                    else:
+                        self.pop(rowid)
+            else:  # numpy array
+                import numpy as np
+                bits = np.frombuffer(self.bits, dtype=np.uint8)
+                bits[handles] = oldbits
+                del bits
+
+    def selectedIn(self, rows, blocksize=65536):
+        'Generate the selected rows of *rows*, in order.'
+        if isinstance(rows, LazyRows) and not rows.materialized:  # handles 1..n in order
+            for rowid in self.values():
+                if 0 < rowid <= len(rows):
+                    yield rowid
+            return
+
+        try:
+            import numpy as np
+        except ImportError:
+            yield from (r for r in rows if r in self)
+            return
+
+        rows = iter(rows)
+        while True:
+            handles = np.fromiter(itertools.islice(rows, blocksize), dtype=np.int64)
+            if not len(handles):
+                return
+            bits = np.frombuffer(self.bits, dtype=np.uint8)
+            inbits = (handles >= 0) & (handles < len(bits))
+            selected = np.zeros(len(handles), dtype=bool)
+            selected[inbits] = bits[handles[inbits]] == 1
+            del bits
+            if self.extra:
+                selected |= np.isin(handles, list(self.extra))
+            yield from handles[selected].tolist()
+
+
+@Sheet.api
+def _checkSelection(self):
+    'Return ``_selectedRows`` for changing, first making it a RowBitmap if ``selectionBitmap`` is set (or a dict if not) while nothing is selected.'
+    if not self._selectedRows and self.selectionBitmap != isinstance(self._selectedRows, RowBitmap):
+        self._selectedRows = RowBitmap() if self.selectionBitmap else {}
+    return self._selectedRows
 
 @Sheet.api
 def isSelected(self, row):
@@ -15,6 +185,10 @@ def isSelected(self, row):
 def toggle(self, rows):
     'Toggle selection of given *rows*.  Async.'
     self.addUndoSelection()
+    sel = self._checkSelection()
+    if isinstance(sel, RowBitmap):
+        sel.update(rows, None, journal=self.selectionJournal())
+        return
     for r in Progress(rows, 'toggling', total=len(self.rows)):
         if not self.unselectRow(r):
             self.selectRow(r)
@@ -45,14 +219,20 @@ def unselect_row(self, row):
 @Sheet.api
 def selectRow(self, row):
     'Add *row* to set of selected rows.  May be called multiple times in one command.  Overrideable.'
-    self._selectedRows[self.rowid(row)] = row
+    rowid = self.rowid(row)
+    if self._selectionUndo:
+        self._selectionUndo.changing(self, rowid)
+    self._checkSelection()[rowid] = row
 
 
 @Sheet.api
 def unselectRow(self, row):
     'Remove *row* from set of selected rows.  Return True if row was previously selected.  Overrideable.'
-    if self.rowid(row) in self._selectedRows:
-        del self._selectedRows[self.rowid(row)]
+    rowid = self.rowid(row)
+    if rowid in self._selectedRows:
+        if self._selectionUndo:
+            self._selectionUndo.changing(self, rowid)
+        del self._selectedRows[rowid]
         return True
     else:
         return False
@@ -61,7 +241,7 @@ def unselectRow(self, row):
 def clearSelected(self):
     'Clear set of selected rows, without calling ``unselectRow`` for each one.'
     self.addUndoSelection()
-    self._selectedRows.clear()
+    self._selectedRows = {}  # new dict, so the undo can keep the old one as is
 
 @Sheet.api
 @asyncthread
@@ -71,8 +251,12 @@ def select(self, rows, status=True, progress=True):
     before = self.nSelectedRows
     if self.options.bulk_select_clear:
         self.clearSelected()
-    for r in (Progress(rows, 'selecting') if progress else rows):
-        self.selectRow(r)
+    sel = self._checkSelection()
+    if isinstance(sel, RowBitmap):
+        sel.update(rows, 1, journal=self.selectionJournal())
+    else:
+        for r in (Progress(rows, 'selecting') if progress else rows):
+            self.selectRow(r)
     if status:
         if options.bulk_select_clear:
             msg = 'selected %s %s%s' % (self.nSelectedRows, self.rowtype, ' instead' if before > 0 else '')
@@ -86,8 +270,11 @@ def unselect(self, rows, status=True, progress=True):
     "Remove *rows* from set of selected rows. Async. Don't show progress if *progress* is False; don't show status if *status* is False."
     self.addUndoSelection()
     before = self.nSelectedRows
-    for r in (Progress(rows, 'unselecting') if progress else rows):
-        self.unselectRow(r)
+    if isinstance(self._selectedRows, RowBitmap):
+        self._selectedRows.update(rows, 0, journal=self.selectionJournal())
+    else:
+        for r in (Progress(rows, 'unselecting') if progress else rows):
+            self.unselectRow(r)
     if status:
         vd.status('unselected %s/%s %s' % (before-self.nSelectedRows, before, self.rowtype))
 
@@ -117,7 +304,14 @@ def selectedRows(self):
     'List of selected rows in sheet order.'
     if self.nSelectedRows <= 1:
         return Fanout(self._selectedRows.values())
-    return Fanout((r for r in self.rows if self.rowid(r) in self._selectedRows))
+    return Fanout(self.iterSelectedRows())
+
+@Sheet.api
+def iterSelectedRows(self):
+    'Generate selected rows in sheet order.'
+    if isinstance(self._selectedRows, RowBitmap):
+        return self._selectedRows.selectedIn(self.rows)
+    return (r for r in self.rows if self.rowid(r) in self._selectedRows)
 
 @Sheet.property
 def onlySelectedRows(self):
@@ -154,9 +348,75 @@ def deleteSelected(self):
         vd.warning(f'deleted {ndeleted}, expected {nselected}')
 
 
+class SelectionUndo:
+    '''Undo function to restore the selection of *sheet* as of its creation.
+       Instead of a copy of all selected rows, keep the former state of only the rows whose selection changes.
+       For a RowBitmap, keep a journal of the handles changed in bulk and their former bits.'''
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.selected = sheet._selectedRows or None  # dict to put back into the sheet; None if nothing was selected
+        self.oldrows = {}  # rowid -> row if it was selected, else None
+        self.journal = [] if isinstance(self.selected, RowBitmap) else None  # [(handles, former bits)] for RowBitmap.restore
+        self.data = None   # UndoData of oldrows or journal, once no longer changing
+
+    def changing(self, sheet, rowid):
+        'Record the state of *rowid* before its first change.  Changes after ``_selectedRows`` is replaced need not be recorded.'
+        if sheet._selectedRows is not self.selected:
+            return
+        if self.journal is not None:
+            self.journal.append(([rowid], [int(rowid in self.selected)]))
+        elif rowid not in self.oldrows:
+            self.oldrows[rowid] = self.selected.get(rowid)
+
+    def journalFor(self, sheet):
+        'Return the journal to record bulk changes to the RowBitmap of *sheet* into, or None if they need not be recorded.'
+        if sheet._selectedRows is self.selected:
+            return self.journal
+
+    def close(self):
+        'Stop recording changes, and account for the memory of the changes recorded.'
+        if self.journal:
+            self.data = vd.undoStore.add(self.journal, nbytes=sum(len(bits)*(1 if isinstance(handles, range) else 9) for handles, bits in self.journal))
+            self.journal = None
+        elif self.oldrows:
+            self.data = vd.undoStore.add(self.oldrows, nbytes=100*len(self.oldrows))
+            self.oldrows = None
+
+    def __call__(self):
+        if self.sheet._selectionUndo is self:
+            self.sheet._selectionUndo = None
+        if self.selected is None:
+            self.sheet._selectedRows = {}
+            return
+        if isinstance(self.selected, RowBitmap):
+            self.selected.restore(self.journal if self.data is None else self.data.get())
+            self.sheet._selectedRows = self.selected
+            return
+        oldrows = self.oldrows if self.data is None else self.data.get()
+        for rowid, row in oldrows.items():
+            if row is None:
+                self.selected.pop(rowid, None)
+            else:
+                self.selected[rowid] = row
+        self.sheet._selectedRows = self.selected
+
+
+@Sheet.api
+def selectionJournal(sheet):
+    'Return the journal of the undo for the latest command, to record bulk changes to the RowBitmap selection into; or None.'
+    if sheet._selectionUndo:
+        return sheet._selectionUndo.journalFor(sheet)
+
+
 @Sheet.api
 def addUndoSelection(sheet):
-    vd.addUndo(undoAttrCopyFunc([sheet], '_selectedRows'))
+    if not options.undo:
+        return
+    undo = SelectionUndo(sheet)
+    if vd.addUndo(undo):
+        if sheet._selectionUndo:
+            sheet._selectionUndo.close()
+        sheet._selectionUndo = undo
 
 
 Sheet.addCommand('t', 'stoggle-row', 'toggle_row(cursorRow); cursorDown(1)', 'toggle selection of current row')
@@ -15,6 +15,17 @@ class SettingsMgr(collections.OrderedDict):
     def __init__(self):
         super().__init__()
         self.allobjs = {}
+        self.version = 0    # incremented by any change, to invalidate resolved settings
+        self.resolved = {}  # (key, objname(obj), type(obj)) -> setting resolved by _get() as of self.version
+        self.nlookups = 0   # number of calls to _get(), for profiling
+
+    def invalidate(self):
+        self.version += 1
+        self.resolved = {}
+
+    def __setitem__(self, k, v):
+        super().__setitem__(k, v)
+        self.invalidate()
 
     def objname(self, obj):
         if isinstance(obj, str):
@@ -40,12 +51,14 @@ class SettingsMgr(collections.OrderedDict):
         objstr = self.objname(obj)
         if objstr in self[k]:
             del self[k][objstr]
+            self.invalidate()
 
     def set(self, k, v, obj):
         'obj is a Sheet instance, or a Sheet [sub]class.  obj="global" means override default unless there is a sheet-specific override; obj="default" means last resort.'
         if k not in self:
             self[k] = dict()
         self[k][self.objname(obj)] = v
+        self.invalidate()
         return v
 
     def setdefault(self, k, v):
@@ -72,12 +85,25 @@ class SettingsMgr(collections.OrderedDict):
         return mappings
 
     def _get(self, key, obj=None):
+        'Return setting for *key* in the context of *obj*.  Resolve it through _mappings() only once until any setting changes.'
+        self.nlookups += 1
+        obj = obj or vd.activeSheet
+        ck = (key, self.objname(obj), type(obj))
+        resolved = self.resolved
+        if ck in resolved:
+            return resolved[ck]
+
+        version = self.version
+        v = None
         d = self.get(key, None)
         if d:
-            for m in self._mappings(obj or vd.activeSheet):
+            for m in self._mappings(obj):
                 v = d.get(m)
                 if v:
-                    return v
+                    break
+        if version == self.version:  # not changed by another thread meanwhile
+            resolved[ck] = v
+        return v
 
     def iter(self, obj=None):
         'Iterate through all keys considering context of obj. If obj is None, uses the context of the top sheet.'
@@ -124,7 +150,6 @@ class OptionsObject:
     'minimalist options framework'
     def __init__(self, mgr, obj=None):
         object.__setattr__(self, '_opts', mgr)
-        object.__setattr__(self, '_cache', {})
         object.__setattr__(self, '_obj', obj)
 
     def keys(self, obj=None):
@@ -133,15 +158,10 @@ class OptionsObject:
                 yield k
 
     def _get(self, k, obj=None):
-        'Return Option object for k in context of obj. Cache result until any set().'
-        opt = self._cache.get((k, obj or vd.activeSheet), None)
-        if opt is None:
-            opt = self._opts._get(k, obj)
-            self._cache[(k, obj or vd.activeSheet)] = opt
-        return opt
+        'Return Option object for k in context of obj.'
+        return self._opts._get(k, obj)
 
     def _set(self, k, v, obj=None, helpstr=''):
-        self._cache.clear()  # invalidate entire cache on any change
         return self._opts.set(k, Option(k, v, helpstr), obj)
 
     def is_set(self, k, obj=None):
@@ -211,7 +231,6 @@ class OptionsObject:
             vd.cmdlog.addRow(vd.cmdlog.newRow(sheet=objname, row=optname,
                             keystrokes='', input='',
                             longname='unset-option'))
-        self._cache.clear()  # invalidate entire cache on any change
         return v
 
     def setdefault(self, optname, value, helpstr):
@@ -1,23 +1,27 @@
+import ast
 import collections
+import functools
 import itertools
+import threading
 from copy import copy, deepcopy
 import textwrap
 
 from visidata import VisiData, Extensible, globalCommand, ColumnAttr, ColumnItem, vd, ENTER, EscapeException, drawcache, drawcache_property, LazyChainMap, asyncthread, ExpectedException, setitem
 from visidata import (options, Column, namedlist, SettableColumn,
 TypedExceptionWrapper, BaseSheet, UNLOADED,
-clipdraw, ColorAttr, update_attr, colors, undoAttrFunc, vlen)
+clipdraw, dispwidth, ColorAttr, update_attr, colors, undoAttrFunc, vlen)
 import visidata
 
 
 vd.activePane = 1   # pane numbering starts at 1; pane 0 means active pane
 
 
-__all__ = ['RowColorizer', 'CellColorizer', 'ColumnColorizer', 'Sheet', 'TableSheet', 'IndexSheet', 'SheetsSheet', 'LazyComputeRow', 'SequenceSheet']
+__all__ = ['RowColorizer', 'CellColorizer', 'ColumnColorizer', 'Sheet', 'TableSheet', 'IndexSheet', 'SheetsSheet', 'LazyComputeRow', 'SequenceSheet', 'ColumnStore', 'StoreColumn', 'LazyRows', 'OverlayStore']
 
 
 vd.option('default_width', 20, 'default column width', replay=True)   # TODO: make not replay and remove from markdown saver
 vd.option('default_height', 4, 'default column height')
+vd.option('col_width_sample', 1000, 'max number of rows to sample in the background when estimating auto widths of columns')
 vd.option('textwrap_cells', True, 'wordwrap text for multiline rows')
 
 vd.option('quitguard', False, 'confirm before quitting modified sheet')
@@ -25,6 +29,7 @@ vd.option('debug', False, 'exit on error and display stacktrace')
 vd.option('skip', 0, 'skip N rows before header', replay=True)
 vd.option('header', 1, 'parse first N rows as column names', replay=True)
 vd.option('load_lazy', False, 'load subsheets always (False) or lazily (True)')
+vd.option('load_columnar', False, 'store rows of sequence-based loaders in one list per column, with rows as int handles', replay=True)
 
 vd.option('force_256_colors', False, 'use 256 colors even if curses reports fewer')
 
@@ -157,6 +162,72 @@ class LazyComputeRow:
         self._usedcols.remove(c)
         return ret
 
+@functools.lru_cache(maxsize=256)
+def _parseExpr(expr):
+    'Return (ast, set of names loaded) for Python *expr*.'
+    tree = ast.parse(expr, mode='eval')
+    return tree, frozenset(n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load))
+
+
+class _ColumnRefs(ast.NodeTransformer):
+    'Replace loads of *colnames* with calls to ``__vdget__(colname)``, except where the name is bound by a lambda or comprehension.'
+    def __init__(self, colnames):
+        self.colnames = colnames
+        self.bound = set()
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in self.colnames and node.id not in self.bound:
+            call = ast.Call(func=ast.Name(id='__vdget__', ctx=ast.Load()), args=[ast.Constant(value=node.id)], keywords=[])
+            return ast.copy_location(call, node)
+        return node
+
+    def _visitBound(self, node, names, fields):
+        outer = self.bound
+        self.bound = outer | names
+        for f in fields:
+            setattr(node, f, self.visit(getattr(node, f)))
+        self.bound = outer
+        return node
+
+    def visit_Lambda(self, node):
+        node.args = self.visit(node.args)  # defaults are evaluated in the enclosing scope
+        return self._visitBound(node, {a.arg for a in ast.walk(node.args) if isinstance(a, ast.arg)}, ['body'])
+
+    def _visitComprehension(self, node, fields):
+        gens = node.generators
+        gens[0].iter = self.visit(gens[0].iter)  # the first iterable is evaluated in the enclosing scope
+        names = {n.id for g in gens for n in ast.walk(g.target) if isinstance(n, ast.Name)}
+        outer = self.bound
+        self.bound = outer | names
+        for i, g in enumerate(gens):
+            if i > 0:
+                g.iter = self.visit(g.iter)
+            g.ifs = [self.visit(x) for x in g.ifs]
+        for f in fields:
+            setattr(node, f, self.visit(getattr(node, f)))
+        self.bound = outer
+        return node
+
+    def visit_ListComp(self, node):
+        return self._visitComprehension(node, ['elt'])
+    visit_SetComp = visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        return self._visitComprehension(node, ['key', 'value'])
+
+
+@functools.lru_cache(maxsize=256)
+def _compileColumnRefs(expr, colnames):
+    'Return code object for *expr*, with references to *colnames* compiled as ``__vdget__`` calls.'
+    tree = _parseExpr(expr)[0]
+    if colnames:
+        tree = ast.fix_missing_locations(_ColumnRefs(colnames).visit(deepcopy(tree)))
+    return compile(tree, '<expr>', 'eval')
+
+
+_exprState = threading.local()  # .active: set of (column, rowid) being computed by compiled exprs in this thread
+
+
 class BasicRow(collections.defaultdict):
     def __init__(self, *args):
         collections.defaultdict.__init__(self, lambda: None)
@@ -362,6 +433,79 @@ class TableSheet(BaseSheet):
 
         return eval(expr, vd.getGlobals(), contexts)
 
+    def exprColumn(self, name, col=None):
+        'Return the column that *name* refers to in an expression evaluated for *col*, or None.  The expression column itself is skipped in favor of a later column of the same name.'
+        try:
+            i = self._ordered_colnames.index(name)
+            c = self._ordered_cols[i]
+            if c is col:
+                j = self._ordered_colnames[i+1:].index(name)
+                c = self._ordered_cols[i+j+1]
+            return c
+        except ValueError:
+            return None
+
+    def compileExpr(self, expr, col=None):
+        '''Return function(row) which evaluates Python *expr* like ``evalExpr(expr, row, col=col)``.
+           Names are resolved once: columns into direct getters, and other context names into values for the whole batch of rows evaluated with the returned function.'''
+        tree, names = _parseExpr(expr)
+        lcm = LazyComputeRow(self, None, col=col)._lcm
+        ctx = {}
+        colrefs = {}
+        rowname = False
+        for name in names:
+            c = self.exprColumn(name, col)
+            if c is None:
+                try:
+                    c = lcm[name]
+                except (KeyError, AttributeError):
+                    if name == 'sheet': c = self
+                    elif name == 'row': rowname = True; continue
+                    elif name == 'col': c = col
+                    else: continue  # from globals or builtins
+
+            if isinstance(c, Column):  # columns calc in the context of the row of the cell being calc'ed
+                colrefs[name] = c
+            else:
+                ctx[name] = c
+
+        code = _compileColumnRefs(expr, frozenset(colrefs))
+        glbls = vd.getGlobals()
+        rowid = self.rowid
+
+        def getColumnValue(name):
+            c = colrefs[name]
+            row = ctx['__vdrow__']
+            active = getattr(_exprState, 'active', None)
+            if active is None:
+                active = _exprState.active = set()
+            k = (c, rowid(row))
+            if k in active:
+                raise RecursiveExprException()
+            active.add(k)
+            try:
+                return c.getTypedValue(row)
+            finally:
+                active.discard(k)
+
+        ctx['__vdget__'] = getColumnValue
+
+        def evaluate(row):
+            prev = ctx.get('__vdrow__')
+            ctx['__vdrow__'] = row
+            if rowname:
+                ctx['row'] = row
+            try:
+                return eval(code, glbls, ctx)
+            finally:
+                ctx['__vdrow__'] = prev
+                if rowname:
+                    ctx['row'] = prev
+
+        return evaluate
+
+    selectionBitmap = False  # True if rows are their own rowids, as small int handles; then selection is kept in a RowBitmap
+
     def rowid(self, row):
         'Return a unique and stable hash of the *row* object.  Must be fast.  Overrideable.'
         return id(row)
@@ -618,15 +762,17 @@ class TableSheet(BaseSheet):
         self._visibleColLayout = {}
         x = 0
         vcolidx = 0
+        pending = []  # (col, capped) for columns without a width yet
         for vcolidx in range(0, self.nVisibleCols):
             col = self.visibleCols[vcolidx]
             if col.width is None and len(self.visibleRows) > 0:
-                vrows = self.visibleRows if self.nRows > 1000 else self.rows
-                # handle delayed column width-finding
-                col.width = max(col.getMaxWidth(vrows), minColWidth)
-                if vcolidx != self.nVisibleCols-1:  # let last column fill up the max width
-                    col.width = min(col.width, self.options.default_width)
-            width = col.width if col.width is not None else self.options.default_width
+                # handle delayed column width-finding: fit the header for now, and the values once they have been sampled
+                if col not in self._colWidthsPending:
+                    self._colWidthsPending.add(col)
+                    pending.append((col, vcolidx != self.nVisibleCols-1))  # let last column fill up the max width
+                width = min(max(dispwidth(col.name)+2, minColWidth), self.options.default_width)
+            else:
+                width = col.width if col.width is not None else self.options.default_width
             if col in self.keyCols:
                 width = max(width, 1)  # keycols must all be visible
             if col in self.keyCols or vcolidx >= self.leftVisibleColIndex:  # visible columns
@@ -637,6 +783,31 @@ class TableSheet(BaseSheet):
 
         self.rightVisibleColIndex = vcolidx
 
+        if pending:
+            self.estimateColWidths(pending, self.widthSampleRows())
+
+    def widthSampleRows(self):
+        'Return list of rows to estimate column widths from: all rows if few, otherwise the visible rows and an even sample of options.col_width_sample rows.'
+        n = self.options.col_width_sample
+        if self.nRows <= n:
+            return list(self.rows)
+        return list(self.visibleRows) + self.rows[::self.nRows//n]
+
+    @asyncthread
+    def estimateColWidths(self, cols, rows):
+        'Set width of each column in *cols*, a list of (col, capped), to fit its values in *rows*, unless set meanwhile.  Cap at options.default_width if *capped*.'
+        minColWidth = len(self.options.disp_more_left)+len(self.options.disp_more_right)+2
+        for col, capped in cols:
+            try:
+                if col.width is None:
+                    width = max(col.getMaxWidth(rows), minColWidth)
+                    if capped:
+                        width = min(width, self.options.default_width)
+                    if col.width is None:
+                        col.width = width
+            finally:
+                self._colWidthsPending.discard(col)
+
     def drawColHeader(self, scr, y, h, vcolidx):
         'Compose and draw column header for given vcolidx.'
         col = self.visibleCols[vcolidx]
@@ -728,6 +899,7 @@ class TableSheet(BaseSheet):
             'keysep': self.options.disp_keycol_sep,
             'selectednote': self.options.disp_selected_note,
             'disp_truncator': self.options.disp_truncator,
+            'prefetch': self.options.prefetch_workers > 0,
         }
 
         self._rowLayout = {}  # [rowidx] -> (y, height)
@@ -753,10 +925,12 @@ class TableSheet(BaseSheet):
 
             y += self.drawRow(scr, row, self.topRowIndex+rowidx, y, rowcattr, maxheight=self.windowHeight-y-1, **drawparams)
 
+        vd.cellPrefetcher.prefetch(self)
+
         if vcolidx+1 < self.nVisibleCols:
             scr.addstr(headerRow, self.windowWidth-2, self.options.disp_more_right, colors.color_column_sep)
 
-    def calc_height(self, row, displines=None, isNull=None):
+    def calc_height(self, row, displines=None, isNull=None, prefetch=False):
             if displines is None:
                 displines = {}  # [vcolidx] -> list of lines in that cell
 
@@ -766,7 +940,7 @@ class TableSheet(BaseSheet):
                     if vcolidx >= len(vcols):
                         continue
                     col = vcols[vcolidx]
-                    cellval = col.getCell(row)
+                    cellval = vd.cellPrefetcher.getCell(col, row) if prefetch else col.getCell(row)
                     if colwidth > 1 and vd.isNumeric(col):
                         cellval.display = cellval.display.rjust(colwidth-2)
 
@@ -800,7 +974,8 @@ class TableSheet(BaseSheet):
             colsep='',
             keysep='',
             selectednote='',
-            disp_truncator=''
+            disp_truncator='',
+            prefetch=False
        ):
             # sepattr is the attr between cell/columns
             sepcattr = update_attr(rowcattr, colors.color_column_sep, 1)
@@ -813,7 +988,7 @@ class TableSheet(BaseSheet):
                 basecellcattr = rowcattr
 
             displines = {}  # [vcolidx] -> list of lines in that cell
-            height = min(self.calc_height(row, displines), maxheight) or 1  # display even empty rows
+            height = min(self.calc_height(row, displines, prefetch=prefetch), maxheight) or 1  # display even empty rows
             self._rowLayout[rowidx] = (ybase, height)
 
             for vcolidx, (col, cellval, lines) in displines.items():
@@ -902,20 +1077,211 @@ vd.rowNoters = [
 Sheet = TableSheet  # deprecated in 2.0 but still widely used internally
 
 
+class ColumnStore:
+    '''Columnar backing store for sequence rows: one list of values per column.
+    Rows are int handles, indexing into every column list.  Slot 0 is unused, so that all handles are truthy.'''
+    def __init__(self, ncols=0):
+        self.data = [[None] for i in range(ncols)]  # [colidx] -> list of values, indexed by row handle
+        self.nrows = 0
+
+    @property
+    def ncols(self):
+        return len(self.data)
+
+    def addColumn(self):
+        'Add a new column filled with None for all existing rows.  Return its index.'
+        self.data.append([None]*(self.nrows+1))
+        return len(self.data)-1
+
+    def append(self, values):
+        'Append sequence of *values* as a new row.  Return its int handle.'
+        for i in range(len(self.data), len(values)):
+            self.addColumn()
+        for colvals, v in itertools.zip_longest(self.data, values):
+            colvals.append(v)
+        self.nrows += 1
+        return self.nrows
+
+    def get(self, row, colidx):
+        try:
+            return self.data[colidx][row]
+        except IndexError:
+            return None
+
+    def set(self, row, colidx, val):
+        while colidx >= len(self.data):
+            self.addColumn()
+        self.data[colidx][row] = val
+
+    def rowvalues(self, row):
+        'Return list of values for *row* handle.'
+        return [colvals[row] for colvals in self.data]
+
+
+class LazyRows:
+    '''Rows of a sheet backed by an ``OverlayStore``: int handles 1..n, where n may grow as the source is indexed.
+       Changing the rows in any way first turns them into a list of handles.'''
+    def __init__(self):
+        self.n = 0
+        self._list = None
+
+    def grow(self, n):
+        'Add handles for the next *n* rows.'
+        if self._list is not None:
+            self._list.extend(range(self.n+1, self.n+n+1))
+        self.n += n
+
+    @property
+    def materialized(self):
+        'True if the handles have been turned into a list, and so may no longer be in order 1..n.'
+        return self._list is not None
+
+    @property
+    def list(self):
+        if self._list is None:
+            self._list = list(range(1, self.n+1))
+        return self._list
+
+    def __len__(self):
+        return self.n if self._list is None else len(self._list)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        if self._list is None:
+            return iter(range(1, self.n+1))
+        return iter(self._list)
+
+    def __getitem__(self, i):
+        if self._list is None:
+            return range(1, self.n+1)[i] if isinstance(i, int) else list(range(1, self.n+1)[i])
+        return self._list[i]
+
+    def __contains__(self, row):
+        if self._list is None:
+            return row in range(1, self.n+1)
+        return row in self._list
+
+    def index(self, row, *args):
+        if self._list is None:
+            return range(1, self.n+1).index(row, *args)
+        return self._list.index(row, *args)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __copy__(self):
+        return list(self)
+
+
+def _materializing(name):
+    def _method(self, *args, **kwargs):
+        return getattr(self.list, name)(*args, **kwargs)
+    _method.__name__ = name
+    return _method
+
+for _name in '__setitem__ __delitem__ __iadd__ append extend insert pop remove sort reverse clear count copy'.split():
+    setattr(LazyRows, _name, _materializing(_name))
+
+
+class OverlayStore:
+    '''Base for row stores over read-only data, with int handles 1..n for the rows in the data.
+    Changed and added rows are kept in memory; added rows get negative handles, so they never collide with rows in the data.
+    Subclasses override ``baserow(row)`` to read the data, and may override ``baseget(row, colidx)`` to get a single value more cheaply.'''
+    def __init__(self, ncols=0):
+        self.ncols = ncols
+        self.edits = {}     # handle -> list of values, for changed or added rows
+        self.nadded = 0
+
+    def baserow(self, row):
+        'Return sequence of values in the data for *row* handle.  This base store has no data, only the rows added to it.'
+        return ()
+
+    def baseget(self, row, colidx):
+        try:
+            return self.baserow(row)[colidx]
+        except IndexError:
+            return None
+
+    def rowvalues(self, row):
+        'Return list of values for *row* handle.'
+        r = self.edits.get(row)
+        if r is None:
+            r = self.baserow(row)
+        return list(r) + [None]*(self.ncols-len(r))
+
+    def get(self, row, colidx):
+        r = self.edits.get(row)
+        if r is None:
+            return self.baseget(row, colidx)
+        try:
+            return r[colidx]
+        except IndexError:
+            return None
+
+    def set(self, row, colidx, val):
+        r = self.edits.get(row)
+        if r is None:
+            r = self.edits[row] = self.rowvalues(row)
+        while colidx >= len(r):
+            r.append(None)
+        self.ncols = max(self.ncols, colidx+1)
+        r[colidx] = val
+
+    def addColumn(self):
+        self.ncols += 1
+        return self.ncols-1
+
+    def append(self, values):
+        'Add a new row with *values*, kept in memory.  Return its (negative) handle.'
+        self.nadded += 1
+        self.edits[-self.nadded] = list(values)
+        self.ncols = max(self.ncols, len(values))
+        return -self.nadded
+
+
+class StoreColumn(ColumnItem):
+    'Column reading values for int row handles from ``sheet.columnStore``; *expr* is the column index into the store.'
+    def calcValue(self, row):
+        return self.sheet.columnStore.get(row, self.expr)
+
+    def putValue(self, row, val):
+        self.sheet.columnStore.set(row, self.expr, val)
+
+
 class SequenceSheet(Sheet):
-    'Sheets with ``ColumnItem`` columns, and rows that are Python sequences (list, namedtuple, etc).'
+    '''Sheets with ``ColumnItem`` columns, and rows that are Python sequences (list, namedtuple, etc).
+    If ``options.load_columnar`` is set when reloading, rows are instead int handles into ``columnStore``, and columns are ``StoreColumn``.'''
+    columnStore = None  # ColumnStore if loaded with options.load_columnar
+
+    def itemColumn(self, name, i):
+        'Return new column for the value at index *i* of each row.'
+        if self.columnStore is not None:
+            return StoreColumn(name, i)
+        return ColumnItem(name, i)
+
     def setCols(self, headerrows):
         self.columns = []
         for i, colnamelines in enumerate(itertools.zip_longest(*headerrows, fillvalue='')):
             colnamelines = ['' if c is None else c for c in colnamelines]
-            self.addColumn(ColumnItem(''.join(map(str, colnamelines)), i))
+            self.addColumn(self.itemColumn(''.join(map(str, colnamelines)), i))
 
         self._rowtype = namedlist('tsvobj', [(c.name or '_') for c in self.columns])
 
     def newRow(self):
+        if self.columnStore is not None:
+            return self.columnStore.append([])
         return self._rowtype()
 
     def addRow(self, row, index=None):
+        if self.columnStore is not None:
+            if not isinstance(row, int):
+                row = self.columnStore.append(row)
+            for i in range(len(self.columns), self.columnStore.ncols):  # no-op if already done
+                self.addColumn(StoreColumn('', i))
+            return super().addRow(row, index=index)
+
         for i in range(len(self.columns), len(row)):  # no-op if already done
             self.addColumn(ColumnItem('', i))
             self._rowtype = namedlist('tsvobj', [(c.name or '_') for c in self.columns])
@@ -923,6 +1289,36 @@ class SequenceSheet(Sheet):
             row = self._rowtype(row)
         super().addRow(row, index=index)
 
+    @property
+    def selectionBitmap(self):
+        return self.columnStore is not None
+
+    def rowid(self, row):
+        'Return the int handle for rows in ``columnStore``, which is already unique and stable.'
+        if self.columnStore is not None:
+            return row
+        return id(row)
+
+    def copyRow(self, row):
+        'Return an independent copy of *row*; for columnar rows, a new handle with the same values.'
+        if self.columnStore is not None:
+            return self.columnStore.append(self.columnStore.rowvalues(row) if isinstance(row, int) else list(row))
+        return deepcopy(row)
+
+    def copyRows(self, rows):
+        'Copy *rows* to the clipboard; columnar rows as lists of their values, since their handles are only valid in ``columnStore``.'
+        if self.columnStore is not None:
+            rows = [self.columnStore.rowvalues(r) if isinstance(r, int) else r for r in rows]
+        Sheet.copyRows(self, rows)
+
+    def paste_after(self, rowidx):
+        self.addRows([self.copyRow(r) for r in reversed(vd.memory.cliprows)], index=rowidx)
+
+    def async_deepcopy(self, rowlist):
+        if self.columnStore is None:
+            return Sheet.async_deepcopy(self, rowlist)
+        return [self.copyRow(r) for r in vd.Progress(rowlist, 'copying')]
+
     def optlines(self, it, optname):
         'Generate next options.<optname> elements from iterator with exceptions wrapped.'
         for i in range(self.options.getobj(optname, self)):
@@ -933,13 +1329,27 @@ class SequenceSheet(Sheet):
 
     @asyncthread
     def reload(self):
-        'Skip first options.skip rows; set columns from next options.header rows.'
+        'Skip first options.skip rows; set columns from next options.header rows.  If options.load_cache is set, reuse a snapshot of the rows if the source is unchanged, or else save one.'
+        if self.selectionBitmap:
+            self._selectedRows = {}  # selected handles would select other rows once reloaded
+        if not self.options.load_cache or not self.loadSnapshot():
+            self.loadRows()
+            if self.options.load_cache:
+                self.saveSnapshot()
+
+        # if an ordering has been specified, sort the sheet
+        if self._ordering:
+            vd.sync(self.sort())
 
+    def loadRows(self):
+        'Load rows and columns from iterload().'
         itsource = self.iterload()
 
         # skip the first options.skip rows
         list(self.optlines(itsource, 'skip'))
 
+        self.columnStore = ColumnStore() if self.options.load_columnar else None
+
         # use the next options.header rows as columns
         self.setCols(list(self.optlines(itsource, 'header')))
 
@@ -948,10 +1358,6 @@ class SequenceSheet(Sheet):
         for r in vd.Progress(itsource, gerund='loading', total=0):
             self.addRow(r)
 
-        # if an ordering has been specified, sort the sheet
-        if self._ordering:
-            vd.sync(self.sort())
-
 
 class IndexSheet(Sheet):
     'Base class for tabular sheets with rows that are Sheets.'
@@ -1155,6 +1561,7 @@ IndexSheet.options.skip = 0
 BaseSheet.init('pane', lambda: 1)
 
 Sheet.init('_ordering', list, copy=True)  # (col:Column, reverse:bool)
+Sheet.init('_colWidthsPending', set)  # columns whose widths are being estimated
 
 globalCommand('S', 'sheets-stack', 'vd.push(vd.sheetsSheet)', 'open Sheets Stack: join or jump between the active sheets on the current stack')
 globalCommand('gS', 'sheets-all', 'vd.push(vd.allSheetsSheet)', 'open Sheets Sheet: join or jump between all sheets from current session')
@@ -1,15 +1,17 @@
 from copy import copy
-from visidata import vd, asyncthread, Progress, Sheet, options, UNLOADED
+from visidata import vd, asyncthread, Progress, Sheet, options, UNLOADED, TypedWrapper, UndoPermutation
 
 @Sheet.api
 def orderBy(sheet, *cols, reverse=False):
     'Add *cols* to internal ordering and re-sort the rows accordingly.  Pass *reverse* as True to order these *cols* descending.  Pass empty *cols* (or cols[0] of None) to clear internal ordering.'
+    undoOrder = None
     if options.undo:
         vd.addUndo(setattr, sheet, '_ordering', copy(sheet._ordering))
         if sheet._ordering:
             vd.addUndo(sheet.sort)
         else:
-            vd.addUndo(setattr, sheet, 'rows', copy(sheet.rows))
+            undoOrder = UndoPermutation(sheet)  # instead of a copy of all rows
+            vd.addUndo(undoOrder)
 
     do_sort = False
     if not cols or cols[0] is None:
@@ -22,7 +24,10 @@ def orderBy(sheet, *cols, reverse=False):
         do_sort = True
 
     if do_sort:
-        sheet.sort()
+        if undoOrder:
+            sheet.sort(permuted=undoOrder.permuted)
+        else:
+            sheet.sort()
 
 class Reversor:
     def __init__(self, obj):
@@ -49,16 +54,79 @@ def sortkey(self, r, prog=None):
 
     return ret
 
+def numericArray(vals):
+    'Return a numpy array of *vals* if numpy is available and they are all exactly int or all exactly float, else None.'
+    if len(vals) < 2 or len(set(map(type, vals))) != 1 or type(vals[0]) not in (int, float):
+        return None
+    try:
+        import numpy
+        a = numpy.array(vals)
+    except (ImportError, OverflowError):
+        return None
+    return a if a.dtype.kind in 'iuf' else None
+
+
+def sortIndexes(order, vals, reverse=False):
+    '''Return the row indexes in *order*, stable-sorted by *vals* (indexed by row index).
+       Wrapped nulls and errors compare equal to each other and sort first, or last if *reverse*.'''
+    nulls = [i for i in order if isinstance(vals[i], TypedWrapper)]
+    rest = [i for i in order if not isinstance(vals[i], TypedWrapper)]
+
+    a = numericArray([vals[i] for i in rest])
+    if a is not None:
+        import numpy
+        if reverse:  # stable descending: ascending argsort of the reversed keys, mapped back
+            perm = len(a)-1 - numpy.argsort(a[::-1], kind='stable')[::-1]
+        else:
+            perm = numpy.argsort(a, kind='stable')
+        rest = numpy.asarray(rest)[perm].tolist()
+    else:
+        rest.sort(key=vals.__getitem__, reverse=reverse)  # list.sort is stable even when reversed
+
+    return rest+nulls if reverse else nulls+rest
+
+
+@Sheet.api
+def sortOrder(sheet, rows, prog=None):
+    '''Return list of indexes into *rows* in the order given by the sheet\'s internal ordering.  Each ordering column is evaluated once per row.
+       A column may sort with its own vectorized kernel, by providing ``sortIndexes(rows, order, reverse)`` that returns the sorted *order*, or None to fall back.'''
+    order = list(range(len(rows)))
+    # stable sort by each column, from least to most significant
+    for col, reverse in reversed(sheet._ordering):
+        if isinstance(col, str):
+            col = sheet.column(col)
+        kernel = getattr(col, 'sortIndexes', None)
+        sortedOrder = kernel(rows, order, reverse) if kernel else None
+        if sortedOrder is not None:
+            order = sortedOrder
+            if prog:
+                prog.addProgress(len(rows))
+            continue
+
+        vals = []
+        for i in range(0, len(rows), 10000):
+            batch = rows[i:i+10000]
+            vals.extend(col.getTypedValues(batch))
+            if prog:
+                prog.addProgress(len(batch))
+        order = sortIndexes(order, vals, reverse)
+    return order
+
+
 @Sheet.api
 @asyncthread
-def sort(self):
-    'Sort rows according to the current internal ordering.'
+def sort(self, permuted=None):
+    'Sort rows according to the current internal ordering.  If given, call *permuted(order)* with the former index of each row in the sorted order.'
     if self.rows is UNLOADED:
         return
     try:
-        with Progress(gerund='sorting', total=self.nRows) as prog:
-            # must not reassign self.rows: use .sort() instead of sorted()
-            self.rows.sort(key=lambda r,self=self,prog=prog: self.sortkey(r, prog=prog))
+        with Progress(gerund='sorting', total=self.nRows*len(self._ordering)) as prog:
+            rows = list(self.rows)
+            order = self.sortOrder(rows, prog=prog)
+            # must not reassign self.rows: replace contents in place instead
+            self.rows[:] = [rows[i] for i in order]
+            if permuted:
+                permuted(order)
     except TypeError as e:
         vd.warning('sort incomplete due to TypeError; change column type')
         vd.exceptionCaught(e, status=False)
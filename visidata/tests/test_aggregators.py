@@ -0,0 +1,54 @@
+import statistics
+
+import pytest
+
+from visidata import vd, Sheet, ColumnItem
+
+np = pytest.importorskip('numpy')
+
+
+def make_sheet():
+    vs = Sheet('nums', columns=[ColumnItem('i', 0, type=int), ColumnItem('f', 1, type=float)])
+    vs.rows = [[i*7 % 101, None if i % 10 == 0 else i/4] for i in range(1000)]
+    return vs
+
+
+class TestAggregatorEngine:
+    @pytest.mark.parametrize('colname', ['i', 'f'])
+    def test_matches_python(self, colname):
+        vs = make_sheet()
+        col = vs.column(colname)
+        vals = list(col.getValues(vs.rows))
+        assert vd.aggregatorEngine.valueSet(col, vs.rows).array is not None
+        assert vd.aggregators['min'](col, vs.rows) == min(vals)
+        assert vd.aggregators['sum'](col, vs.rows) == pytest.approx(sum(vals))
+        assert vd.aggregators['mean'](col, vs.rows) == pytest.approx(sum(vals)/len(vals))
+        assert vd.aggregators['stdev'](col, vs.rows) == pytest.approx(statistics.stdev(vals))
+        assert vd.aggregators['median'](col, vs.rows) == sorted(vals)[len(vals)//2]
+        assert vd.aggregators['count'](col, vs.rows) == len(vals)
+        assert [p(col, vs.rows) for p in vd.aggregators['q4']] == [vd.aggregators[k](col, vs.rows) for k in ('p25', 'p50', 'p75')]
+
+    def test_cached_until_changed(self):
+        vs = make_sheet()
+        col = vs.column('i')
+        assert vd.aggregators['max'](col, vs.rows) == 100
+        valueSet = vd.aggregatorEngine.valueSet(col, vs.rows)
+        assert vd.aggregators['max'] in valueSet.results
+
+        col.setValue(vs.rows[3], 1000)
+        assert vd.aggregators['max'](col, vs.rows) == 1000
+
+        vs.addRow([2000, 0.0])
+        assert vd.aggregators['max'](col, vs.rows) == 2000
+
+    def test_cleared(self):
+        vs = Sheet('s', columns=[ColumnItem('a', 0, type=int)], rows=[[i, i*2] for i in range(100)])
+        col = vs.column('a')
+        assert vd.aggregators['sum'](col, vs.rows) == 4950
+
+        col.expr = 1
+        assert vd.aggregators['sum'](col, vs.rows) == 9900
+
+        vs.rows[0][1] = 100  # changed without notifying
+        vd.clearCaches()
+        assert vd.aggregators['sum'](col, vs.rows) == 10000
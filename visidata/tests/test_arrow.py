@@ -0,0 +1,139 @@
+import pytest
+
+import visidata
+from visidata import vd
+from visidata.loaders.arrow import ArrowSheet
+from visidata.loaders.parquet import ParquetSheet
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+@pytest.fixture
+def parquet_sheet(tmp_path):
+    table = pa.table({
+        'name': ['b%d' % (i % 5) for i in range(3000)],
+        'n': [None if i % 17 == 0 else (i*7) % 100 for i in range(3000)],
+        'x': [i/3 for i in range(3000)],
+    })
+    p = tmp_path/'t.parquet'
+    pq.write_table(table, str(p), row_group_size=1000)
+    vs = ParquetSheet('t', source=visidata.Path(p))
+    vs.reload.__wrapped__(vs)
+    return vs
+
+
+class TestArrowSheet:
+    def test_rows_are_handles(self, parquet_sheet):
+        vs = parquet_sheet
+        assert isinstance(vs.rows, visidata.LazyRows) and len(vs.rows) == 3000
+        assert vs.rows[0] == 1
+        n = vs.column('n')
+        assert n.getValue(vs.rows[1]) == 7
+        assert n.getValue(vs.rows[0]) is None
+        assert n.getTypedValues(vs.rows[:3]) == [n.getTypedValue(r) for r in vs.rows[:3]]
+
+    @pytest.mark.parametrize('reverse', [False, True])
+    def test_sort_kernel(self, parquet_sheet, reverse):
+        vs = parquet_sheet
+        n, name = vs.column('n'), vs.column('name')
+        vs._ordering = [(name, False), (n, reverse)]
+        kernel = vs.sortOrder(list(vs.rows))
+        assert kernel != list(range(3000))
+
+        n.sortIndexes = lambda *args: None   # force the comparison in Python
+        name.sortIndexes = lambda *args: None
+        assert kernel == vs.sortOrder(list(vs.rows))
+
+    @pytest.mark.parametrize('sort', [False, True])
+    def test_freq_group_by(self, parquet_sheet, sort):
+        vs = parquet_sheet
+        name, n, x = vs.column('name'), vs.column('n'), vs.column('x')
+        if sort:
+            vs.rows = list(vs.rows)[::-1]
+        for cols in [[name, n], [x]]:
+            queried = visidata.FreqTableSheet(vs, *cols)
+            queried.reload.__wrapped__(queried)
+            assert vs.queryGroups(cols) is not None
+            vd.sync()
+            grouped = visidata.FreqTableSheet(vs, *cols)
+            vs.queryGroups = lambda cols: None
+            grouped.reload.__wrapped__(grouped)
+            vd.sync()
+            del vs.queryGroups
+            assert [(r.discrete_keys, r.sourcerows) for r in queried.rows] == [(r.discrete_keys, r.sourcerows) for r in grouped.rows]
+
+    def test_edit_add_save(self, parquet_sheet, tmp_path):
+        vs = parquet_sheet
+        n = vs.column('n')
+        n.setValue(vs.rows[2], 99)
+        row = vs.newRow()
+        vs.addRow(row)
+        n.setValue(row, 5)
+        assert n.getValue(vs.rows[2]) == 99
+        assert n.getTypedValues([vs.rows[2], row, vs.rows[3]]) == [99, 5, n.getTypedValue(vs.rows[3])]
+
+        out = tmp_path/'out.arrow'
+        vd.save_arrow(visidata.Path(out), vs)
+        saved = ArrowSheet('out', source=visidata.Path(out))
+        saved.reload.__wrapped__(saved)
+        assert len(saved.rows) == 3001
+        assert saved.column('n').getValue(saved.rows[2]) == 99
+
+    def test_save_unchanged(self, parquet_sheet, tmp_path):
+        vs = parquet_sheet
+        vs.column('x').hide()
+        vs.rows = list(reversed(vs.rows))
+        table = vs.arrowTable()
+        assert table.column_names == ['name', 'n']
+        assert table.column('n')[0].as_py() == vs.column('n').getValue(vs.rows[0])
+
+    def test_save_schema(self, tmp_path):
+        import datetime
+        table = pa.table({
+            'i': pa.array(range(100), type=pa.int32()),
+            't': pa.array([datetime.datetime(2020, 1, 1+i % 28) for i in range(100)], type=pa.timestamp('ms')),
+            's': ['v%d' % i for i in range(100)],
+        })
+        src = tmp_path/'src.arrow'
+        with pa.OSFile(str(src), 'wb') as fp:
+            with pa.ipc.new_file(fp, table.schema) as writer:
+                writer.write_table(table)
+
+        def saved_schema(vs, name):
+            out = tmp_path/name
+            vd.save_arrow(visidata.Path(out), vs)
+            with pa.OSFile(str(out), 'rb') as fp:
+                return pa.ipc.open_file(fp).read_all().schema
+
+        vs = ArrowSheet('src', source=visidata.Path(src))
+        vs.reload.__wrapped__(vs)
+        unchanged = saved_schema(vs, 'unchanged.arrow')
+        vs.column('i').setValue(vs.rows[0], 5)
+        assert unchanged == saved_schema(vs, 'edited.arrow') == table.schema
+
+        vs.column('i').setValue(vs.rows[0], 2**40)  # no longer fits int32
+        assert saved_schema(vs, 'widened.arrow').field('i').type == pa.int64()
+
+    def test_block_cache_per_column(self):
+        table = pa.table({'c%d' % i: list(range(5000)) for i in range(100)})
+        store = visidata.loaders.arrow.ArrowStore(table)
+        store.readValues = lambda colidx, start, n, read=store.readValues: reads.append(colidx) or read(colidx, start, n)
+        reads = []
+        for row in range(1, 1001):
+            assert store.baserow(row)[99] == row-1
+        assert len(reads) == 100
+
+    def test_column_projection(self, parquet_sheet):
+        vs = parquet_sheet
+        assert vs.column('n').getValue(vs.rows[2500]) == (2500*7) % 100
+        assert list(vs.columnStore.chunks) == [(2, 1)]   # only the row group and column needed
+
+    def test_filter_skips_row_groups(self, parquet_sheet):
+        vs = ParquetSheet('t', source=parquet_sheet.source)
+        vs.options.parquet_filter = "[('x', '>=', 900), ('name', '=', 'b1')]"
+        vs.reload.__wrapped__(vs)
+        assert len(vs.rows) == 60
+        assert vs.column('x').getValue(vs.rows[0]) == 2701/3
+        assert all(vs.column('name').getValue(r) == 'b1' for r in vs.rows)
+        assert {rgnum for rgnum, colidx in vs.columnStore.chunks} == {2}
@@ -0,0 +1,59 @@
+import pytest
+
+import visidata
+
+
+def cached_sheet(name, n):
+    vs = visidata.Sheet(name, columns=[visidata.Column('a', getter=lambda col,row: 'x'*1000+str(row), cache=True)])
+    vs.rows = list(range(n))
+    vs.columns[0].recalc(vs)
+    return vs
+
+
+class TestColumnCache:
+    def test_counters(self):
+        vs = cached_sheet('counted', 3)
+        col = vs.columns[0]
+        for r in vs.rows + vs.rows:
+            col.getValue(r)
+        cache = col._cachedValues
+        assert (cache.hits, cache.misses, len(cache)) == (3, 3, 3)
+        assert cache.nbytes > 3000
+
+        col.recalc()
+        assert len(cache) == 0 and cache.nbytes == 0
+
+    def test_evicts_lru_across_columns(self):
+        mgr = visidata.vd.cacheManager
+        visidata.vd.options.col_cache_max_mb = 1
+        visidata.vd.clearCaches()
+        try:
+            vs1 = cached_sheet('first', 2000)
+            vs2 = cached_sheet('second', 2000)
+            c1, c2 = vs1.columns[0], vs2.columns[0]
+            for r in vs1.rows[:500]:
+                c1.getValue(r)
+            for r in vs2.rows:
+                c2.getValue(r)
+                c1.getValue(vs1.rows[0])  # keep one entry of first column recently used
+
+            assert mgr.nbytes <= 2**20
+            assert vs1.rowid(vs1.rows[0]) in c1._cachedValues
+            assert c1._cachedValues.evictions > 0
+            assert c2.getValue(vs2.rows[-1]) == 'x'*1000+str(vs2.rows[-1])
+        finally:
+            visidata.vd.options.unset('col_cache_max_mb')
+            visidata.vd.clearCaches()
+
+    def test_released(self):
+        mgr = visidata.vd.cacheManager
+        vs = cached_sheet('released', 1000)
+        col = vs.columns[0]
+        for r in vs.rows:
+            col.getValue(r)
+        for i in range(3):
+            col.setCache(True)  # releases the previous cache
+            for r in vs.rows:
+                col.getValue(r)
+        assert len(mgr.lru) == sum(mgr.cacheEntries.values()) + mgr.nstale
+        assert mgr.nstale <= len(mgr.lru)//2
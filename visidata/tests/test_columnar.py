@@ -0,0 +1,65 @@
+import pkg_resources
+import pytest
+
+import visidata
+
+
+def load_sample(columnar):
+    sample_file = pkg_resources.resource_filename('visidata', 'tests/sample.tsv')
+    vs = visidata.TsvSheet('sample_columnar' if columnar else 'sample_rows', source=visidata.Path(sample_file))
+    vs.options.load_columnar = columnar
+    vs.reload.__wrapped__(vs)
+    return vs
+
+
+class TestColumnStore:
+    def test_same_values(self):
+        rowlists = load_sample(False)
+        columnar = load_sample(True)
+
+        assert columnar.columnStore is not None
+        assert all(isinstance(r, int) and r for r in columnar.rows)
+        assert [c.name for c in columnar.columns] == [c.name for c in rowlists.columns]
+        assert list(columnar.itervals(*columnar.visibleCols, format=True)) == list(rowlists.itervals(*rowlists.visibleCols, format=True))
+
+    def test_sort_select_edit(self):
+        vs = load_sample(True)
+        units = vs.column('Units')
+        units.type = int
+
+        vs.orderBy(units, reverse=True)
+        visidata.vd.sync()
+        vals = [units.getTypedValue(r) for r in vs.rows]
+        assert vals == sorted(vals, reverse=True)
+
+        vs.selectRow(vs.rows[0])
+        assert vs.isSelected(vs.rows[0])
+        assert not vs.isSelected(vs.rows[1])
+
+        units.setValue(vs.rows[1], 7)
+        assert units.getValue(vs.rows[1]) == 7
+
+        dup = vs.copyRow(vs.rows[1])
+        assert dup != vs.rows[1]
+        assert units.getValue(dup) == 7
+
+    def test_paste_elsewhere(self):
+        src = load_sample(True)
+        dest = load_sample(True)
+        dest.rows = dest.rows[5:]
+        src.copyRows(src.rows[:2])
+        dest.paste_after(0)
+        values = lambda vs, rows: [[c.getValue(r) for c in vs.visibleCols] for r in rows]
+        assert values(dest, dest.rows[1:3]) == values(src, src.rows[:2])
+
+        rowlists = load_sample(False)
+        rowlists.paste_after(0)
+        assert [list(r) for r in rowlists.rows[1:3]] == [src.columnStore.rowvalues(r) for r in src.rows[:2]]
+
+    def test_ragged_rows(self):
+        store = visidata.ColumnStore()
+        a = store.append(['x'])
+        b = store.append(['y', 'z'])
+        assert store.ncols == 2
+        assert store.rowvalues(a) == ['x', None]
+        assert store.rowvalues(b) == ['y', 'z']
@@ -73,8 +73,9 @@ inputLines = { 'save-sheet': 'jetsam.csv',  # save to some tmp file
 @pytest.mark.usefixtures('curses_setup')
 class TestCommands:
 
-    def test_baseCommands(self, mock_screen):
+    def test_baseCommands(self, mock_screen, tmp_path, monkeypatch):
         'exec each global command at least once'
+        monkeypatch.chdir(tmp_path)  # commands saving to default filenames write there
 
         cmdlist = visidata.vd.commands
 
@@ -0,0 +1,37 @@
+import io
+
+import pytest
+
+import visidata
+from visidata.loaders.csv import splitQuoted
+
+
+CSV_TEXT = 'name,note\n' + ''.join('row%d,"line one\nline ""%d"" two"\nplain%d,x\n' % (i, i, i) for i in range(200))
+
+
+def load_csv(path, nworkers):
+    vs = visidata.CsvSheet('parallel%d' % nworkers, source=visidata.Path(str(path)))
+    vs.options.load_workers = nworkers
+    vs.reload.__wrapped__(vs)
+    return vs
+
+
+class TestParallelCsv:
+    def test_split_outside_quotes(self):
+        data = CSV_TEXT.encode()
+        offsets = splitQuoted(io.BytesIO(data), len(data), 7)
+        assert offsets[0] == 0 and offsets[-1] == len(data)
+        assert offsets == sorted(set(offsets))
+        for off in offsets[1:-1]:
+            assert data[off-1:off] == b'\n'
+            assert data[:off].count(b'"') % 2 == 0
+
+    def test_same_rows(self, tmp_path):
+        path = tmp_path / 'quoted.csv'
+        path.write_text(CSV_TEXT)
+
+        serial = load_csv(path, 0)
+        parallel = load_csv(path, 3)
+        assert [c.name for c in parallel.columns] == ['name', 'note']
+        assert len(parallel.rows) == 400
+        assert parallel.rows == serial.rows
@@ -0,0 +1,60 @@
+import pytest
+
+from visidata import vd, Sheet, ColumnItem, DescribeSheet
+from visidata.describe import HyperLogLog, ValueCounts, ColumnStats
+
+
+def describe(src, **opts):
+    vs = DescribeSheet('describe', source=[src])
+    for k, v in opts.items():
+        vs.options[k] = v
+    vs.reload.__wrapped__(vs)
+    return {c.name: vs.describeData[c] for c in vs.rows}
+
+
+class TestDescribe:
+    def setup_method(self):
+        self.src = Sheet('src', columns=[ColumnItem('s', 0), ColumnItem('n', 1, type=int)])
+        self.src.rows = [['v%d' % (i % 50), None if i % 9 == 0 else str(i % 7) if i % 101 else 'x'] for i in range(3000)]
+
+    def test_exact(self):
+        d = describe(self.src)
+        assert len(d['s']['distinct']) == 50
+        assert d['s']['mode'] == 'v0'
+        assert len(d['n']['nulls']) == 334 and len(d['n']['errors']) == 26
+        assert (d['n']['min'], d['n']['max'], d['n']['median']) == (0, 6, 3)
+
+    def test_approximate(self):
+        exact = describe(self.src)
+        d = describe(self.src, describe_exact_rows=1000)
+        assert d['s']['distinct'] == pytest.approx(50, abs=2)
+        assert d['n']['mode'] == exact['n']['mode']
+        for k in ['min', 'max', 'sum', 'median']:
+            assert d['n'][k] == exact['n'][k]
+        assert d['n']['mean'] == pytest.approx(exact['n']['mean'])
+        assert d['n']['nulls'] == exact['n']['nulls']
+
+    def test_sampled_mean(self):
+        col = self.src.column('n')
+        st = ColumnStats(col, exact=False, nsample=10)
+        isNull = self.src.isNullFunc()
+        for r in self.src.rows:
+            st.add(r, isNull)
+        d = {}
+        st.describe(d, ['mean'])
+        vals = list(col.getValues(self.src.rows))
+        assert len(st.sample) == 10
+        assert d['mean'] == pytest.approx(sum(vals)/len(vals))
+
+
+def test_sketches():
+    hll = HyperLogLog()
+    for i in range(100000):
+        hll.add(i % 30000)
+        hll.add(str(i))
+    assert len(hll) == pytest.approx(130000, rel=0.03)
+
+    counts = ValueCounts(10)
+    for i in range(10000):
+        counts.add('common' if i % 3 == 0 else i)
+    assert counts.mode() == 'common'
@@ -0,0 +1,56 @@
+import pytest
+
+import visidata
+
+
+def make_sheet():
+    vs = visidata.Sheet('exprs', columns=[
+        visidata.ColumnItem('a', 0, type=int),
+        visidata.ColumnItem('b', 1),
+    ])
+    vs.rows = [[i, 'x%d' % i] for i in range(10)]
+    for c in vs.columns:
+        c.recalc(vs)
+    return vs
+
+
+class TestCompiledExpr:
+    @pytest.mark.parametrize('expr', [
+        'a*2',
+        'b.upper() + str(a)',
+        'len(row) + nRows',
+        '[a for a in range(3)]',
+        '(lambda a: a+1)(100)',
+        'a if a % 2 else None',
+    ])
+    def test_same_as_evalExpr(self, expr):
+        vs = make_sheet()
+        c = visidata.ExprColumn('c', expr=expr)
+        vs.addColumn(c)
+        expected = [visidata.wrapply(vs.evalExpr, c.compiledExpr, r, c) for r in vs.rows]
+        assert c.calcValues(vs.rows) == expected
+        assert [c.calcValue(r) for r in vs.rows] == expected
+
+    def test_self_named_column(self):
+        vs = make_sheet()
+        c = visidata.ExprColumn('a', expr='a+1')
+        vs.addColumn(c)
+        assert c.getTypedValues(vs.rows[:3]) == [1, 2, 3]
+
+    def test_recursive(self):
+        vs = make_sheet()
+        vs.addColumn(visidata.ExprColumn('d', expr='e+1'))
+        e = visidata.ExprColumn('e', expr='d+1')
+        vs.addColumn(e)
+        # the innermost reference fails as recursive, and the error is dropped by +1
+        assert e.getTypedValues(vs.rows[:2]) == [2, 2]
+        assert [e.getTypedValue(r) for r in vs.rows[:2]] == [2, 2]
+
+    def test_expr_changed(self):
+        vs = make_sheet()
+        c = visidata.ExprColumn('c', expr='a+1')
+        vs.addColumn(c)
+        assert c.calcValue(vs.rows[2]) == 3
+        c.expr = 'a*10'
+        assert c.calcValue(vs.rows[2]) == 20
+        assert eval(c.compiledExpr, {'a': 2}) == 20
@@ -0,0 +1,46 @@
+import pytest
+
+from visidata import vd, Sheet, ColumnItem
+from visidata.join import hashJoin
+
+
+def keyed_sheet(name, keys):
+    vs = Sheet(name, columns=[ColumnItem('key', 0), ColumnItem('n', 1)])
+    vs.rows = [[k, i] for i, k in enumerate(keys)]
+    vs.setKeys(vs.columns[:1])
+    vd.clearCaches()
+    return vs
+
+
+def joined(sheets, rows):
+    return [tuple(None if r[vs] is None else (vs.name, r[vs][1]) for vs in sheets) for r in rows]
+
+
+class TestHashJoin:
+    def setup_method(self):
+        self.a = keyed_sheet('a', 'xyxz')
+        self.b = keyed_sheet('b', 'xwx')
+        self.sheets = [self.a, self.b]
+
+    @pytest.mark.parametrize('probe', ['a', 'b'])
+    def test_jointypes(self, probe):
+        probe = dict(a=self.a, b=self.b)[probe]
+        x = [(('a', 0), ('b', 0)), (('a', 0), ('b', 2)), (('a', 2), ('b', 0)), (('a', 2), ('b', 2))]
+        y, z, w = [(('a', 1), None)], [(('a', 3), None)], [(None, ('b', 1))]
+
+        def join(jointype):
+            return joined(self.sheets, hashJoin(self.sheets, jointype, probe=probe)[0])
+
+        assert join('inner') == x
+        assert join('outer') == x+y+z
+        assert join('full') == x+y+z+w
+        assert join('diff') == y+z+w
+
+    def test_probe_largest(self):
+        big = keyed_sheet('big', [str(i%300) for i in range(30000)])
+        small = keyed_sheet('small', [str(i) for i in range(0, 300, 2)])
+        sheets = [big, small]
+        rows, indexes = hashJoin(sheets, 'outer')
+        assert joined(sheets, rows) == joined(sheets, hashJoin(sheets, 'outer', probe=small)[0])
+        assert len(rows) == 30000
+        assert list(indexes) == [small]
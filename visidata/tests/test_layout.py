@@ -0,0 +1,63 @@
+from visidata import vd, Sheet, ColumnItem
+
+
+class TestColWidths:
+    def test_estimated_in_background(self):
+        vs = Sheet('s', columns=[ColumnItem('a', 0), ColumnItem('b', 1)])
+        vs.rows = [['x'*(i%10), i] for i in range(5000)]
+        vs.options.col_width_sample = 100
+        vs.calcColLayout()
+        vd.sync()
+        assert [c.width for c in vs.columns] == [11, 6]
+
+        vs.columns[0].width = 3
+        vs.calcColLayout()
+        assert vs._visibleColLayout[0] == [0, 3]
+
+
+class TestPrefetch:
+    def test_slow_column_computed_ahead(self):
+        import time
+        from visidata import Column
+
+        def slow(col, row):
+            time.sleep(0.005)
+            return row[0]*k
+
+        k = 2
+        vs = Sheet('s', columns=[ColumnItem('a', 0), Column('b', getter=slow, width=5)])
+        vs.rows = [[i] for i in range(200)]
+        vs.options.prefetch_workers = 4
+        vs.calcColLayout()
+        b = vs.columns[1]
+        prefetcher = vd.cellPrefetcher
+        assert prefetcher.getCell(b, vs.rows[0]).value == 0   # computed while drawing, and timed
+
+        pending = prefetcher.getCell(b, vs.rows[1])
+        assert pending.value is None and pending.note == vs.options.note_pending
+
+        vs.topRowIndex = 50
+        prefetcher.prefetch(vs)
+        vd.sync()
+        n = vs.nScreenRows
+        assert set(prefetcher.cells[b]) == set(vs.rowid(r) for r in vs.rows[50-n:50+2*n])
+        assert prefetcher.getCell(b, vs.rows[60]).value == 120
+        assert b._cachedValues is None
+
+        vs.columns[0].setValue(vs.rows[60], 1)
+        assert vs.rowid(vs.rows[60]) not in prefetcher.cells[b]
+
+        k = 3
+        b.recalc()
+        assert b not in prefetcher.cells
+        assert prefetcher.getCell(b, vs.rows[61]).value == 183
+
+    def test_not_timed_without_workers(self):
+        from visidata import Column
+        vs = Sheet('s', columns=[Column('b', getter=lambda col, row: row[0])])
+        vs.rows = [[i] for i in range(10)]
+        vs.calcColLayout()
+        vs.calc_height(vs.rows[0])
+        assert vs.columns[0]._cellTime == 0
+        vs.calc_height(vs.rows[0], prefetch=True)
+        assert vs.columns[0]._cellTime > 0
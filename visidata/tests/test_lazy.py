@@ -0,0 +1,63 @@
+import pkg_resources
+import pytest
+
+import visidata
+
+
+def load_sample(lazy, readahead=1):
+    sample_file = pkg_resources.resource_filename('visidata', 'tests/sample.tsv')
+    vs = visidata.TsvSheet('sample_lazy' if lazy else 'sample_eager', source=visidata.Path(sample_file))
+    vs.options.tsv_lazy = lazy
+    vs.options.lazy_readahead_kb = readahead
+    vs.options.lazy_cache_blocks = 1
+    vs.reload.__wrapped__(vs)
+    return vs
+
+
+class TestLazyLoad:
+    def test_same_values(self):
+        eager = load_sample(False)
+        lazy = load_sample(True)
+
+        assert isinstance(lazy.rows, visidata.loaders.tsv.LazyRows)
+        assert len(lazy.columnStore.offsets) == 2
+        assert [c.name for c in lazy.columns] == [c.name for c in eager.columns]
+        assert list(lazy.itervals(*lazy.visibleCols, format=True)) == list(eager.itervals(*eager.visibleCols, format=True))
+        assert len(lazy.columnStore.blocks) == 1
+
+    def test_edit_sort_add(self):
+        vs = load_sample(True)
+        n = len(vs.rows)
+        units = vs.column('Units')
+        units.type = int
+
+        units.setValue(vs.rows[5], 1000)
+        vs.orderBy(units, reverse=True)
+        visidata.vd.sync()
+        assert units.getValue(vs.rows[0]) == 1000
+        assert isinstance(vs.rows.list, list)
+
+        vs.addRow(['2020-01-01', 'East', 'Nobody', 'Pencil', '1', '1.00', '1.00'])
+        assert len(vs.rows) == n+1
+        assert vs.rows[-1] < 0
+        assert vs.column('Rep').getValue(vs.rows[-1]) == 'Nobody'
+
+    def test_reload_clears_selection(self):
+        vs = load_sample(True)
+        vs.selectRow(vs.rows[3])
+        assert vs.nSelectedRows == 1
+        vs.reload.__wrapped__(vs)
+        assert vs.nSelectedRows == 0 and not any(vs.isSelected(r) for r in vs.rows)
+
+    @pytest.mark.parametrize('eol', ['\r', '\r\n', '\n'])
+    def test_line_endings(self, tmp_path, eol):
+        p = tmp_path/'eol.tsv'
+        p.write_bytes(eol.join(['a\tb'] + ['%d\tx%d' % (i, i) for i in range(300)] + ['', 'last\tz']).encode())
+        sheets = []
+        for lazy in [False, True]:
+            vs = visidata.TsvSheet('eol', source=visidata.Path(str(p)))
+            vs.options.tsv_lazy = lazy
+            vs.options.lazy_readahead_kb = 1
+            vs.reload.__wrapped__(vs)
+            sheets.append(list(vs.itervals(*vs.visibleCols)))
+        assert sheets[1] == sheets[0] and len(sheets[0]) == 301
@@ -0,0 +1,45 @@
+import time
+from array import array
+
+from visidata import vd, Sheet, ColumnItem
+from visidata.threads import estimateBytes, undoBytes
+
+
+class TestMemory:
+    def test_estimate(self):
+        rows = [[i, str(i)] for i in range(10000)]
+        est = estimateBytes(rows)
+        assert 0.5 < est / sum(estimateBytes(r) for r in rows) < 2
+        assert estimateBytes(array('q', range(1000))) >= 8000
+
+    def test_sheet_usage(self):
+        vs = Sheet('s', columns=[ColumnItem('a', 0, cache=True)], rows=[[i] for i in range(1000)])
+        col = vs.columns[0]
+        for r in vs.rows:
+            col.getValue(r)
+        usage = vs.memoryUsage()
+        assert usage['rows'] > 1000*56 and usage['caches'] > 0 and usage['undo'] == 0
+
+        data = vd.undoStore.add(array('q', range(1000)))
+        assert undoBytes(lambda: data.get(), (), {}) == 8000
+
+    def test_monitor(self):
+        mon = vd.memoryMonitor
+        mon.sample()
+        assert mon.nsamples >= 1
+        if mon.availMB is not None:
+            assert 0 <= mon.availMB <= mon.totalMB
+
+    def test_monitor_stops(self):
+        from visidata.threads import MemoryMonitor
+        mon = MemoryMonitor()
+        vd.options.min_memory_mb = 0
+        try:
+            mon.start()
+            for i in range(50):
+                if mon.thread is None:
+                    break
+                time.sleep(0.1)
+            assert mon.thread is None and mon.nsamples == 0
+        finally:
+            vd.options.unset('min_memory_mb')
@@ -0,0 +1,78 @@
+import pytest
+
+import visidata
+from visidata.pivot import PivotSheet
+
+
+def make_source(n=25000):
+    vs = visidata.Sheet('groupsrc', columns=[
+        visidata.ColumnItem('key', 0),
+        visidata.ColumnItem('num', 1, type=int),
+        visidata.ColumnItem('pivot', 2),
+    ])
+    vs.rows = [['k%d' % (i % 7), str(i % 13) if i % 101 else 'x', 'p%d' % (i % 3)] for i in range(n)]
+    return vs
+
+
+def group(source, *groupByCols):
+    vs = PivotSheet('groups', groupByCols, [source.column('pivot')], source=source)
+    vs.groupRows.__wrapped__(vs)
+    return [(r.discrete_keys, r.numeric_key, [id(x) for x in r.sourcerows], sorted((k, len(v)) for k, v in r.pivotrows.items())) for r in vs.rows]
+
+
+class TestGroupRows:
+    def test_groups(self):
+        src = make_source()
+        groups = group(src, src.column('key'))
+        assert [r[0] for r in groups] == [['k%d' % i] for i in range(7)]
+        assert sum(len(r[2]) for r in groups) == 25000
+        assert groups[1][2] == [id(r) for r in src.rows[1::7]]
+
+    def test_numeric_bins(self):
+        src = make_source()
+        src.options.numeric_binning = True
+        groups = group(src, src.column('key'), src.column('num'))
+        assert sum(len(r[2]) for r in groups) == 25000
+
+    def test_equal_keys_of_other_types(self):
+        src = make_source(0)
+        src.rows = [[k, '0', 'p'] for k in (1, True, 1.0, 1)]
+        assert [(r[0], len(r[2])) for r in group(src, src.column('key'))] == [([1], 2), ([True], 1), ([1.0], 1)]
+
+
+def summary(vs):
+    return sorted((tuple(r.discrete_keys), sorted(id(x) for x in r.sourcerows), sorted((k, len(v)) for k, v in r.pivotrows.items())) for r in vs.rows)
+
+
+class TestIncremental:
+    def test_source_changes(self):
+        src = make_source(1000)
+        key = src.column('key')
+        vs = PivotSheet('groups', [key], [src.column('pivot')], source=src)
+        vs.groupRows.__wrapped__(vs)
+        assert vs in src.rowListeners
+
+        key.setValue(src.rows[0], 'k1')          # move to another group
+        src.column('pivot').setValue(src.rows[1], 'p9')
+        key.setValue(src.rows[2], 'new')         # new group
+        src.addRows.__wrapped__(src, [['k3', '1', 'p0'], ['other', '2', 'p1']])
+        src.deleteBy(lambda r: r[0] == 'k5')     # whole group
+
+        fresh = PivotSheet('fresh', [key], [src.column('pivot')], source=src)
+        fresh.groupRows.__wrapped__(fresh)
+        assert summary(vs) == summary(fresh)
+        assert ['k5'] not in [r.discrete_keys for r in vs.rows]
+
+    def test_batched_changes(self):
+        src = make_source(1000)
+        key = src.column('key')
+        vs = PivotSheet('groups', [key], [src.column('pivot')], source=src)
+        vs.groupRows.__wrapped__(vs)
+        calls = []
+        vs.removeRowids = lambda rows, rowids, f=vs.removeRowids: calls.append(len(rowids)) or f(rows, rowids)
+        key.setValues.__wrapped__(key, src.rows[:300], 'k1', 'z')
+        assert len(calls) <= 7*2*4   # once per old group, not once per cell
+
+        fresh = PivotSheet('fresh', [key], [src.column('pivot')], source=src)
+        fresh.groupRows.__wrapped__(fresh)
+        assert summary(vs) == summary(fresh)
@@ -0,0 +1,62 @@
+import pytest
+
+from visidata import vd, ColumnItem
+from visidata.loaders.postgres import SQL, PgTable
+
+
+class MockCursor:
+    'Server-side cursor over *rows*, as far as PgTable uses it.'
+    def __init__(self, rows, fail_after=None):
+        self.rows = list(rows)
+        self.fail_after = fail_after  # raise KeyboardInterrupt after fetching this many rows
+        self.fetched = 0
+        self.closed = False
+
+    def fetchmany(self, n):
+        if self.fail_after is not None and self.fetched >= self.fail_after:
+            raise KeyboardInterrupt()
+        batch = self.rows[self.fetched:self.fetched+n]
+        self.fetched += len(batch)
+        return batch
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MockConnection:
+    def rollback(self):
+        raise AssertionError('transaction is shared by other sheets')
+
+
+class MockSQL(SQL):
+    def __init__(self, cursor):
+        super().__init__(MockConnection())
+        self.cursor = cursor
+
+    def cur(self, qstr):
+        return self.cursor
+
+
+class TestPgTable:
+    def test_batches(self, monkeypatch):
+        monkeypatch.setattr(vd, 'postgresGetColumns', lambda cur: [ColumnItem('a', 0), ColumnItem('b', 1)])
+        cur = MockCursor((i, str(i)) for i in range(25))
+        vs = PgTable('t', source='t', sql=MockSQL(cur))
+        vs.options.postgres_fetch_rows = 10
+        vs.reload.__wrapped__(vs)
+        assert vs.rows == [(i, str(i)) for i in range(25)]
+        assert cur.closed
+
+    def test_interrupted(self):
+        cur = MockCursor(range(25), fail_after=10)
+        batches = MockSQL(cur).iterbatches(cur, 10)
+        assert next(batches) == list(range(10))
+        with pytest.raises(KeyboardInterrupt):
+            next(batches)
+        assert cur.closed
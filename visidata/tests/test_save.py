@@ -0,0 +1,86 @@
+import pytest
+
+import visidata
+import visidata.save
+from visidata import vd, Sheet, ColumnItem, Column
+
+
+class TestSaveBlocks:
+    def test_blocks_match_rows(self, tmp_path):
+        vs = Sheet('s', columns=[ColumnItem('a', 0, type=int), ColumnItem('b', 1), Column('c', type=float, getter=lambda c, r: 1/int(r[0]))])
+        vs.rows = [[str(i), None if i % 3 else 'x%d' % i] for i in range(25)]
+        blocks = list(vs.iterdispblocks(format=True, blocksize=10))
+        assert [len(b[0]) for b in blocks] == [10, 10, 5]
+        assert blocks[0][0][:3] == ['0', '1', '2'] and blocks[0][1][:4] == ['x0', '', '', 'x3']
+        assert blocks[0][2][0] == vs.options.safe_error
+        assert list(vs.itervals(*vs.visibleCols, format=True)) == [list(vals) for b in blocks for vals in zip(*b)]
+
+        vd.save_csv(visidata.Path(tmp_path/'out.csv'), vs)
+        lines = (tmp_path/'out.csv').read_text().splitlines()
+        assert lines[0] == 'a,b,c' and lines[4] == '3,x3,0.33' and len(lines) == 26
+
+    @pytest.mark.parametrize('ext', ['csv', 'tsv', 'jsonl', 'vds'])
+    def test_parallel(self, tmp_path, monkeypatch, ext):
+        monkeypatch.setattr(visidata.save, 'parallel_save_rows', 100)
+        vs = Sheet('s', columns=[ColumnItem('a', 0, type=int), ColumnItem('b', 1)])
+        vs.rows = [[str(i), 'x%d' % i] for i in range(1050)]
+        save = getattr(vd, 'save_'+ext)
+        save(visidata.Path(tmp_path/('serial.'+ext)), vs)
+
+        vs.options.save_workers = 3
+        assert vs.saveWorkers() == 3
+        save(visidata.Path(tmp_path/('parallel.'+ext)), vs)
+        assert (tmp_path/('parallel.'+ext)).read_text() == (tmp_path/('serial.'+ext)).read_text()
+
+    def test_shards(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(visidata.save, 'parallel_save_rows', 100)
+        vs = Sheet('s', columns=[ColumnItem('a', 0)])
+        vs.rows = [[str(i)] for i in range(1000)]
+        vs.options.save_workers = 2
+        vs.options.save_shards = True
+        vd.save_tsv(visidata.Path(tmp_path/'out.tsv'), vs)
+        shards = [(tmp_path/f'out-{i:03d}.tsv').read_text().splitlines() for i in range(2)]
+        assert [s[:2] for s in shards] == [['a', '0'], ['a', '500']]
+        assert [len(s) for s in shards] == [501, 501]
+
+    def test_other_threads(self, monkeypatch):
+        import threading
+        monkeypatch.setattr(visidata.save, 'parallel_save_rows', 100)
+        vs = Sheet('s', columns=[ColumnItem('a', 0)])
+        vs.rows = [[str(i)] for i in range(1000)]
+        vs.options.save_workers = 2
+        assert vs.saveWorkers() == 2
+        stop = threading.Event()
+        t = threading.Thread(target=stop.wait)
+        t.start()
+        try:
+            assert vs.saveWorkers() == 0
+        finally:
+            stop.set()
+            t.join()
+
+    def test_worker_errors(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(visidata.save, 'parallel_save_rows', 100)
+        vs = Sheet('errors', columns=[Column('a', type=float, getter=lambda c, r: 1/r)])
+        vs.rows = list(range(1000))
+        vs.options.save_workers = 2
+        nerrors = len(vd.lastErrors)
+        vd.save_tsv(visidata.Path(tmp_path/'out.tsv'), vs)
+        assert (tmp_path/'out.tsv').read_text().splitlines()[1] == vs.options.safe_error
+        errors = vd.lastErrors[nerrors:]
+        assert len(errors) == 1 and 'ZeroDivisionError' in '\n'.join(errors[0])
+
+    def test_worker_timeout(self, tmp_path, monkeypatch):
+        import os, time
+        monkeypatch.setattr(visidata.save, 'parallel_save_rows', 100)
+        monkeypatch.setattr(visidata.save, 'parallel_save_timeout', 0.5)
+        pid = os.getpid()
+        def slowInWorker(col, row):
+            if row == 450 and os.getpid() != pid:
+                time.sleep(5)
+            return row
+        vs = Sheet('timeout', columns=[Column('a', type=int, getter=slowInWorker)])
+        vs.rows = list(range(1000))
+        vs.options.save_workers = 2
+        vd.save_tsv(visidata.Path(tmp_path/'out.tsv'), vs)
+        assert (tmp_path/'out.tsv').read_text().splitlines()[1:] == [str(r) for r in vs.rows]
@@ -0,0 +1,55 @@
+import re
+
+import pytest
+
+from visidata import vd, Sheet, ColumnItem
+from visidata.search import requiredLiterals
+
+
+@pytest.mark.parametrize('pattern, literals', [
+    ('apple', ['apple']),
+    ('ban.na', ['ban']),
+    ('cher?ry', ['che']),
+    ('foo\\.bar+', ['foo.bar']),
+    ('abcd[xy]efgh', ['abcd']),
+    ('kiwi|grape', None),
+    ('abc{2}defg', ['defg']),
+    ('abcd{,3}efg', ['abc', 'efg']),
+    ('ab{c}defg', ['ab{c}defg']),
+    ('^start$', ['start']),
+    ('x\\dyyy', ['yyy']),
+    ('wxyz+?abc', ['wxyz', 'abc']),
+    ('lime(ade)?', ['lime']),
+])
+def test_required_literals(pattern, literals):
+    assert requiredLiterals(pattern) == literals
+    for lit in literals or []:
+        for m in ['abccdefg', 'abcefg', 'ab{c}defg', 'start', 'x5yyy', 'wxyzzabc', 'limeade']:
+            if re.search(pattern, m):
+                assert lit in m
+
+
+class TestSearchIndex:
+    def setup_method(self):
+        words = ['apple', 'Banana', 'ſtrange', 'Ünïcode', 'pineapple', None]
+        self.vs = Sheet('s', columns=[ColumnItem('a', 0), ColumnItem('n', 1)])
+        self.vs.rows = [[words[i % len(words)], i] for i in range(300)]
+
+    def search(self, regex):
+        return list(vd.searchRegex(self.vs, regex=regex, columns='cursorCol', backward=False))
+
+    def test_same_as_scan(self):
+        patterns = ['apple', 'APPLE', 'STR', 'code', 'ban.na']
+        scanned = [self.search(p) for p in patterns]
+        self.vs.options.search_index_rows = 100
+        self.search('apple')
+        vd.sync()
+        assert self.vs.columns[0]._searchIndex.isCurrent()
+        assert [self.search(p) for p in patterns] == scanned
+
+        self.vs.rows.reverse()
+        assert self.search('apple') == [i for i, r in enumerate(self.vs.rows) if r[0] and 'apple' in r[0]]
+
+        self.vs.columns[0].setValue(self.vs.rows[0], 'crabapple')
+        assert not self.vs.columns[0]._searchIndex.isCurrent()
+        assert 0 in self.search('apple')
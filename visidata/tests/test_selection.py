@@ -0,0 +1,73 @@
+import pytest
+
+import visidata
+from visidata import vd, Sheet, ColumnItem, LazyRows
+from visidata.selection import RowBitmap
+
+
+class HandleSheet(Sheet):
+    selectionBitmap = True
+    def rowid(self, row):
+        return row
+
+
+class TestRowBitmap:
+    def setup_method(self):
+        self.vs = HandleSheet('h', columns=[ColumnItem('n', 0)])
+        self.vs.rows = LazyRows()
+        self.vs.rows.grow(1000)
+
+    def test_ranges(self):
+        vs = self.vs
+        vs.select.__wrapped__(vs, vs.rows)
+        assert isinstance(vs._selectedRows, RowBitmap) and vs.nSelectedRows == 1000
+        vs.toggle.__wrapped__(vs, range(1, 11))
+        vs.unselect.__wrapped__(vs, [20, 30])
+        assert vs.nSelectedRows == 988
+        assert not vs.isSelected(5) and not vs.isSelected(20) and vs.isSelected(11)
+        assert vs.selectedRows[:2] == [11, 12]
+
+    @pytest.mark.parametrize('numpy', [True, False])
+    def test_handles(self, monkeypatch, numpy):
+        if not numpy:
+            monkeypatch.setitem(__import__('sys').modules, 'numpy', None)
+        vs = self.vs
+        vs.rows = list(reversed(vs.rows)) + [-1, -2]
+        vs.select.__wrapped__(vs, [500, 3, -2, 2000], status=False)
+        vs.toggle.__wrapped__(vs, [3, 4, -1])
+        assert sorted(vs._selectedRows.values()) == [-2, -1, 4, 500, 2000]
+        assert list(vs.iterSelectedRows()) == [500, 4, -1, -2]
+
+    @pytest.mark.parametrize('numpy', [True, False])
+    def test_undo(self, monkeypatch, numpy):
+        if not numpy:
+            monkeypatch.setitem(__import__('sys').modules, 'numpy', None)
+        vs = self.vs
+        vs.selectRow(7)
+        vs._selectionUndo = undo = visidata.selection.SelectionUndo(vs)
+        monkeypatch.setattr(vs, 'addUndoSelection', lambda: None)  # record all into this undo
+        vs.select.__wrapped__(vs, range(1, 101))
+        vs.toggle.__wrapped__(vs, [7, 500, -3])
+        vs.unselectRow(8)
+        assert vs.nSelectedRows == 100
+        assert sum(len(bits) for handles, bits in undo.journal) == 104  # only the changed handles
+        undo.close()
+        undo()
+        assert list(vs.selectedRows) == [7]
+
+    def test_reload(self):
+        vs = visidata.TsvSheet('t', source=visidata.Path(__import__('pkg_resources').resource_filename('visidata', 'tests/sample.tsv')))
+        vs.options.load_columnar = True
+        vs.reload.__wrapped__(vs)
+        vs.select.__wrapped__(vs, vs.rows[:3])
+        assert vs.nSelectedRows == 3
+        vs.reload.__wrapped__(vs)
+        assert vs.nSelectedRows == 0
+
+
+def test_dict_backend():
+    vs = Sheet('s', columns=[ColumnItem('n', 0)], rows=[[i] for i in range(10)])
+    vs.select.__wrapped__(vs, vs.rows[2:5])
+    vs.toggle.__wrapped__(vs, vs.rows[:3])
+    assert type(vs._selectedRows) is dict
+    assert vs.selectedRows == [vs.rows[i] for i in (0, 1, 3, 4)]
@@ -0,0 +1,15 @@
+from visidata import vd, Sheet
+
+
+class TestOptionsCache:
+    def test_set_invalidates(self):
+        vs = Sheet('cached_opts')
+        assert vs.options.default_width == vd.options.default_width
+        n = vd._options.nlookups
+        vs.options.default_width = 5
+        assert vs.options.default_width == 5
+        assert vd._options.nlookups > n
+        assert Sheet('other').options.default_width == vd.options.default_width
+
+        vs.options.unset('default_width', obj=vs)
+        assert vs.options.default_width == vd.options.default_width
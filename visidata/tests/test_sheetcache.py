@@ -0,0 +1,67 @@
+import pkg_resources
+import pytest
+
+import visidata
+import visidata._sheetcache
+
+
+def load_sample(path, **opts):
+    vs = visidata.TsvSheet('sample_cached', source=visidata.Path(path))
+    vs.options.load_cache = True
+    for k, v in opts.items():
+        vs.options[k] = v
+    vs.reload.__wrapped__(vs)
+    return vs
+
+
+@pytest.fixture
+def sample(tmp_path, monkeypatch):
+    monkeypatch.setattr(visidata._sheetcache, 'snapshotDir', lambda: visidata.Path(tmp_path/'sheets'))
+    p = tmp_path/'sample.tsv'
+    p.write_bytes(open(pkg_resources.resource_filename('visidata', 'tests/sample.tsv'), 'rb').read())
+    return p
+
+
+class TestSheetCache:
+    def test_reload_from_snapshot(self, sample):
+        parsed = load_sample(sample)
+        assert not isinstance(parsed.columnStore, visidata.SnapshotStore)
+        assert parsed.snapshotPath().exists()
+
+        cached = load_sample(sample)
+        assert isinstance(cached.columnStore, visidata.SnapshotStore)
+        assert [c.name for c in cached.columns] == [c.name for c in parsed.columns]
+        assert list(cached.itervals(*cached.visibleCols, format=True)) == list(parsed.itervals(*parsed.visibleCols, format=True))
+
+        units = cached.column('Units')
+        units.setValue(cached.rows[0], '99')
+        assert units.getValue(cached.rows[0]) == '99'
+        assert units.getValue(cached.rows[1]) == parsed.column('Units').getValue(parsed.rows[1])
+
+    def test_key(self, sample):
+        load_sample(sample)
+        assert not isinstance(load_sample(sample, header=0).columnStore, visidata.SnapshotStore)
+
+        sample.write_text(sample.read_text() + 'x\ty\n')
+        changed = load_sample(sample)
+        assert not isinstance(changed.columnStore, visidata.SnapshotStore)
+        assert list(changed.rows[-1][:2]) == ['x', 'y']
+
+    def test_spilled(self, tmp_path):
+        rows = [['%d' % i, None if i % 3 else 'x'*(i % 50), '\u00e9'] for i in range(1000)]
+        path = tmp_path/'t.snapshot'
+        assert visidata._sheetcache.writeSnapshot(path, ['a', 'b'], 3, rows, bufsize=1000)
+        store = visidata.SnapshotStore(path)
+        assert store.names == ['a', 'b', ''] and store.nrows == 1000
+        assert [store.rowvalues(h) for h in range(1, 1001)] == rows
+        assert not visidata._sheetcache.writeSnapshot(tmp_path/'u.snapshot', ['a'], 1, [['x'], [1]])
+
+    def test_failed_write(self, tmp_path):
+        with pytest.raises(TypeError):  # column name not serializable to the json footer
+            visidata._sheetcache.writeSnapshot(tmp_path/'t.snapshot', [object()], 1, [['x']])
+        assert list(tmp_path.iterdir()) == []
+
+    def test_overlay(self):
+        store = visidata.OverlayStore()
+        h = store.append(['a', 'b'])
+        assert store.rowvalues(h) == ['a', 'b'] and store.get(1, 0) is None
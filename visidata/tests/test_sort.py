@@ -0,0 +1,39 @@
+import pkg_resources
+import pytest
+
+import visidata
+from visidata.sort import sortIndexes
+
+
+def load_sample():
+    sample_file = pkg_resources.resource_filename('visidata', 'tests/sample.tsv')
+    vs = visidata.TsvSheet('sample_sort', source=visidata.Path(sample_file))
+    vs.reload.__wrapped__(vs)
+    vs.column('Units').type = int
+    vs.column('Unit_Cost').type = float
+    return vs
+
+
+class TestSort:
+    @pytest.mark.parametrize('ordering', [
+        [('Region', False)],
+        [('Region', True), ('Units', False)],
+        [('Units', True), ('Rep', False)],
+        [('Unit_Cost', False), ('OrderDate', True)],
+    ])
+    def test_same_as_sortkey(self, ordering):
+        vs = load_sample()
+        vs.rows.append(['', 'West', '', 'x', None, None, None])  # null and error values
+        vs._ordering = [(vs.column(name), reverse) for name, reverse in ordering]
+
+        expected = sorted(vs.rows, key=vs.sortkey)
+        vs.sort.__wrapped__(vs)
+        assert vs.rows == expected
+
+    def test_nulls_and_stability(self):
+        w = visidata.TypedWrapper(int, None)
+        vals = [3, w, 1, 3, w, 1]
+        assert sortIndexes(range(6), vals) == [1, 4, 2, 5, 0, 3]
+        assert sortIndexes(range(6), vals, reverse=True) == [0, 3, 2, 5, 1, 4]
+        strs = ['b', 'a', 'b', w]
+        assert sortIndexes(range(4), strs, reverse=True) == [0, 2, 1, 3]
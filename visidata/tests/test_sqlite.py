@@ -0,0 +1,77 @@
+import sqlite3
+
+import pytest
+
+import visidata
+from visidata import vd, Sheet, FreqTableSheet
+from visidata.loaders.sqlite import SqliteIndexSheet
+
+
+def load_table(tmp_path, create, rows):
+    p = tmp_path/'t.db'
+    con = sqlite3.connect(str(p))
+    con.execute(create)
+    con.executemany('INSERT INTO t VALUES (%s)' % ', '.join('?'*len(rows[0])), rows)
+    con.commit()
+    con.close()
+
+    idx = SqliteIndexSheet('t', source=visidata.Path(p))
+    idx.reload.__wrapped__(idx)
+    vd.sync()
+    vs = idx.rows[0]
+    vs.reload.__wrapped__(vs)
+    vd.sync()
+    return vs
+
+
+@pytest.fixture
+def table_sheet(tmp_path):
+    return load_table(tmp_path, 'CREATE TABLE t (name TEXT COLLATE NOCASE, n INTEGER)',
+                      [(['a', 'B', 'b', None, ''][i%5], [3, 1, None, 2][i%4]) for i in range(100)])
+
+
+class TestSqlitePushdown:
+    def test_sort(self, table_sheet):
+        vs = table_sheet
+        vs._ordering = [(vs.column('name'), False), (vs.column('n'), True)]
+        assert vs.sortOrder(vs.rows) == Sheet.sortOrder(vs, vs.rows)
+
+    def test_select(self, table_sheet):
+        vs = table_sheet
+        name = vs.column('name')
+        for v in ['b', '']:
+            assert list(vs.gatherEqual(name, v, v)) == [r for r in vs.rows if name.getDisplayValue(r) == v]
+
+        vs.cursorVisibleColIndex = vs.visibleCols.index(name)
+        assert vs.regexRowIndexes('b') == [i for i, r in enumerate(vs.rows) if name.getDisplayValue(r) in ('b', 'B')]
+        assert vs.regexRowIndexes('^$') == [i for i, r in enumerate(vs.rows) if not name.getDisplayValue(r)]
+
+    def test_freq(self, table_sheet):
+        vs = table_sheet
+        name, n = vs.column('name'), vs.column('n')
+        queried = FreqTableSheet(vs, name, n)
+        queried.reload.__wrapped__(queried)
+        vs.queryGroups = lambda cols: None
+        grouped = FreqTableSheet(vs, name, n)
+        grouped.reload.__wrapped__(grouped)
+        vd.sync()
+        assert [r.sourcerows for r in queried.rows] == [r.sourcerows for r in grouped.rows]
+
+    def test_untyped(self, tmp_path):
+        vs = load_table(tmp_path, 'CREATE TABLE t (x)', [(v,) for v in [10, '10', 'a', 9, '9', 2.5]*3])
+        x = vs.column('x')
+        vs._ordering = [(x, False)]
+        with pytest.raises(TypeError):  # sorted like Python would, not by sqlite storage class
+            vs.sortOrder(vs.rows)
+        assert list(vs.gatherEqual(x, 10, '10')) == [r for r in vs.rows if x.getDisplayValue(r) == '10']
+
+    @pytest.mark.parametrize('decltype', ['', 'REAL', 'NUMERIC'])
+    def test_not_text_or_int(self, tmp_path, decltype):
+        vs = load_table(tmp_path, 'CREATE TABLE t (x %s)' % decltype, [(v,) for v in [1, 1.0, 2.5, 1]])
+        x = vs.column('x')
+        vs.cursorVisibleColIndex = vs.visibleCols.index(x)
+        def noQuery(*args):
+            assert False, 'queried sqlite'
+        vs.queryRowIndexes = noQuery
+        assert vs.queryGroups([x]) is None
+        assert vs.regexRowIndexes('2') == [2]
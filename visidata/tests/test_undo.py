@@ -0,0 +1,52 @@
+from array import array
+
+from visidata import vd, Sheet, ColumnItem, UndoPermutation, UndoStore
+from visidata.selection import SelectionUndo
+
+
+class TestUndo:
+    def setup_method(self):
+        self.vs = Sheet('s', columns=[ColumnItem('a', 0, type=int)])
+        self.vs.rows = [[i] for i in (3, 1, 2, 0)]
+
+    def test_permutation(self):
+        vs = self.vs
+        oldrows = list(vs.rows)
+        undo = UndoPermutation(vs)
+        vs._ordering = [(vs.columns[0], False)]
+        vs.sort.__wrapped__(vs, permuted=undo.permuted)
+        assert [r[0] for r in vs.rows] == [0, 1, 2, 3]
+        undo()
+        assert all(a is b for a, b in zip(vs.rows, oldrows))
+
+    def test_selection(self):
+        vs = self.vs
+        vs.selectRow(vs.rows[0])
+        vs.selectRow(vs.rows[1])
+        vs._selectionUndo = undo = SelectionUndo(vs)
+        vs.unselectRow(vs.rows[0])
+        vs.selectRow(vs.rows[2])
+        assert len(undo.oldrows) == 2
+        vs.clearSelected()
+        vs.selectRow(vs.rows[3])
+        undo.close()
+        undo()
+        assert [vs.isSelected(r) for r in vs.rows] == [True, True, False, False]
+
+    def test_budget(self):
+        vd.options.undo_max_mb = 1
+        store = UndoStore()
+        obj = store.add([], nbytes=2**19)
+        big = store.add(array('L', range(2**17)))
+        assert store.ndropped == 1 and obj.dropped
+        store.add(array('L', range(2**17)))
+        assert store.nspilled == 1 and big.data is None
+        assert big.get()[-1] == 2**17-1
+        vd.options.undo_max_mb = 512
+
+    def test_release_while_locked(self):
+        store = UndoStore()
+        data = store.add(array('L', range(100)))
+        with store.lock:  # as when garbage collection during add() finalizes other UndoData
+            del data
+        assert store.nbytes == 0 and not store.entries
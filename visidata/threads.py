@@ -5,6 +5,9 @@ import functools
 import cProfile
 import threading
 import collections
+import itertools
+import sys
+from array import array
 
 from visidata import VisiData, vd, options, globalCommand, Sheet, EscapeException
 from visidata import ColumnAttr, Column
@@ -13,6 +16,7 @@ from visidata import *
 
 vd.option('profile', False, 'enable profiling on threads')
 vd.option('min_memory_mb', 0, 'minimum memory to continue loading and async processing')
+vd.option('memory_sample_s', 1.0, 'seconds between samples of available memory, while min_memory_mb is set')
 
 vd.option('color_working', 'green', 'color of system running smoothly')
 
@@ -113,6 +117,62 @@ def elapsed_s(t):
     return (t.endTime or time.process_time())-t.startTime
 
 
+def readMeminfo():
+    'Return (total, available) MB of system memory from /proc/meminfo, or (None, None) if not available.'
+    try:
+        with open('/proc/meminfo') as fp:
+            kb = {k: int(v.split()[0]) for k, v in (line.split(':', 1) for line in fp)}
+    except (OSError, ValueError):
+        return None, None
+    avail = kb.get('MemAvailable')
+    if avail is None:  # before Linux 3.14
+        avail = kb.get('MemFree', 0) + kb.get('Buffers', 0) + kb.get('Cached', 0)
+    return kb.get('MemTotal', 0)//1024, avail//1024
+
+
+def readRss():
+    'Return MB of memory resident for this process, from /proc/self/statm, or None if not available.'
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1])*os.sysconf('SC_PAGE_SIZE')//2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryMonitor:
+    'Sample available system memory and resident memory of this process on a background thread, so that the status bar never waits on them.'
+    def __init__(self):
+        self.totalMB = None
+        self.availMB = None
+        self.rssMB = None
+        self.nsamples = 0
+        self.stoppedAt = None  # nsamples when threads were last stopped for lack of memory
+        self.thread = None
+
+    def sample(self):
+        self.totalMB, self.availMB = readMeminfo()
+        self.rssMB = readRss()
+        self.nsamples += 1
+
+    def start(self):
+        'Start sampling every options.memory_sample_s, if not already.'
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._sampleLoop, daemon=True, name='memory_monitor')
+            self.thread.start()
+
+    def _sampleLoop(self):
+        'Sample until options.min_memory_mb is 0; ``start`` starts sampling again if it is set later.'
+        while vd.options.min_memory_mb:
+            self.sample()
+            time.sleep(vd.options.memory_sample_s)
+        self.thread = None
+
+
+@VisiData.lazy_property
+def memoryMonitor(vd):
+    return MemoryMonitor()
+
+
 @VisiData.api
 def checkMemoryUsage(vd):
     min_mem = options.min_memory_mb
@@ -122,24 +182,119 @@ def checkMemoryUsage(vd):
     ret = ''
     attr = 'color_working'
     if min_mem:
-        try:
-            freestats = subprocess.run('free --total --mega'.split(), check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout.strip().splitlines()
-        except FileNotFoundError as e:
-            if options.debug:
-                vd.exceptionCaught(e)
-            options.min_memory_mb = 0
-            vd.warning('disabling min_memory_mb: "free" not installed')
-            return '', attr
-        tot_m, used_m, free_m = map(int, freestats[-1].split()[1:])
-        ret = '[%dMB] ' % free_m + ret
-        if free_m < min_mem:
+        mon = vd.memoryMonitor
+        mon.start()
+        if mon.availMB is None:
+            if mon.nsamples:
+                options.min_memory_mb = 0
+                vd.warning('disabling min_memory_mb: /proc/meminfo not available')
+            return ret, attr
+        ret = '[%dMB] ' % mon.availMB + ret
+        if mon.availMB < min_mem:
             attr = 'color_warning'
-            vd.warning('%dMB free < %dMB minimum, stopping threads' % (free_m, min_mem))
-            vd.cancelThread(*vd.unfinishedThreads)
-            curses.flash()
+            # after stopping threads, give memory a sample to be released before stopping any more
+            if mon.stoppedAt is None or mon.nsamples > mon.stoppedAt+1:
+                mon.stoppedAt = mon.nsamples
+                threads = vd.memoryHogThreads()
+                vd.warning('%dMB free < %dMB minimum, stopping %s threads' % (mon.availMB, min_mem, len(threads)))
+                vd.cancelThread(*threads)
+                curses.flash()
     return ret, attr
 
 
+@VisiData.api
+def memoryHogThreads(vd):
+    'Return the unfinished threads of the sheet using the most memory among sheets with unfinished threads.'
+    sheets = set(t.sheet for t in vd.unfinishedThreads if getattr(t, 'sheet', None) and not getattr(t, 'noblock', False))
+    if not sheets:
+        return []
+    vs = max(sheets, key=lambda vs: sum(vs.memoryUsage().values()))
+    return [t for t in vs.currentThreads if t.endTime is None]
+
+
+def estimateBytes(obj, nsamples=100, depth=3):
+    'Return estimated bytes used by *obj* and the objects in it, to *depth* levels.  Only *nsamples* of the items in larger containers are measured.'
+    n = sys.getsizeof(obj)
+    nbytes = getattr(obj, 'nbytes', None)  # numpy and pyarrow objects
+    if isinstance(nbytes, int):
+        return n + nbytes
+    if depth <= 0 or isinstance(obj, (str, bytes, bytearray, array, int, float)):
+        return n
+
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+        items = obj
+    elif hasattr(obj, '__dict__'):
+        items = vars(obj).values()
+        n += sys.getsizeof(vars(obj))
+    else:
+        return n
+
+    if not items:
+        return n
+    if len(items) <= nsamples:
+        sample = list(items)
+    elif isinstance(items, (list, tuple)):
+        sample = items[::len(items)//nsamples]
+    else:
+        sample = list(itertools.islice(items, nsamples))
+    return n + sum(estimateBytes(x, nsamples, depth-1) for x in sample)*len(items)//len(sample)
+
+
+def undoBytes(undofunc, args, kwargs):
+    'Return bytes in memory of the UndoData kept by an undo function.'
+    objs = list(args) + list(kwargs.values()) + list(getattr(undofunc, '__dict__', {}).values())
+    objs += [cell.cell_contents for cell in getattr(undofunc, '__closure__', None) or []]
+    return sum(x.nbytes for x in objs if isinstance(x, UndoData) and x.data is not None)
+
+
+@BaseSheet.api
+def memoryUsage(vs):
+    'Return dict of estimated bytes used by the rows, column caches and undo data of *vs*.'
+    rows = getattr(vs, 'rows', None)
+    store = getattr(vs, 'columnStore', None)
+    caches = [getattr(c, '_cachedValues', None) for c in getattr(vs, 'columns', [])]
+    return dict(
+        rows=(estimateBytes(rows) if isinstance(rows, (list, tuple)) else sys.getsizeof(rows)) + (estimateBytes(store) if store is not None else 0),
+        caches=sum(getattr(c, 'nbytes', 0) for c in caches if c is not None),
+        undo=sum(undoBytes(*undo) for r in vs.cmdlog_sheet.rows for undo in (r.undofuncs or [])),
+    )
+
+
+class SheetMemory:
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.__dict__.update({k: v/2**20 for k, v in sheet.memoryUsage().items()})
+        self.total = self.rows+self.caches+self.undo
+        self.threads = len(sheet.currentThreads)
+
+
+class MemorySheet(Sheet):
+    'Estimated memory used by each sheet, by its rows, column caches and undo data; biggest first.'
+    rowtype = 'sheets'  # rowdef: SheetMemory
+    precious = False
+    columns = [
+        ColumnAttr('sheet'),
+        ColumnAttr('rows_mb', 'rows', type=float),
+        ColumnAttr('caches_mb', 'caches', type=float),
+        ColumnAttr('undo_mb', 'undo', type=float),
+        ColumnAttr('total_mb', 'total', type=float),
+        ColumnAttr('threads', type=int),
+    ]
+    nKeys = 1
+
+    def reload(self):
+        self.rows = sorted((SheetMemory(vs) for vs in vd.sheets if vs is not self), key=lambda r: -r.total)
+        mon = vd.memoryMonitor
+        mon.sample()
+        if mon.rssMB is not None:
+            vd.status('%s MB resident; %s/%s MB available' % (mon.rssMB, mon.availMB, mon.totalMB))
+
+    def openRow(self, row):
+        return row.sheet
+
+
 # for progress bar
 BaseSheet.init('progresses', list)  # list of Progress objects
 
@@ -396,11 +551,15 @@ BaseSheet.addCommand('^C', 'cancel-sheet', 'cancelThread(*sheet.currentThreads o
 BaseSheet.addCommand('g^C', 'cancel-all', 'liveThreads=list(t for vs in vd.sheets for t in vs.currentThreads); cancelThread(*liveThreads); status("canceled %s threads" % len(liveThreads))', 'abort all spawned threads')
 
 
+MemorySheet.addCommand('^C', 'cancel-sheet', 'cancelThread(*cursorRow.sheet.currentThreads or fail("no active threads on this sheet"))', 'abort all threads on sheet at current row')
+
+BaseSheet.addCommand('', 'open-memory', 'vd.push(MemorySheet("memory"))', 'open Memory Sheet: estimated memory used by each sheet, by rows, column caches and undo data')
 BaseSheet.addCommand('^T', 'threads-all', 'vd.push(ThreadsSheet("threads", source=vd.threads))', 'open Threads for all sheets')
 BaseSheet.addCommand('z^T', 'threads-sheet', 'vd.push(ThreadsSheet("threads", source=sheet.currentThreads))', 'open Threads for this sheet')
 
 vd.addGlobals({
     'ThreadsSheet': ThreadsSheet,
+    'MemorySheet': MemorySheet,
     'Progress': Progress,
     'asynccache': asynccache,
     'asyncsingle': asyncsingle,
@@ -1,4 +1,9 @@
+import collections
 import itertools
+import tempfile
+import threading
+import weakref
+from array import array
 from copy import copy
 
 from visidata import vd, options, VisiData, BaseSheet, UNLOADED
@@ -6,6 +11,7 @@ from visidata import vd, options, VisiData, BaseSheet, UNLOADED
 BaseSheet.init('undone', list)  # list of CommandLogRow for redo after undo
 
 vd.option('undo', True, 'enable undo/redo')
+vd.option('undo_max_mb', 512, 'max approximate memory in MB for undo data; beyond this, the oldest is moved to a temporary file, or dropped if it cannot be (0 for no limit)')
 
 nonUndo = '''commit open-file reload-sheet'''.split()
 
@@ -17,7 +23,7 @@ def isUndoableCommand(longname):
 
 @VisiData.api
 def addUndo(vd, undofunc, *args, **kwargs):
-    'On undo of latest command, call ``undofunc(*args, **kwargs)``.'
+    'On undo of latest command, call ``undofunc(*args, **kwargs)``.  Return True if the undo was added.'
     if options.undo:
         # occurs when VisiData is just starting up
         if getattr(vd, 'activeCommand', UNLOADED) is UNLOADED:
@@ -29,6 +35,7 @@ def addUndo(vd, undofunc, *args, **kwargs):
         if not r.undofuncs:
             r.undofuncs = []
         r.undofuncs.append((undofunc, args, kwargs))
+        return True
 
 
 @VisiData.api
@@ -60,6 +67,116 @@ def redo(vd, sheet):
     vd.replayOne(cmdlogrow)
     vd.status("%s redone" % cmdlogrow.longname)
 
+class UndoData:
+    'Data kept to undo a command, counted against ``options.undo_max_mb`` by *store*.  Arrays of ints can be moved to disk.'
+    def __init__(self, store, data, nbytes):
+        self.store = store
+        self.data = data
+        self.nbytes = nbytes
+        self.spilled = None  # (offset, typecode, length) in store.spillfile
+        self.dropped = False
+
+    @property
+    def spillable(self):
+        return isinstance(self.data, array)
+
+    def get(self):
+        'Return the data, reading it back from disk if it was moved there.'
+        if self.dropped:
+            vd.fail('undo data was dropped to stay within options.undo_max_mb')
+        if self.data is None:
+            self.data = self.store.read(*self.spilled)
+        return self.data
+
+
+class UndoStore:
+    'Memory accounting for all UndoData.  When over ``options.undo_max_mb``, the oldest is spilled to a temporary file if an array, otherwise dropped.'
+    def __init__(self):
+        self.entries = collections.OrderedDict()  # id(UndoData) -> weakref(UndoData), oldest first
+        self.nbytes = 0
+        self.spillfile = None
+        self.nspilled = 0
+        self.ndropped = 0
+        self.lock = threading.RLock()  # reentrant, for finalizers of UndoData that run release() while add() holds it
+
+    def add(self, data, nbytes=None):
+        'Return UndoData for *data* (array of ints, or other object of approximately *nbytes*).'
+        if nbytes is None:
+            nbytes = data.itemsize*len(data)
+        ud = UndoData(self, data, nbytes)
+        with self.lock:
+            self.entries[id(ud)] = weakref.ref(ud)
+            self.nbytes += nbytes
+            weakref.finalize(ud, self.release, id(ud), nbytes)
+            self.shrink()
+        return ud
+
+    def release(self, udid, nbytes):
+        with self.lock:
+            if self.entries.pop(udid, None) is not None:
+                self.nbytes -= nbytes
+
+    def shrink(self):
+        maxbytes = options.undo_max_mb*2**20
+        while maxbytes and self.nbytes > maxbytes and self.entries:
+            udid, ref = self.entries.popitem(last=False)
+            ud = ref()
+            if ud is None:
+                continue
+            self.nbytes -= ud.nbytes
+            if not (ud.spillable and self.spill(ud)):
+                ud.data = None
+                ud.dropped = True
+                self.ndropped += 1
+
+    def spill(self, ud):
+        'Move array data of *ud* to the spill file.  Return True if successful.'
+        try:
+            if self.spillfile is None:
+                self.spillfile = tempfile.TemporaryFile(prefix='vd-undo-')
+            self.spillfile.seek(0, 2)
+            ud.spilled = (self.spillfile.tell(), ud.data.typecode, len(ud.data))
+            ud.data.tofile(self.spillfile)
+            ud.data = None
+            self.nspilled += 1
+            return True
+        except OSError as e:
+            vd.exceptionCaught(e, status=False)
+            return False
+
+    def read(self, offset, typecode, n):
+        with self.lock:
+            self.spillfile.seek(offset)
+            a = array(typecode)
+            a.fromfile(self.spillfile, n)
+            return a
+
+
+@VisiData.lazy_property
+def undoStore(vd):
+    return UndoStore()
+
+
+class UndoPermutation:
+    'Undo function to put the rows of *sheet* back in their order before ``permuted(order)`` was called for them.'
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.order = None  # UndoData of the former index of each row, in the new order
+
+    def permuted(self, order):
+        self.order = vd.undoStore.add(array('I' if len(order) < 2**32 else 'L', order))
+
+    def __call__(self):
+        if self.order is None:  # rows were never reordered
+            return
+        order = self.order.get()
+        rows = self.sheet.rows
+        oldrows = [None]*len(order)
+        for row, i in zip(rows, order):
+            oldrows[i] = row
+        rows[:] = oldrows
+
+
 # undoers
 def undoAttrFunc(objs, attrname):
     'Return closure that sets attrname on each obj to its former value.'
@@ -96,10 +213,15 @@ def undoAttrCopyFunc(objs, attrname):
 @VisiData.api
 def addUndoSetValues(vd, cols, rows):
     'Add undo function to reset values for *rows* in *cols*.'
-    oldvals = [(c, r, c.getValue(r)) for c,r in itertools.product(cols, vd.Progress(rows, gerund='doing'))]
+    rows = list(rows)
+    oldvals = [[c.getValue(r) for r in vd.Progress(rows, gerund='doing')] for c in cols]
+    data = vd.undoStore.add((rows, oldvals), nbytes=8*len(rows)*(len(cols)+1))
     def _undo():
-        for c, r, v in oldvals:
-            c.setValue(r, v)
+        rows, oldvals = data.get()
+        for c, vals in zip(cols, oldvals):
+            with c.sheet.batchCellChanges():
+                for r, v in zip(rows, vals):
+                    c.setValue(r, v)
     vd.addUndo(_undo)
 
 @VisiData.api